@@ -1,22 +1,15 @@
 import streamlit as st
-import google.generativeai as genai
-from io import BytesIO
-import re
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.ns import qn
-
-# --- Google Drive 相關套件 ---
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-
-# 嘗試匯入 PDF 讀取套件
-try:
-    from pypdf import PdfReader
-except ImportError:
-    import PyPDF2 as PdfReader
+import json
+import uuid
+import logging
+
+from review_pipeline import ReviewConfig, ReviewPipeline, batch_summary_rows, batch_report_files
+from batch_review import build_batch_zip
+from job_runner import JobRunner, JobStore, QUEUED, RUNNING, DONE
+from artifact_store import ArtifactStore, ArtifactQuotaError
+from quota_governor import admission
+
+logger = logging.getLogger(__name__)
 
 # --- 0. 全局設定與 CSS 美化 ---
 st.set_page_config(
@@ -125,192 +118,30 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --- 1. Google Drive API 模組 ---
+# --- 1. 審題流程 (共用設定與快取，全程序一份) ---
 @st.cache_resource
-def init_drive_service():
-    try:
-        service_account_info = st.secrets["gcp_service_account"]
-        creds = service_account.Credentials.from_service_account_info(
-            service_account_info, scopes=['https://www.googleapis.com/auth/drive.readonly'])
-        return build('drive', 'v3', credentials=creds)
-    except: return None
-
-def get_drive_files(folder_id):
-    service = init_drive_service()
-    if not service: return []
-    try:
-        query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
-        results = service.files().list(q=query, pageSize=100, fields="nextPageToken, files(id, name)").execute()
-        return results.get('files', [])
-    except: return []
-
-def download_drive_file(file_id):
-    service = init_drive_service()
-    if not service: return None
-    try:
-        request = service.files().get_media(fileId=file_id)
-        file_io = BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        done = False
-        while done is False: status, done = downloader.next_chunk()
-        file_io.seek(0)
-        return file_io
-    except: return None
-
-# --- 2. Word 生成引擎 ---
-def parse_markdown_to_word(doc, text):
-    lines = text.split('\n')
-    table_buffer = []
-    
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-        
-        if line.startswith('|'):
-            table_buffer.append(line)
-            continue
-        else:
-            if table_buffer:
-                create_word_table(doc, table_buffer)
-                table_buffer = [] 
-
-        if line.startswith('### '):
-            doc.add_heading(line.replace('### ', ''), level=2)
-        elif line.startswith('## '):
-            doc.add_heading(line.replace('## ', ''), level=1)
-        elif line.startswith('#### '):
-            p = doc.add_paragraph()
-            run = p.add_run(line.replace('#### ', ''))
-            run.bold = True
-            run.font.size = Pt(12)
-        else:
-            p = doc.add_paragraph()
-            clean_line = line
-            
-            if line.startswith('* ') or line.startswith('- '):
-                clean_line = line[2:].strip()
-                if re.match(r'^(\*\*)?(問題|建議|現狀|分析|依據|結論|優點)', clean_line):
-                    pass 
-                else:
-                    p.style = 'List Bullet'
-            
-            parts = re.split(r'(\*\*.*?\*\*)', clean_line)
-            for part in parts:
-                if part.startswith('**') and part.endswith('**'):
-                    run = p.add_run(part[2:-2])
-                    run.bold = True
-                else:
-                    p.add_run(part)
+def get_pipeline():
+    return ReviewPipeline(ReviewConfig.from_mapping(st.secrets))
 
-    if table_buffer:
-        create_word_table(doc, table_buffer)
+# 背景工作執行緒池 (審題不隨 rerun / 斷線中止)
+@st.cache_resource
+def get_job_runner():
+    return JobRunner(JobStore(st.secrets.get("JOB_DIR")),
+                     max_workers=int(st.secrets.get("JOB_WORKERS", 2)),
+                     retention_hours=float(st.secrets.get("JOB_RETENTION_HOURS", 72)))
 
-def create_word_table(doc, markdown_lines):
-    try:
-        rows = [line for line in markdown_lines if '---' not in line]
-        if not rows: return
+# 上傳檔暫存區 (session_state 只保留檔案路徑，每個工作階段有容量上限)
+@st.cache_resource
+def get_artifact_store():
+    return ArtifactStore(st.secrets.get("ARTIFACT_DIR"),
+                         session_quota_bytes=int(st.secrets.get("ARTIFACT_SESSION_MB", 200)) * 1024 * 1024,
+                         ttl=float(st.secrets.get("ARTIFACT_TTL_HOURS", 6)) * 3600)
 
-        header_line = rows[0].strip().strip('|')
-        headers = [h.strip() for h in header_line.split('|')]
-        col_count = len(headers)
-        
-        table = doc.add_table(rows=1, cols=col_count)
-        table.style = 'Table Grid'
-        
-        hdr_cells = table.rows[0].cells
-        for i, header_text in enumerate(headers):
-            if i < len(hdr_cells):
-                hdr_cells[i].text = header_text
-                for paragraph in hdr_cells[i].paragraphs:
-                    for run in paragraph.runs:
-                        run.bold = True
-
-        for line in rows[1:]:
-            clean_line = line.strip().strip('|')
-            cells_data = clean_line.split('|')
-            
-            row_cells = table.add_row().cells
-            for i, cell_text in enumerate(cells_data):
-                if i < col_count and i < len(row_cells):
-                    final_text = cell_text.strip().replace('**', '')
-                    row_cells[i].text = final_text
-                    
-    except Exception as e:
-        doc.add_paragraph(f"[表格轉換異常]")
-
-def generate_word_report_doc(text, exam_meta):
-    doc = Document()
-    try:
-        doc.styles['Normal'].font.name = 'Microsoft JhengHei'
-        doc.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), 'Microsoft JhengHei')
-    except: pass
-    
-    heading = doc.add_heading('北屯區建功國小 智慧審題報告', 0)
-    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    p_info = doc.add_paragraph()
-    p_info.add_run(f"試卷資訊：{exam_meta['info_str']}\n").bold = True
-    p_info.add_run(f"審查日期：{exam_meta['date_str']}\n")
-    p_info.add_run(f"AI 模型：Gemini 3.0 Pro\n")
-    p_info.add_run("-" * 30)
-    
-    table = doc.add_table(rows=1, cols=2)
-    table.autofit = True
-    c1 = table.cell(0, 0)
-    c1.text = "命題教師："
-    c2 = table.cell(0, 1)
-    c2.text = "審題教師："
-    
-    doc.add_paragraph("\n") 
-    parse_markdown_to_word(doc, text)
-    bio = BytesIO()
-    doc.save(bio)
-    return bio
-
-# --- 3. 強化版試卷資訊擷取 (自動偵測) ---
-def extract_exam_meta_enhanced(text):
-    import datetime
-    today = datetime.date.today().strftime("%Y/%m/%d")
-    
-    meta = {
-        "year": "113學年度", "semester": "下學期", "exam_name": "定期評量",
-        "grade": "未偵測", "subject": "未偵測", "date_str": today
-    }
-    
-    sample = text[:1000] 
-    m_year = re.search(r'(\d{3})\s*學年度', sample)
-    if m_year: meta['year'] = f"{m_year.group(1)}學年度"
-    m_sem = re.search(r'(上|下)\s*學期', sample)
-    if m_sem: meta['semester'] = f"{m_sem.group(1)}學期"
-    
-    # 偵測年級 (擴充關鍵字)
-    m_grade = re.search(r'([一二三四五六])\s*年級', sample)
-    if m_grade: meta['grade'] = f"{m_grade.group(1)}年級"
-    
-    # 偵測科目
-    subjects = ["國語", "數學", "英語", "英文", "自然", "社會", "生活"]
-    for sub in subjects:
-        if sub in sample:
-            meta['subject'] = sub
-            break
-            
-    m_exam = re.search(r'(期中|期末|第[一二三]次|定期)評量', sample)
-    if m_exam: meta['exam_name'] = m_exam.group(0)
-    elif "期末" in sample: meta['exam_name'] = "期末評量"
-    elif "期中" in sample: meta['exam_name'] = "期中評量"
-    
-    meta['info_str'] = f"{meta['year']} {meta['semester']} {meta['grade']} {meta['subject']} {meta['exam_name']}"
-    return meta
+def _session_id():
+    if 'session_id' not in st.session_state: st.session_state['session_id'] = uuid.uuid4().hex
+    return st.session_state['session_id']
 
-def extract_pdf_text(file):
-    try:
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages: text += page.extract_text() + "\n"
-        return text
-    except: return ""
-
-# --- 4. 登入頁 ---
+# --- 2. 登入頁 ---
 if 'logged_in' not in st.session_state: st.session_state['logged_in'] = False
 
 def login_page():
@@ -336,24 +167,54 @@ def login_page():
             
             password = st.text_input("請輸入校內授權密碼", type="password", placeholder="請輸入校內授權密碼", label_visibility="collapsed")
             if st.button("同意聲明並登入"):
-                if password == st.secrets.get("LOGIN_PASSWORD", "school123"):
+                admin_password = st.secrets.get("ADMIN_PASSWORD")
+                if admin_password and password == admin_password:
+                    st.session_state['logged_in'] = True
+                    st.session_state['is_admin'] = True
+                    st.rerun()
+                elif password == st.secrets.get("LOGIN_PASSWORD", "school123"):
                     st.session_state['logged_in'] = True
+                    st.session_state['is_admin'] = False
                     st.rerun()
                 else:
                     st.error("❌ 密碼錯誤")
             st.markdown("</div>", unsafe_allow_html=True)
 
-# --- 5. 主程式 ---
+# --- 3. 主程式 ---
 def main_app():
-    if 'ai_report' not in st.session_state: st.session_state['ai_report'] = None
-    if 'word_file' not in st.session_state: st.session_state['word_file'] = None
-    if 'exam_meta' not in st.session_state: st.session_state['exam_meta'] = None
+    # 結果只記工作代號；報告與 Word/zip 檔留在工作資料夾，顯示時才讀取
+    if 'result_job' not in st.session_state: st.session_state['result_job'] = None
 
     # --- 側邊欄設定區 ---
+    with st.sidebar:
+        st.markdown("<div class='sidebar-header'>🧭 審題模式</div>", unsafe_allow_html=True)
+        modes = ["單份審題", "批次審題"]
+        if st.session_state.get('is_admin'): modes.append("系統監控")
+        mode = st.radio("審題模式", modes, horizontal=True, label_visibility="collapsed")
+        batch_mode = mode == "批次審題"
+
+    if mode == "系統監控":
+        with st.sidebar:
+            if st.button("登出系統"):
+                st.session_state['logged_in'] = False
+                st.session_state['is_admin'] = False
+                st.rerun()
+        admin_metrics_page()
+        return
+
     with st.sidebar:
         # 1. 試卷上傳
         st.markdown("<div class='sidebar-header'>📂 試卷上傳</div>", unsafe_allow_html=True)
-        uploaded_exam = st.file_uploader("選擇試卷 PDF", type=['pdf'], key="exam", label_visibility="collapsed")
+        exam_drive_folder = ""
+        if batch_mode:
+            uploaded_exam = st.file_uploader("選擇多份試卷 PDF", type=['pdf'], key="exam_batch", accept_multiple_files=True, label_visibility="collapsed")
+            exam_drive_folder = st.text_input("或輸入雲端試卷資料夾 ID", placeholder="Google Drive 資料夾 ID (選填)")
+        else:
+            uploaded_exam = st.file_uploader("選擇試卷 PDF", type=['pdf'], key="exam", label_visibility="collapsed")
+            if uploaded_exam:
+                # 只解析前兩頁，上傳後立即顯示偵測到的試卷資訊
+                try: st.caption(f"🔎 偵測：{get_pipeline().peek_exam_meta(uploaded_exam)['info_str']}")
+                except Exception: pass
         
         # 2. 課本習作上傳 (新增功能)
         st.markdown("<div class='sidebar-header'>📘 課本、習作上傳 (可多選)</div>", unsafe_allow_html=True)
@@ -366,219 +227,279 @@ def main_app():
         # 啟動按鈕
         st.markdown("<br>", unsafe_allow_html=True)
         start_btn = st.button("🚀 AI 教授審題", type="primary", use_container_width=True)
+        force_refresh = st.checkbox("🔁 強制重新審題 (不使用快取與上一版結果)", value=False)
+
+        # 最近的審題工作：只列出本工作階段送出的工作 (管理員可看全部)；其他工作階段的工作需輸入工作編號開啟
+        with st.expander("🗂️ 最近的審題工作"):
+            runner = get_job_runner()
+            owner = None if st.session_state.get('is_admin') else _session_id()
+            for job in runner.store.recent(8, owner=owner):
+                icon = {QUEUED: "⏳", RUNNING: "🔄", DONE: "✅"}.get(job['status'], "❌")
+                if st.button(f"{icon} {job['title']}", key=f"job_{job['id']}", use_container_width=True):
+                    _attach_job(job['id'])
+            lookup = st.text_input("工作編號", placeholder="輸入工作編號開啟", key="job_lookup", label_visibility="collapsed")
+            if st.button("🔎 開啟工作", use_container_width=True) and lookup.strip():
+                if runner.get(lookup.strip()): _attach_job(lookup.strip())
+                else: st.warning("⚠️ 找不到這個工作編號")
         
         if st.button("登出系統"):
             st.session_state['logged_in'] = False
+            st.session_state['is_admin'] = False
             st.rerun()
 
     # --- 主畫面 ---
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown("<h1>🏫 台中市北屯區建功國小智慧審題系統</h1>", unsafe_allow_html=True)
 
-    # 執行邏輯
-    if start_btn:
+    # 執行邏輯 (送出背景工作，網頁重整後可由網址列的 job 參數重新接上)
+    if start_btn and batch_mode:
+        if not uploaded_exam and not exam_drive_folder.strip():
+            st.warning("⚠️ 請先在左側上傳試卷 PDF 或輸入雲端試卷資料夾")
+        else:
+            try:
+                _attach_job(process_batch_logic(
+                    uploaded_exam, exam_drive_folder.strip(), uploaded_refs, "嚴格", exam_scope, force_refresh=force_refresh
+                ))
+            except ArtifactQuotaError as e:
+                st.error(f"⚠️ {e}")
+    elif start_btn:
         if not uploaded_exam:
             st.warning("⚠️ 請先在左側上傳試卷 PDF")
         else:
             # 審查程度強制設為 "嚴格"
             strictness = "嚴格"
-            report, word_data, meta = process_review_logic(
-                uploaded_exam, uploaded_refs, strictness, exam_scope
-            )
-            st.session_state['ai_report'] = report
-            st.session_state['word_file'] = word_data
-            st.session_state['exam_meta'] = meta
+            try:
+                _attach_job(process_review_logic(
+                    uploaded_exam, uploaded_refs, strictness, exam_scope, force_refresh=force_refresh
+                ))
+            except ArtifactQuotaError as e:
+                st.error(f"⚠️ {e}")
+
+    job_id = st.query_params.get("job")
+    if job_id and st.session_state.get('loaded_job') != job_id:
+        render_job_panel(job_id)
 
     # 結果顯示區
-    if st.session_state['ai_report']:
+    meta, files = get_job_runner().store.result_files(st.session_state['result_job']) \
+        if st.session_state['result_job'] else (None, {})
+    if meta and "ai_report" in meta:
         st.markdown("---")
         st.subheader("📊 審題報告預覽")
-        st.download_button(
-            label="📥 下載 Word 報告 (.docx)",
-            data=st.session_state['word_file'],
-            file_name=f"{st.session_state['exam_meta']['grade']}{st.session_state['exam_meta']['subject']}_審題報告.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            type="primary"
-        )
-        st.info(st.session_state['ai_report'])
+        exam_meta = meta['exam_meta']
+        if exam_meta.get('cached_at'):
+            st.caption(f"♻️ 快取結果 (原審查時間 {exam_meta['cached_at']})，如需重新審題請勾選左側「強制重新審題」")
+        elif exam_meta.get('revision'):
+            r = exam_meta['revision']
+            st.caption(f"🔁 修訂版 (第 {r['version']} 版)：只重審修改 / 新增的 {r['reviewed']} 題，"
+                       f"其餘 {r['reused']} 題沿用第 {r['previous']} 版結果；如需整份重審請勾選左側「強制重新審題」")
+        elif exam_meta.get('ttft') is not None:
+            st.caption(f"⚡ 首段回應 {exam_meta['ttft']:.1f} 秒｜完整生成 {exam_meta['gen_seconds']:.1f} 秒")
+        if "docx" in files:
+            st.download_button(
+                label="📥 下載 Word 報告 (.docx)",
+                data=_read_file(files["docx"]),
+                file_name=f"{exam_meta['grade']}{exam_meta['subject']}_審題報告.docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                type="primary"
+            )
+        if "json" in files:
+            st.download_button(
+                label="🧾 下載逐題審查結果 (.json)",
+                data=_read_file(files["json"]),
+                file_name=f"{exam_meta['grade']}{exam_meta['subject']}_審題結果.json",
+                mime="application/json"
+            )
+        st.info(meta['ai_report'])
+
+    # 批次結果
+    if meta and "summary" in meta:
+        st.markdown("---")
+        st.subheader("🗂️ 批次審題總表")
+        st.dataframe(meta['summary'], use_container_width=True, hide_index=True)
+        if "zip" in files:
+            st.download_button(
+                label="📦 下載全部 Word 報告 (.zip)",
+                data=_read_file(files["zip"]),
+                file_name="批次審題報告.zip",
+                mime="application/zip",
+                type="primary"
+            )
+
+# --- 管理者：審題效能與用量 ---
+def admin_metrics_page():
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown("<h1>📈 系統監控</h1>", unsafe_allow_html=True)
+    log = get_pipeline().metrics()
+    if not log:
+        st.warning("⚠️ 無法開啟效能紀錄資料庫")
+        return
+    days = st.select_slider("統計期間 (天)", options=[1, 7, 30, 90], value=7)
+
+    st.subheader("⏱️ 各階段耗時")
+    stages = log.stage_percentiles(days)
+    if stages: st.dataframe(stages, use_container_width=True, hide_index=True)
+    else: st.info("尚無審題紀錄")
+
+    st.subheader("🪙 每日 token 用量")
+    usage = log.daily_usage(days)
+    if usage:
+        st.bar_chart(usage, x="日期", y=["輸入 tokens", "輸出 tokens"])
+        price_in = st.secrets.get("PRICE_INPUT_PER_M")
+        price_out = st.secrets.get("PRICE_OUTPUT_PER_M")
+        if price_in is not None and price_out is not None:
+            for row in usage:
+                row["估計費用 (USD)"] = round(row["輸入 tokens"] / 1e6 * float(price_in)
+                                          + row["輸出 tokens"] / 1e6 * float(price_out), 4)
+        st.dataframe(usage, use_container_width=True, hide_index=True)
+
+    st.subheader("🏫 全校常見問題")
+    findings = log.finding_summary(days)
+    if findings: st.dataframe(findings, use_container_width=True, hide_index=True)
+    else: st.info("尚無結構化審題紀錄 (啟用 STRUCTURED_OUTPUT 後開始統計)")
+
+    st.subheader("🧾 最近審題紀錄")
+    st.dataframe(log.recent(50), use_container_width=True, hide_index=True)
+
+# --- 背景工作：送出、輪詢、載入結果 ---
+def _attach_job(job_id):
+    st.query_params["job"] = job_id
+    st.session_state['loaded_job'] = None
+
+def _load_job_result(job):
+    st.session_state['result_job'] = job['id']
+    st.session_state['loaded_job'] = job['id']
+
+def _read_file(path):
+    with open(path, "rb") as f: return f.read()
+
+def _queue_notice(ctx):
+    # Gemini 額度排隊中：在狀態框顯示排隊位置與預估等待時間 (放行後清除)
+    def on_wait(ahead, eta):
+        ctx.notice(f"🚦 同時審題的人數較多，排隊等待 Gemini 額度：前面還有 {ahead} 個請求，預計約 {eta:.0f} 秒後開始"
+                   if ahead or eta >= 1 else None)
+    return on_wait
+
+def _store_uploads(files):
+    # 上傳檔在 rerun 後會失效：先串流存入暫存區，背景工作只拿到檔案路徑
+    artifacts = get_artifact_store()
+    stored = []
+    try:
+        for f in files or []: stored.append(artifacts.put_upload(_session_id(), f))
+    except ArtifactQuotaError:
+        artifacts.discard(stored)
+        raise
+    return stored
+
+def render_job_panel(job_id):
+    runner = get_job_runner()
+
+    @st.fragment(run_every=2)
+    def panel():
+        job = runner.get(job_id)
+        if not job:
+            st.warning("⚠️ 找不到這筆審題工作 (可能已逾期清除)")
+            return
+        if job['status'] == DONE:
+            _load_job_result(job)
+            st.rerun()
+        if job['status'] in (QUEUED, RUNNING):
+            label = "⏳ 排隊等待中..." if job['status'] == QUEUED else "🔍 AI 教授正在審題中..."
+            state = "running"
+        else:
+            label, state = "❌ 發生錯誤", "error"
+        with st.status(f"{label}　{job['title']}", expanded=True, state=state):
+            for entry in job['log']:
+                if entry['level'] == "warning": st.warning(entry['message'])
+                elif entry['level'] == "error": st.error(entry['message'])
+                else: st.write(entry['message'])
+            notice = runner.notice(job_id) if state == "running" else None
+            if notice: st.info(notice)
+        if state == "running":
+            st.caption(f"💡 審題在伺服器背景執行，可以關閉或重新整理網頁，稍後在左側「最近的審題工作」輸入工作編號 `{job_id}` 開啟。")
+            partial = runner.partial(job_id)
+            if partial: st.info(partial + " ▌")
+        else:
+            st.error(f"錯誤：{job['error']}")
+
+    panel()
 
 # --- 核心邏輯 (V12.1 嚴格Prompt修正版) ---
-def process_review_logic(exam_file, local_ref_files, strictness, exam_scope):
-    with st.container():
-        status = st.status("🔍 AI 教授正在審題中...", expanded=True)
+def process_review_logic(exam_file, local_ref_files, strictness, exam_scope, force_refresh=False):
+    exam, = _store_uploads([exam_file])
+    try: refs = _store_uploads(local_ref_files)
+    except ArtifactQuotaError:
+        get_artifact_store().discard([exam])
+        raise
+    pipeline = get_pipeline()
+    session = _session_id()
+
+    def job(ctx):
         try:
-            status.write("📄 讀取並分析試卷內容...")
-            exam_text = extract_pdf_text(exam_file)
-            
-            # 自動偵測試卷資訊
-            exam_meta = extract_exam_meta_enhanced(exam_text)
-            status.write(f"✅ 試卷識別：{exam_meta['info_str']}")
-            
-            ref_text = ""
-            ref_source_list = []
-            scenario_msg = ""
-            ref_block = ""
-
-            # --- 核心判斷邏輯 ---
-            if local_ref_files:
-                # 情境 A：使用者有上傳課本/習作
-                status.write(f"📘 使用者已上傳 {len(local_ref_files)} 份教材，以使用者檔案為準。")
-                for f in local_ref_files: 
-                    ref_text += extract_pdf_text(f) + "\n"
-                    ref_source_list.append(f"上傳：{f.name}")
-                
-                ref_block = f"【比對基準 (使用者上傳)】：\n{ref_text[:60000]}\n"
-                scenario_msg = "請以【比對基準】為絕對標準，檢查試卷是否超綱。"
-                
-            else:
-                # 情境 B：無上傳，啟動自動撈取機制 (只搜科目)
-                detected_grade = exam_meta.get('grade', '')
-                detected_subject = exam_meta.get('subject', '')
-                
-                if "未偵測" in detected_grade or "未偵測" in detected_subject:
-                    status.warning("⚠️ 無法自動識別年級或科目，將改用通用課綱標準審查。")
-                    ref_block = "【比對基準】：未找到特定教材，請依據台灣教育部 108 課綱標準審查。\n"
-                    scenario_msg = "請依據台灣教育部 108 課綱之該年級/科目標準進行審查。"
-                else:
-                    status.write(f"☁️ 啟動雲端比對：正在搜尋【{detected_subject}】領域課綱...")
-                    
-                    # 搜尋 Google Drive (只搜科目)
-                    drive_files = []
-                    folder_id = st.secrets.get("google_drive_folder_id")
-                    if folder_id:
-                        all_files = get_drive_files(folder_id)
-                        # 邏輯修正 V12：只比對「科目」
-                        matched_files = [f for f in all_files if detected_subject in f['name']]
-                        
-                        if matched_files:
-                            status.write(f"✅ 找到 {len(matched_files)} 份【{detected_subject}】領域檔案，正在提取【{detected_grade}】內容...")
-                            for f in matched_files:
-                                f_stream = download_drive_file(f['id'])
-                                if f_stream:
-                                    ref_text += extract_pdf_text(f_stream) + "\n"
-                                    ref_source_list.append(f"雲端：{f['name']}")
-                            
-                            ref_block = f"【比對基準 (雲端資料庫)】：\n{ref_text[:60000]}\n"
-                            # 關鍵 Prompt 修正：命令 AI 在檔案中找特定年級
-                            scenario_msg = f"請務必先閱讀【比對基準】檔案，並在其中搜尋對應【{detected_grade}】的「學習表現」與「學習內容」，以此為絕對標準檢查試卷。"
-                        else:
-                            status.warning(f"📭 資料庫中未找到 {detected_subject} 的檔案，改用通用標準。")
-                            ref_block = "【比對基準】：未提供 (資料庫無對應檔)\n"
-                            scenario_msg = f"請依據台灣教育部 108 課綱之【{detected_grade}】【{detected_subject}】標準進行審查。"
-
-            api_key = st.secrets["GEMINI_API_KEY"]
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("models/gemini-3-pro-preview")
-            
-            status.write("🧠 Gemini 3.0 Pro 正在進行深度比對...")
-            
-            # --- V12.1 嚴格格式化 Prompt ---
-            prompt = f"""
-# Role: 台灣國小教育評量暨素養導向命題專家
-
-# 角色定義
-你是一位精通「台灣教育部 108 課綱」與各版本教科書的資深教材審題專家。你的任務是審查使用者上傳的試卷，確保其符合教學進度、邏輯嚴謹，且具備真實的素養評量功能。
-
-## 1. 任務目標
-針對上傳的試卷進行專業審題，產出一份符合 Markdown 格式的審查報告。
-**試卷資訊：** {exam_meta['info_str']}
-**考試範圍：** {exam_scope if exam_scope else "未指定"}
-**審查嚴格度：** {strictness}
-
-## 2. 審查基準 (Ground Truth)
-{scenario_msg}
-
-## 3. 輸出規範 (Strict Output Rules)
-你必須嚴格遵守以下輸出規則，否則任務失敗：
-1. **例外報告 (Exception Reporting)**：在 Step 1 和 Step 2，**僅列出有問題** (❌超綱、⚠️疑義) 的題目。
-   - ⛔ **若該大項無任何問題，請直接輸出單行文字：「✅ 本大項全數通過，無異常試題。」**
-   - ⛔ **嚴禁**在無問題時繪製空表格或列出「通過」的題目。
-2. **格式要求**：
-   - 表格優先，檢核結果請務必使用 **Markdown Table** 呈現。
-   - 必須使用 Markdown 語法。
-   - 不要使用 Code Block (```) 包覆報告。
-   - 標題層級清楚 (###)。
-   - 視覺標示：使用 ✅、⚠️、❌ 進行視覺引導。
-
-## 4. 審查流程 (Analysis Workflow)
-請依序填寫以下報告內容：
-
-### Step 1: 【命題範圍與合規性檢核】 (Scope & Compliance)
-**[資料來源判定邏輯]**
-請依照以下**優先順序**決定審查基準：
-1.  **優先 (User Upload)**：若 `[使用者上傳教材]` 區塊有內容，以此為「唯一真理」進行比對。
-2.  **次要 (Database Fallback)**：若使用者未上傳，讀取 `[資料庫課綱基準]` 區塊。
-    * **解析與比對**：確認題目是否符合該年級/科目的「學習內容」與「學習表現」。
-
-**[檢核重點]**
-* **超綱判斷**：題目概念是否超出上述基準？
-* **課綱對應**：題目是否符合該領域的學習表現。
-* **輸出內容**：僅列出違規題目。若全數符合，請依「例外報告」規則處理。
-
-### Step 2: 【題幹與邏輯品質審查】 (Logic & Quality)
-* **邏輯封閉性**：單選題是否僅有唯一正解？選項間是否互斥？
-* **語意清晰度**：是否存在雙重否定、語意歧義或條件不足。
-* **誘答項檢核**：錯誤選項是否具備合理的誘答力。
-* **輸出內容**：僅列出有瑕疵題目。若全數符合，請依「例外報告」規則處理。
-
-### Step 3: 【素養導向深度審查】
-請依據科目類別，執行「真偽素養」辨識（生活課程請依內容屬性併入自然或社會判斷）：
-
-* **國語文**：
-    * ✅ **真素養**：需運用預測、推論、摘要策略；含連續/非連續文本。
-    * ⚠️ **假素養**：僅圈錯字或直接摘錄句子，未涉及層次思考。
-* **數學**：
-    * ✅ **真素養**：具備「數學建模」過程；情境數據符合現實邏輯。
-    * ⚠️ **假素養**：情境與算式無關（裝飾性）；數據違背常理。
-* **自然科學** (含生活-觀察體驗)：
-    * ✅ **真素養**：評量觀察、假設、實驗設計或數據解釋。
-    * ⚠️ **假素養**：答案可直接從文中複製，無需先備知識。
-* **社會** (含生活-人際環境)：
-    * ✅ **真素養**：評量多重觀點、史料判讀或社會參與。
-    * ⚠️ **假素養**：僅考碎片化記憶，缺乏因果分析。
-* **英語文**：
-    * ✅ **真素養**：符合真實語用 (Pragmatics)，模擬真實溝通。
-    * ⚠️ **假素養**：對話生硬，僅為考文法規則而堆砌。
-
-* **輸出內容**：列出具代表性的「✅ 真素養題」與「⚠️ 假素養題」並給予簡評。
-
-### Step 4: 【雙向細目表核算】
-請務必繪製 Markdown 表格：
-| 單元名稱 | 記憶 | 了解 | 應用 | 分析 | 評鑑 | 創造 |
-|---|---|---|---|---|---|---|
-| (填入) | (填題號) | ... | ... | ... | ... | ... |
-| **分數比重** | % | % | % | % | % | % |
-*(注意：分數比重加總須為 100%)*
-
-### Step 5: 【難易度與負擔分析】
-* **無效難度檢查**：標註「計算過度繁瑣」但觀念簡單的題目。
-* **成績分佈預測**：依據題目難度 (L1易/L2中/L3難) 預測三種分數區間的學生表現。
-
-### Step 6: 【總結與建議】
-* 針對紅色警示 (❌) 的題目提出具體修改建議。
-* 給予命題教師 3-5 點總體優化建議。
-
----
-{ref_block}
-
----
-【試卷原始內容】：
-{exam_text[:25000]}
-"""
-            response = model.generate_content(prompt)
-            ai_report = response.text
-            
-            status.write("📝 正在製作 Word 報告...")
-            word_file = generate_word_report_doc(ai_report, exam_meta)
-            
-            status.update(label="✅ 分析完成！", state="complete", expanded=False)
-            
-            return ai_report, word_file.getvalue(), exam_meta
-            
-        except Exception as e:
-            status.update(label="❌ 發生錯誤", state="error")
-            st.error(f"錯誤：{e}")
-            return None, None, None
+            with admission(session, on_wait=_queue_notice(ctx)): return review(ctx)
+        finally: get_artifact_store().discard([exam] + refs)
+
+    def review(ctx):
+        first_shown = []
+        def on_text(partial, ttft):
+            if not first_shown:
+                ctx.progress(f"⚡ 首段回應：{ttft:.1f} 秒，報告即時顯示於下方...")
+                first_shown.append(True)
+            ctx.on_text(partial, ttft)
+
+        result = pipeline.review(exam, refs, strictness, exam_scope, force_refresh=force_refresh,
+                                 progress=ctx.progress, on_text=on_text)
+        ctx.progress("✅ 分析完成！(使用快取結果)" if result.cached else "✅ 分析完成！")
+        files = {"docx": result.word_bytes}
+        if result.data: files["json"] = json.dumps(result.data.to_dict(), ensure_ascii=False, indent=2).encode("utf-8")
+        return {"ai_report": result.ai_report, "exam_meta": result.exam_meta}, files
+
+    return get_job_runner().submit("single", exam.name, job, owner=session)
+
+# --- 批次審題 (多份試卷並行，受 API 額度限制而非人工操作) ---
+def _load_batch_exams(pipeline, exam_files, exam_drive_folder, progress):
+    exams = []
+    if exam_files:
+        texts = pipeline.load_local_files(
+            exam_files, progress=lambda done, total, f: progress(f"　📄 ({done}/{total}) 已讀取試卷：{f.name}"))
+        exams += [(f.name, t or "") for f, t in zip(exam_files, texts)]
+    if exam_drive_folder:
+        files = pipeline.list_drive_exams(exam_drive_folder)
+        texts = pipeline.load_drive_files(
+            files, progress=lambda done, total, f: progress(f"　☁️ ({done}/{total}) 已載入試卷：{f['name']}"))
+        exams += [(f['name'], t or "") for f, t in zip(files, texts)]
+    return exams
+
+def process_batch_logic(exam_files, exam_drive_folder, local_ref_files, strictness, exam_scope, force_refresh=False):
+    exams_in = _store_uploads(exam_files)
+    try: refs = _store_uploads(local_ref_files)
+    except ArtifactQuotaError:
+        get_artifact_store().discard(exams_in)
+        raise
+    pipeline = get_pipeline()
+    session = _session_id()
+
+    def job(ctx):
+        try:
+            with admission(session, on_wait=_queue_notice(ctx)): return review(ctx)
+        finally: get_artifact_store().discard(exams_in + refs)
+
+    def review(ctx):
+        ctx.progress("📄 讀取並分析所有試卷...")
+        exams = _load_batch_exams(pipeline, exams_in, exam_drive_folder, ctx.progress)
+        if not exams: raise ValueError("沒有可審查的試卷")
+
+        items = pipeline.review_batch(exams, refs, strictness, exam_scope,
+                                      force_refresh=force_refresh, progress=ctx.progress)
+
+        ctx.progress("📝 正在打包 Word 報告...")
+        summary = batch_summary_rows(items)
+        zip_bytes = build_batch_zip(batch_report_files(items), summary)
+        ok = sum(1 for item in items if item["word"])
+        ctx.progress(f"✅ 批次審題完成：{ok}/{len(items)} 份")
+        return {"summary": summary}, {"zip": zip_bytes}
+
+    title = f"批次審題 ({len(exams_in)} 份)" if exams_in else "批次審題 (雲端資料夾)"
+    return get_job_runner().submit("batch", title, job, owner=session)
 
 if __name__ == "__main__":
     if st.session_state['logged_in']: main_app()
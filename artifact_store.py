@@ -0,0 +1,89 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+
+# --- 工作階段暫存檔 (上傳的試卷 / 教材) ---
+# 上傳檔一收到就以串流複製到暫存資料夾，session_state 與背景工作只保留檔案路徑 (StoredFile)，
+# 不在記憶體中保留整份 PDF。每個工作階段有容量上限，逾時未使用的工作階段資料夾自動清除。
+
+DEFAULT_ARTIFACT_ROOT = os.path.join(tempfile.gettempdir(), "exam_review_artifacts")
+COPY_CHUNK = 1024 * 1024
+
+
+class ArtifactQuotaError(ValueError):
+    pass
+
+
+class StoredFile:
+    # 與 Streamlit UploadedFile / LocalFile 相同介面 (name / getvalue)，另提供 path 供串流或 mmap 讀取
+    def __init__(self, name, path, size):
+        self.name = name
+        self.path = path
+        self.size = size
+
+    def getvalue(self):
+        with open(self.path, "rb") as f: return f.read()
+
+    def open(self):
+        return open(self.path, "rb")
+
+
+class ArtifactStore:
+    def __init__(self, root=None, session_quota_bytes=200 * 1024 * 1024, ttl=6 * 3600):
+        self.root = root or DEFAULT_ARTIFACT_ROOT
+        self.quota = session_quota_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _session_dir(self, session_id):
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_-]', '_', session_id))
+
+    def session_bytes(self, session_id):
+        d = self._session_dir(session_id)
+        try: return sum(e.stat().st_size for e in os.scandir(d) if e.is_file())
+        except OSError: return 0
+
+    def put_stream(self, session_id, name, stream, size=None):
+        # stream：可 read() 的檔案物件 (UploadedFile 等)；分段複製，不先讀成一整塊 bytes
+        self.purge_expired()
+        with self._lock:
+            used = self.session_bytes(session_id)
+            if size is not None and used + size > self.quota:
+                raise ArtifactQuotaError(f"上傳檔案總量超過每位使用者上限 ({self.quota // (1024 * 1024)} MB)")
+            d = self._session_dir(session_id)
+            os.makedirs(d, exist_ok=True)
+            path = os.path.join(d, uuid.uuid4().hex)
+            if hasattr(stream, "seek"): stream.seek(0)
+            with open(path, "wb") as f: shutil.copyfileobj(stream, f, COPY_CHUNK)
+            written = os.path.getsize(path)
+            if used + written > self.quota:
+                os.remove(path)
+                raise ArtifactQuotaError(f"上傳檔案總量超過每位使用者上限 ({self.quota // (1024 * 1024)} MB)")
+            os.utime(d)
+            return StoredFile(name, path, written)
+
+    def put_upload(self, session_id, uploaded):
+        return self.put_stream(session_id, uploaded.name, uploaded, getattr(uploaded, "size", None))
+
+    def discard(self, files):
+        for f in files:
+            try: os.remove(f.path)
+            except OSError: pass
+
+    def purge_expired(self, force=False):
+        # 最多每分鐘檢查一次；以工作階段資料夾的修改時間判斷是否逾時
+        now = time.time()
+        if not force and now - self._last_purge < 60: return
+        self._last_purge = now
+        try: entries = list(os.scandir(self.root))
+        except OSError: return
+        for e in entries:
+            try:
+                if e.is_dir() and now - e.stat().st_mtime > self.ttl: shutil.rmtree(e.path, ignore_errors=True)
+            except OSError: pass
@@ -0,0 +1,89 @@
+import io
+import csv
+import time
+import random
+import asyncio
+import zipfile
+
+# --- 批次審題：並行上限 + 額度感知退避的非同步排程 ---
+# 同時送出的 Gemini 請求數受 concurrency 限制；遇到 429/503 等額度或暫時性錯誤時，
+# 依伺服器建議或指數退避 (含抖動) 重試，並讓所有工作一起暫停，避免同時撞牆。
+
+_RETRYABLE_NAMES = ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                    "DeadlineExceeded", "InternalServerError")
+
+
+def is_retryable_error(exc):
+    if type(exc).__name__ in _RETRYABLE_NAMES: return True
+    code = getattr(exc, "code", None)
+    if code in (429, 500, 503, 504): return True
+    msg = str(exc)
+    return "429" in msg or "quota" in msg.lower() or "rate limit" in msg.lower()
+
+
+def suggested_delay(exc):
+    # google.api_core 例外會附帶 retry_delay (RetryInfo)
+    delay = getattr(exc, "retry_delay", None)
+    if delay is None: return None
+    return getattr(delay, "total_seconds", lambda: delay)()
+
+
+class BatchResult:
+    def __init__(self):
+        self.text = None
+        self.error = None
+        self.attempts = 0
+        self.seconds = 0.0
+
+
+async def _run_one(i, prompt, generate, sem, pause, result, max_retries, base_delay, max_delay, on_event):
+    start = time.perf_counter()
+    for attempt in range(1, max_retries + 2):
+        # 額度錯誤後所有工作共用同一個暫停期限，期限前不送出新請求
+        while (wait := pause["until"] - time.monotonic()) > 0: await asyncio.sleep(wait)
+        async with sem:
+            result.attempts = attempt
+            try:
+                result.text = await generate(prompt)
+                result.error = None
+                break
+            except Exception as e:
+                result.error = e
+                if attempt > max_retries or not is_retryable_error(e): break
+                delay = suggested_delay(e) or min(max_delay, base_delay * 2 ** (attempt - 1))
+                delay *= random.uniform(0.8, 1.2)
+        if on_event: on_event("retry", i, result, delay)
+        pause["until"] = max(pause["until"], time.monotonic() + delay)
+    result.seconds = time.perf_counter() - start
+    if on_event: on_event("done", i, result, None)
+
+
+async def run_generation_batch_async(prompts, generate, concurrency=4, max_retries=5,
+                                     base_delay=2.0, max_delay=60.0, on_event=None):
+    # generate: async callable(prompt) -> str
+    sem = asyncio.Semaphore(concurrency)
+    pause = {"until": 0.0}
+    results = [BatchResult() for _ in prompts]
+    await asyncio.gather(*[
+        _run_one(i, p, generate, sem, pause, results[i], max_retries, base_delay, max_delay, on_event)
+        for i, p in enumerate(prompts)])
+    return results
+
+
+def run_generation_batch(prompts, generate, **kwargs):
+    # on_event 在同一執行緒的事件迴圈中觸發，可直接更新 st.status
+    return asyncio.run(run_generation_batch_async(prompts, generate, **kwargs))
+
+
+def build_batch_zip(reports, summary_rows):
+    # reports: [(檔名, docx bytes)]；summary_rows: [dict]，另存一份 CSV 總表 (Excel 可直接開啟)
+    bio = io.BytesIO()
+    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in reports: zf.writestr(name, data)
+        if summary_rows:
+            sio = io.StringIO()
+            writer = csv.DictWriter(sio, fieldnames=list(summary_rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(summary_rows)
+            zf.writestr("審題總表.csv", sio.getvalue().encode("utf-8-sig"))
+    return bio.getvalue()
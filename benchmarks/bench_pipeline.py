@@ -0,0 +1,230 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.synthetic import (synthetic_exam_text, synthetic_textbook_text, synthetic_report, synthetic_review_json,
+                                  synthetic_pdf_pages, make_cjk_pdf)
+from drive_fake import FakeDriveService
+from gemini_fake import FakeGeminiBackend
+from gemini_client import GeminiClient
+from pdf_extract import extract_pdf_text, reset_cpu_pool
+from exam_meta import extract_exam_meta_enhanced
+from review_pipeline import ReviewConfig, ReviewPipeline, BytesFile
+from word_report import generate_word_report_doc
+from review_schema import parse_review_json, normalize_questions, report_blocks
+from text_normalize import normalize_pages
+from curriculum_store import CurriculumStore, ingest_drive_folder
+
+# --- 審題流程離線效能量測 (假 Drive / 假 Gemini + 合成中文 PDF，不需網路) ---
+# 用法：python -m benchmarks.bench_pipeline [--exam-sections 4 --questions 10 --textbooks 3 --textbook-pages 40]
+#                                          [--out 結果.json] [--compare 基準.json --threshold 20]
+# 結果為 JSON (各階段毫秒中位數等)，可存檔後與其他 commit 的結果比較。
+
+FOLDER_ID = "bench-folder"
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _stats(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {"median_ms": round(statistics.median(ms), 2), "min_ms": round(ms[0], 2),
+            "max_ms": round(ms[-1], 2), "runs": len(ms)}
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.root = tempfile.mkdtemp(prefix="exam_review_bench_")
+        subject, grade = args.subject, args.grade
+        self.exam_text = synthetic_exam_text(args.exam_sections, args.questions, grade, subject)
+        self.exam_pdf = make_cjk_pdf(self.exam_text)
+        self.drive = FakeDriveService(latency=args.drive_latency, bytes_per_second=args.drive_bandwidth)
+        for i in range(args.textbooks):
+            text = synthetic_textbook_text(args.textbook_pages, grade, seed=i)
+            self.drive.add_file(FOLDER_ID, f"{subject}_{grade}_課本_{i + 1}.pdf", make_cjk_pdf(text))
+        self.backend = FakeGeminiBackend(reply=lambda prompt: synthetic_report(prompt, rows=args.report_rows),
+                                         base_latency=args.model_latency,
+                                         seconds_per_1k_input=args.model_seconds_per_1k)
+        self._n = 0
+
+    def pipeline(self):
+        # 每次使用全新的快取目錄 (冷啟動)；同一個 pipeline 重複呼叫即為熱快取
+        self._n += 1
+        d = os.path.join(self.root, str(self._n))
+        config = ReviewConfig(gemini_api_key="bench", drive_folder_id=FOLDER_ID, stream=False,
+                              ref_cache_dir=f"{d}/ref", result_cache_dir=f"{d}/result",
+                              drive_index_dir=f"{d}/index", metrics_db=f"{d}/metrics.sqlite3",
+                              curriculum_db=f"{d}/curriculum.sqlite3", revision_db=f"{d}/revisions.sqlite3")
+        gemini = GeminiClient("bench", config.model_name, backend=self.backend)
+        return ReviewPipeline(config, gemini=gemini, drive_service=self.drive)
+
+    def timed(self, fn, repeat):
+        samples, result = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            samples.append(time.perf_counter() - start)
+        return _stats(samples), result
+
+    def run(self):
+        r = self.args.repeat
+        results = {}
+        results["extract_pdf_text"], exam_text = self.timed(lambda: extract_pdf_text(self.exam_pdf), r)
+        results["extract_exam_meta"], meta = self.timed(lambda: extract_exam_meta_enhanced(exam_text), r)
+
+        # 文字正規化：每頁含頁首頁尾的整本課本 / 試卷
+        book_pages = synthetic_pdf_pages(synthetic_textbook_text(self.args.textbook_pages, self.args.grade))
+        results["normalize_textbook"], book = self.timed(lambda: normalize_pages(book_pages), r)
+        exam_norm = normalize_pages(synthetic_pdf_pages(self.exam_text))
+
+        cold, warm = [], []
+        for _ in range(r):
+            p = self.pipeline()
+            start = time.perf_counter()
+            plan = p.resolve_reference_plan([], meta)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            plan = p.resolve_reference_plan([], meta)
+            warm.append(time.perf_counter() - start)
+        results["reference_resolution_cold"] = _stats(cold)
+        results["reference_resolution_warm"] = _stats(warm)
+
+        # 課綱資料庫：離線匯入一次，之後只查本機條目 (不下載)
+        cp = self.pipeline()
+        store = CurriculumStore(cp.config.curriculum_db)
+        results["curriculum_ingest"], _ = self.timed(
+            lambda: ingest_drive_folder(store, cp, FOLDER_ID, rebuild=True, progress=lambda m: None), 1)
+        results["reference_resolution_curriculum"], _ = self.timed(lambda: cp.resolve_reference_plan([], meta), r)
+
+        def build_prompt():
+            ref_block, scenario = p.build_reference_block(plan, exam_text, "", meta)
+            return p.plan_generation(meta, "", "嚴格", scenario, ref_block, exam_text)
+        results["prompt_construction"], gen_plan = self.timed(build_prompt, r)
+        results["generation"], (report, _, _) = self.timed(lambda: p.generate_report(gen_plan), r)
+        results["generate_word_report_doc"], _ = self.timed(lambda: generate_word_report_doc(report, meta), r)
+
+        # 結構化輸出：JSON → 報告區塊 → Word (不解析 Markdown)
+        reply = synthetic_review_json(gen_plan["score_block"], rows=self.args.report_rows)
+
+        def structured_report():
+            data = normalize_questions(parse_review_json(reply), gen_plan["exam"])
+            return generate_word_report_doc("", meta, report_blocks(data, gen_plan["exam"]))
+        results["structured_word_report"], _ = self.timed(structured_report, r)
+
+        exam = BytesFile("exam.pdf", self.exam_pdf)
+        e2e_cold = []
+        for _ in range(r):
+            fresh = self.pipeline()
+            start = time.perf_counter()
+            fresh.review(exam, [], force_refresh=True)
+            e2e_cold.append(time.perf_counter() - start)
+        results["end_to_end_cold"] = _stats(e2e_cold)
+        results["end_to_end_warm"], _ = self.timed(lambda: fresh.review(exam, [], force_refresh=True), r)
+        results["end_to_end_result_cache"], _ = self.timed(lambda: fresh.review(exam, []), r)
+
+        # 修訂版：改動一題後重新上傳，只重審該題 (每次從完整審查過的新 pipeline 開始)
+        lines = self.exam_text.split("\n")
+        target = next(i for i, l in enumerate(lines) if re.match(r'^(?:\(  \) )?3\.', l))
+        lines[target] += "（修訂）"
+        revised = BytesFile("exam_v2.pdf", make_cjk_pdf("\n".join(lines)))
+        revision, full_tokens, revision_tokens = [], [], []
+        for _ in range(r):
+            rp = self.pipeline()
+            before = self.backend.input_tokens()
+            rp.review(exam, [])
+            middle = self.backend.input_tokens()
+            start = time.perf_counter()
+            rp.review(revised, [])
+            revision.append(time.perf_counter() - start)
+            full_tokens.append(middle - before)
+            revision_tokens.append(self.backend.input_tokens() - middle)
+        results["end_to_end_revision"] = _stats(revision)
+
+        counters = {"exam_chars": len(exam_text), "exam_pages": self.exam_pdf.count(b"/Type /Page "),
+                    "textbook_bytes": sum(len(e["data"]) for e in self.drive.entries.values()),
+                    "report_chars": len(report), "structured_reply_chars": len(reply),
+                    "model_calls": len(self.backend.calls),
+                    "model_input_tokens": self.backend.input_tokens(),
+                    "drive_downloads": self.drive.downloads, "drive_list_calls": self.drive.list_calls,
+                    "textbook_normalize_saved_tokens": book.tokens_saved,
+                    "textbook_normalize_saved_bytes": book.bytes_saved,
+                    "exam_normalize_saved_tokens": exam_norm.tokens_saved,
+                    "full_review_input_tokens": statistics.median(full_tokens),
+                    "revision_input_tokens": statistics.median(revision_tokens)}
+        return results, counters
+
+    def close(self):
+        reset_cpu_pool()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def compare(current, baseline, threshold):
+    # 回傳變慢超過 threshold% 的階段
+    regressions = []
+    print(f"{'階段':<28} {'基準 (ms)':>12} {'目前 (ms)':>12} {'變化':>8}", file=sys.stderr)
+    for stage, cur in current["results"].items():
+        base = baseline.get("results", {}).get(stage)
+        if not base:
+            continue
+        delta = (cur["median_ms"] - base["median_ms"]) / base["median_ms"] * 100 if base["median_ms"] else 0.0
+        flag = " ⚠️" if delta > threshold else ""
+        print(f"{stage:<28} {base['median_ms']:>12.1f} {cur['median_ms']:>12.1f} {delta:>+7.1f}%{flag}", file=sys.stderr)
+        if delta > threshold: regressions.append(stage)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_pipeline", description="審題流程離線效能量測")
+    parser.add_argument("--exam-sections", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=10, help="每個大題的題數")
+    parser.add_argument("--textbooks", type=int, default=3)
+    parser.add_argument("--textbook-pages", type=int, default=40)
+    parser.add_argument("--subject", default="數學")
+    parser.add_argument("--grade", default="五年級")
+    parser.add_argument("--report-rows", type=int, default=40, help="假模型回覆的表格列數 (控制輸出量)")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="假模型每次呼叫的固定延遲 (秒)")
+    parser.add_argument("--model-seconds-per-1k", type=float, default=0.0, help="假模型每 1k 未快取輸入 token 的延遲")
+    parser.add_argument("--drive-latency", type=float, default=0.01, help="假 Drive 每次請求延遲 (秒)")
+    parser.add_argument("--drive-bandwidth", type=float, default=None, help="假 Drive 下載頻寬 (bytes/秒)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="結果 JSON 輸出路徑 (預設印到 stdout)")
+    parser.add_argument("--compare", help="基準結果 JSON，比較各階段中位數")
+    parser.add_argument("--threshold", type=float, default=20.0, help="變慢超過此百分比即回傳非 0")
+    args = parser.parse_args(argv)
+
+    bench = Bench(args)
+    try: results, counters = bench.run()
+    finally: bench.close()
+
+    report = {"commit": _git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "cpu_count": os.cpu_count(),
+              "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "threshold")},
+              "results": results, "counters": counters}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f: baseline = json.load(f)
+        if compare(report, baseline, args.threshold): return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
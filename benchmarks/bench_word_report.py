@@ -0,0 +1,59 @@
+import time
+import random
+import argparse
+import statistics
+
+from word_report import generate_word_report_doc, generate_word_report_doc_legacy
+
+# --- Word 報告生成效能比較：逐段 python-docx (舊) vs 區塊解析 + 整批 XML (新) ---
+# 用法：python -m benchmarks.bench_word_report [--sections 6] [--rows 40 120 400] [--repeat 5]
+
+META = {"info_str": "113學年度 下學期 五年級 國語 定期評量", "date_str": "2026/01/01"}
+WORDS = ["學習表現", "學習內容", "超綱", "閱讀理解", "推論", "摘要", "情境", "數學建模", "誘答力", "語意"]
+
+
+def synthetic_report(sections=6, rows=40, seed=0):
+    rnd = random.Random(seed)
+    phrase = lambda n: "".join(rnd.choice(WORDS) for _ in range(n))
+    out = []
+    for s in range(1, sections + 1):
+        out.append(f"### Step {s}: 【{phrase(2)}】")
+        out.append(f"本大項說明：{phrase(6)}，**{phrase(2)}** 需注意。")
+        out.append("| 題號 | 問題類型 | 說明 | 建議修改 |")
+        out.append("|---|---|---|---|")
+        for r in range(1, rows + 1):
+            out.append(f"| {r} | ❌ **{phrase(1)}** | {phrase(5)} | {phrase(4)}<br>{phrase(2)} |")
+        for _ in range(5):
+            out.append(f"- {phrase(3)}：**{phrase(1)}**")
+            out.append(f"  - {phrase(4)}")
+        out.append(f"#### 小結：{phrase(3)}")
+    return "\n".join(out)
+
+
+def _time(fn, text, repeat):
+    fn(text, META)  # 暖機 (樣板載入、模組匯入)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, META)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_word_report")
+    parser.add_argument("--sections", type=int, default=6)
+    parser.add_argument("--rows", type=int, nargs="+", default=[40, 120, 400], help="每個表格的列數")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'表格列數':>8} {'報告字數':>10} {'舊版 (秒)':>10} {'新版 (秒)':>10} {'加速':>7}")
+    for rows in args.rows:
+        text = synthetic_report(args.sections, rows)
+        legacy = _time(generate_word_report_doc_legacy, text, args.repeat)
+        fast = _time(generate_word_report_doc, text, args.repeat)
+        print(f"{rows:>10} {len(text):>12,} {legacy:>12.3f} {fast:>12.3f} {legacy / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import random
+
+# --- 效能量測用的合成資料：中文試卷 / 課本 PDF 與假審題報告 ---
+# PDF 使用 Identity-H 編碼 + ToUnicode 對照表，pypdf 能擷取出原本的中文字；不需字型檔。
+
+VOCAB = ["學生", "老師", "公園", "蘋果", "火車", "分數", "小數", "面積", "周長", "體積", "速率", "比例",
+         "植物", "動物", "天氣", "地圖", "社區", "文化", "閱讀", "文章", "句子", "成語", "觀察", "實驗",
+         "推論", "摘要", "測量", "計算", "估算", "規律", "資料", "圖表", "時間", "距離", "重量", "容量"]
+SECTIONS = [("選擇題", 2), ("填充題", 3), ("計算題", 5), ("應用題", 6), ("閱讀測驗", 4), ("是非題", 1)]
+CN = "一二三四五六七八九十"
+LINE_CHARS = 42
+LINES_PER_PAGE = 58
+
+
+def _sentence(rnd, words):
+    return "".join(rnd.choice(VOCAB) for _ in range(words))
+
+
+def synthetic_exam_text(sections=4, questions=10, grade="五年級", subject="數學", seed=0):
+    rnd = random.Random(seed)
+    lines = [f"臺中市北屯區建功國小 113學年度 下學期 {grade} {subject} 定期評量", "班級：　　 座號：　　 姓名："]
+    for s in range(sections):
+        name, points = SECTIONS[s % len(SECTIONS)]
+        lines.append(f"{CN[s % 10]}、{name}（每題{points}分，共{points * questions}分）")
+        for q in range(1, questions + 1):
+            prefix = "(  ) " if name in ("選擇題", "是非題") else ""
+            lines.append(f"{prefix}{q}. {_sentence(rnd, 8)}，請問{_sentence(rnd, 3)}？")
+            for _ in range(rnd.randint(0, 2)): lines.append(_sentence(rnd, 12))
+    return "\n".join(lines)
+
+
+def synthetic_textbook_text(pages=40, grade="五年級", seed=1):
+    rnd = random.Random(seed)
+    lines = []
+    for p in range(pages):
+        if p % 8 == 0:
+            unit = p // 8 + 1
+            lines += [f"第{unit}單元 {_sentence(rnd, 2)}", f"學習表現 n-III-{unit} {grade} {_sentence(rnd, 6)}",
+                      f"學習內容 N-5-{unit} {_sentence(rnd, 6)}"]
+        lines += [_sentence(rnd, LINE_CHARS // 2) for _ in range(LINES_PER_PAGE - 3)]
+    return "\n".join(lines)
+
+
+def _wrap(text):
+    out = []
+    for line in text.split("\n"):
+        out += [line[i:i + LINE_CHARS] for i in range(0, max(len(line), 1), LINE_CHARS)]
+    return out
+
+
+def synthetic_pdf_pages(text, header="臺中市北屯區建功國小 113學年度 五年級"):
+    # 模擬 pypdf 逐頁擷取的結果：每頁重複的頁首、班級 / 座號 / 姓名欄與頁碼
+    lines = _wrap(text)
+    return ["\n".join([header, "班級：＿＿＿＿＿　座號：＿＿＿　姓名：＿＿＿＿＿＿＿＿", *lines[i:i + LINES_PER_PAGE],
+                       f"－ {n} －"]) for n, i in enumerate(range(0, len(lines), LINES_PER_PAGE), 1)]
+
+
+def make_cjk_pdf(text):
+    lines = _wrap(text)
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    # ToUnicode 只列出實際用到的字 (完整 65536 字對照表會讓 pypdf 每頁重建一次，擷取極慢)
+    chars = sorted({ord(c) for l in lines for c in l if ord(c) < 0x10000})
+    pairs = [f"<{c:04X}> <{c:04X}>" for c in chars]
+    blocks = "".join(f"{len(pairs[i:i + 100])} beginbfchar\n" + "\n".join(pairs[i:i + 100]) + "\nendbfchar\n"
+                     for i in range(0, len(pairs), 100))
+    cmap = ("/CIDInit /ProcSet findresource begin 12 dict begin begincmap "
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def "
+            "/CMapName /Adobe-Identity-UCS def /CMapType 2 def 1 begincodespacerange <0000> <FFFF> endcodespacerange\n"
+            f"{blocks}endcmap CMapName currentdict /CMap defineresource pop end end")
+    objs = {1: "<< /Type /Catalog /Pages 2 0 R >>",
+            3: "<< /Type /Font /Subtype /Type0 /BaseFont /MingLiU /Encoding /Identity-H "
+               "/DescendantFonts [4 0 R] /ToUnicode 5 0 R >>",
+            4: "<< /Type /Font /Subtype /CIDFontType2 /BaseFont /MingLiU /CIDSystemInfo << /Registry (Adobe) "
+               "/Ordering (Identity) /Supplement 0 >> /FontDescriptor 6 0 R /DW 1000 >>",
+            5: f"<< /Length {len(cmap)} >>\nstream\n{cmap}\nendstream",
+            6: "<< /Type /FontDescriptor /FontName /MingLiU /Flags 4 /FontBBox [0 -200 1000 900] "
+               "/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 700 /StemV 80 >>"}
+    kids, n = [], 7
+    for page in pages:
+        shows = " T* ".join(f"<{''.join(f'{ord(c):04X}' for c in l if ord(c) < 0x10000)}> Tj" for l in page)
+        content = f"BT /F1 10 Tf 13 TL 36 800 Td {shows} ET"
+        objs[n] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {n + 1} 0 R "
+                   "/Resources << /Font << /F1 3 0 R >> >> >>")
+        objs[n + 1] = f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"
+        kids.append(f"{n} 0 R")
+        n += 2
+    objs[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), {}
+    for i in sorted(objs):
+        offsets[i] = len(out)
+        out += f"{i} 0 obj\n{objs[i]}\nendobj\n".encode("latin-1")
+    xref, size = len(out), max(objs) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offsets[i]:010d} 00000 n \n" for i in range(1, size)).encode()
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return bytes(out)
+
+
+def synthetic_report(prompt_text, rows=40, seed=2):
+    # 假模型回覆：六個步驟 + 依 Prompt 中的題目代號產生題目分類表
+    rnd = random.Random(seed)
+    ids = []
+    marker = "題目代號："
+    if marker in prompt_text:
+        ids = prompt_text.split(marker, 1)[1].split("\n", 1)[0].split("、")
+    levels = ["記憶", "了解", "應用", "分析"]
+    out = ["### Step 1: 【命題範圍與合規性檢核】", "| 題號 | 問題 | 說明 |", "|---|---|---|"]
+    out += [f"| {i} | ❌ **超綱** | {_sentence(rnd, 6)} |" for i in (ids or range(1, 100))[:rows // 4]]
+    out += ["### Step 2: 【題幹與邏輯品質審查】", "✅ 本大項全數通過，無異常試題。",
+            "### Step 3: 【素養導向深度審查】"] + [f"- {_sentence(rnd, 5)}：**{_sentence(rnd, 1)}**" for _ in range(8)]
+    out += ["### Step 4: 【雙向細目表核算】", "| 題號 | 單元名稱 | 認知層次 |", "|---|---|---|"]
+    out += [f"| {qid} | {rnd.choice(VOCAB)} | {rnd.choice(levels)} |" for qid in ids]
+    out += ["### Step 5: 【難易度與負擔分析】"] + [f"- {_sentence(rnd, 10)}" for _ in range(rows // 4)]
+    out += ["### Step 6: 【總結與建議】"] + [f"- {_sentence(rnd, 12)}" for _ in range(rows // 2)]
+    return "\n".join(out)
+
+
+def synthetic_review_json(prompt_text, rows=40, seed=2):
+    # 結構化輸出的假模型回覆 (內容與 synthetic_report 相當)
+    import json
+    rnd = random.Random(seed)
+    marker = "題目代號："
+    ids = prompt_text.split(marker, 1)[1].split("\n", 1)[0].split("、") if marker in prompt_text else []
+    levels = ["記憶", "了解", "應用", "分析"]
+    return json.dumps({
+        "issues": [{"question": i, "step": "scope", "type": "超綱", "severity": "error",
+                    "description": _sentence(rnd, 6), "suggestion": _sentence(rnd, 4)} for i in ids[:rows // 4]],
+        "literacy": [{"question": rnd.choice(ids), "verdict": rnd.choice(["authentic", "superficial"]),
+                      "comment": _sentence(rnd, 5)} for _ in range(8 if ids else 0)],
+        "classification": [{"question": q, "unit": rnd.choice(VOCAB), "level": rnd.choice(levels)} for q in ids],
+        "difficulty": [{"question": q, "level": "L3", "note": _sentence(rnd, 4)} for q in ids[:rows // 8]],
+        "distribution": _sentence(rnd, 10),
+        "suggestions": [_sentence(rnd, 12) for _ in range(5)],
+    }, ensure_ascii=False)
@@ -0,0 +1,233 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+
+from disk_cache import DEFAULT_CACHE_ROOT
+from drive_index import classify_file_name, list_folder_pdfs
+
+# --- 課綱資料庫：雲端課綱 PDF 預先切成「學習表現 / 學習內容」條目，存於本機 SQLite ---
+# 離線執行一次 python -m curriculum_store 下載並解析雲端資料夾 (之後只處理有變動的檔案)；
+# 審題時依偵測到的科目與年級直接查出該年級的條目，不需下載教材，Prompt 也只帶相關內容。
+# 用法：python -m curriculum_store [--folder 資料夾ID] [--rebuild] [--show 數學 五年級]
+
+PERFORMANCE = "學習表現"
+CONTENT = "學習內容"
+GRADES = "一二三四五六"
+_ROMAN = {"I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "Ⅰ": 1, "Ⅱ": 2, "Ⅲ": 3, "Ⅳ": 4, "Ⅴ": 5}
+_ROMAN_OUT = "ⅠⅡⅢⅣⅤ"
+_SUBJECT_ALIASES = {"英文": "英語"}
+# 學習表現：n-Ⅲ-1、1-Ⅱ-3、tr-Ⅲ-1、1a-Ⅲ-1；學習內容：N-5-1 (數學依年級)、Ab-Ⅲ-1、INa-Ⅲ-1
+_CODE = re.compile(r'(?<![A-Za-z0-9\-－])([1-9][a-z]?|[A-Za-z]{1,3})[\-－‐](III|II|IV|I|V|Ⅰ|Ⅱ|Ⅲ|Ⅳ|Ⅴ|[1-9])'
+                   r'[\-－‐](\d{1,2})(?![0-9])')
+_NOISE = re.compile(r'學習表現|學習內容|第[一二三四五]學習階段|[\s　]+')
+MAX_ENTRY_CHARS = 160
+MIN_ENTRY_CHARS = 4
+
+
+def canonical_subject(subject):
+    return _SUBJECT_ALIASES.get(subject, subject)
+
+
+def grade_number(grade):
+    # "五年級" → 5；無法辨識回傳 None
+    m = re.search(r'([一二三四五六1-6])\s*年級', grade or "")
+    if not m: return None
+    g = m.group(1)
+    return int(g) if g.isdigit() else GRADES.index(g) + 1
+
+
+def _parse_code(prefix, middle, num):
+    # 回傳 (正規化代碼, 類別, 學習階段, 年級)；不是國小課綱代碼則回傳 None
+    if middle.isdigit():
+        # 中間為數字只出現在依年級編碼的學習內容 (N-5-1)，排除 1-2-3 這類條列編號
+        if not prefix[0].isupper(): return None
+        grade = int(middle)
+        if grade > 6: return None
+        return f"{prefix}-{grade}-{int(num)}", CONTENT, (grade + 1) // 2, grade
+    stage = _ROMAN[middle]
+    if stage > 3: return None
+    kind = CONTENT if prefix[0].isupper() else PERFORMANCE
+    return f"{prefix}-{_ROMAN_OUT[stage - 1]}-{int(num)}", kind, stage, None
+
+
+def parse_curriculum_text(text):
+    # 依代碼位置切分：代碼到下一個代碼之間的文字即為該條目說明；同一代碼保留第一個有內容的說明
+    matches = list(_CODE.finditer(text or ""))
+    entries = {}
+    for i, m in enumerate(matches):
+        parsed = _parse_code(*m.groups())
+        if not parsed: continue
+        code, kind, stage, grade = parsed
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = _NOISE.sub(" ", text[m.end():end]).strip(" ：:，,、")
+        body = re.sub(r' (?=[^\x00-\x7f])|(?<=[^\x00-\x7f]) ', "", body)[:MAX_ENTRY_CHARS]
+        if len(body) < MIN_ENTRY_CHARS or code in entries: continue
+        entries[code] = {"code": code, "kind": kind, "stage": stage, "grade": grade, "text": body}
+    return list(entries.values())
+
+
+def _sort_key(entry):
+    prefix, _, num = entry["code"].rpartition("-")
+    return (entry["kind"] != PERFORMANCE, prefix.split("-")[0], entry["grade"] or 0, int(num))
+
+
+def format_entries(entries):
+    # 送進 Prompt 的比對基準文字 (依類別分組)
+    lines = []
+    for kind in (PERFORMANCE, CONTENT):
+        rows = [e for e in entries if e["kind"] == kind]
+        if not rows: continue
+        lines.append(f"【{kind}】")
+        lines += [f"{e['code']} {e['text']}" for e in rows]
+    return "\n".join(lines)
+
+
+def entries_fingerprint(entries):
+    digest = hashlib.sha256()
+    for e in entries: digest.update(f"{e['code']}\t{e['text']}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class CurriculumStore:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_ROOT, "curriculum.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                source TEXT, subject TEXT, kind TEXT, code TEXT, stage INTEGER, grade INTEGER, text TEXT,
+                PRIMARY KEY (source, code))""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_lookup ON entries(subject, stage)")
+            db.execute("""CREATE TABLE IF NOT EXISTS sources (
+                file_id TEXT PRIMARY KEY, name TEXT, version TEXT, subject TEXT, entries INTEGER, ingested REAL)""")
+
+    @classmethod
+    def open_existing(cls, path=None):
+        # 審題時使用：尚未建立資料庫就回傳 None (不在審題流程中建立空檔)
+        path = path or os.path.join(DEFAULT_CACHE_ROOT, "curriculum.sqlite3")
+        return cls(path) if os.path.exists(path) else None
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def lookup(self, subject, grade):
+        # 該科目、該年級的條目 (依學習階段的條目 + 依年級的條目)；多份來源重複的代碼只保留一筆
+        g = grade_number(grade)
+        if not g: return []
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT code, kind, stage, grade, text FROM entries "
+                "WHERE subject=? AND stage=? AND (grade IS NULL OR grade=?) ORDER BY source",
+                (canonical_subject(subject), (g + 1) // 2, g)).fetchall()
+        entries = {}
+        for code, kind, stage, grade_n, text in rows:
+            entries.setdefault(code, {"code": code, "kind": kind, "stage": stage, "grade": grade_n, "text": text})
+        return sorted(entries.values(), key=_sort_key)
+
+    def source_names(self, subject):
+        with self._connect() as db:
+            rows = db.execute("SELECT name FROM sources WHERE subject=? AND entries > 0 ORDER BY name",
+                              (canonical_subject(subject),)).fetchall()
+        return [name for (name,) in rows]
+
+    def source_versions(self):
+        with self._connect() as db:
+            return dict(db.execute("SELECT file_id, version FROM sources").fetchall())
+
+    def replace_source(self, file_id, name, version, subject, entries):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM entries WHERE source=?", (file_id,))
+            db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [(file_id, subject, e["kind"], e["code"], e["stage"], e["grade"], e["text"])
+                            for e in entries])
+            db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                       (file_id, name, version, subject, len(entries), time.time()))
+
+    def remove_sources(self, file_ids):
+        with self._lock, self._connect() as db:
+            for file_id in file_ids:
+                db.execute("DELETE FROM entries WHERE source=?", (file_id,))
+                db.execute("DELETE FROM sources WHERE file_id=?", (file_id,))
+
+    def summary(self):
+        with self._connect() as db:
+            return db.execute("SELECT subject, kind, COUNT(*) FROM entries GROUP BY subject, kind "
+                              "ORDER BY subject, kind").fetchall()
+
+
+# --- 離線匯入：只下載有變動的檔案；解析沿用 ReviewPipeline 的教材快取與平行擷取 ---
+def ingest_drive_folder(store, pipeline, folder_id, rebuild=False, progress=print):
+    from ref_cache import drive_version_key
+    service = pipeline.drive_service()
+    if service is None: raise RuntimeError("無法連線 Google Drive (請設定 gcp_service_account)")
+    files = list_folder_pdfs(service, folder_id)
+    known = store.source_versions()
+    removed = set(known) if rebuild else set(known) - {f["id"] for f in files}
+    store.remove_sources(removed)
+    if rebuild: known = {}
+
+    changed = [f for f in files if known.get(f["id"]) != drive_version_key(f)]
+    progress(f"☁️ 資料夾共 {len(files)} 份 PDF，需解析 {len(changed)} 份 (移除 {len(removed)} 份)")
+    texts = pipeline.load_drive_files(
+        changed, progress=lambda done, total, f: progress(f"　📄 ({done}/{total}) 已讀取：{f['name']}"))
+    failed = 0
+    for f, text in zip(changed, texts):
+        if text is None:
+            # 下載或解析失敗：保留舊條目與舊版本，下次增量更新會重試
+            failed += 1
+            progress(f"　❌ 讀取失敗，保留原有條目：{f['name']}")
+            continue
+        subjects = classify_file_name(f["name"])["subjects"]
+        subject = canonical_subject(subjects[0]) if subjects else ""
+        entries = parse_curriculum_text(text) if subject and text else []
+        store.replace_source(f["id"], f["name"], drive_version_key(f), subject, entries)
+        if not subject: progress(f"　⚠️ 檔名無法判斷科目，略過：{f['name']}")
+        elif entries: progress(f"　✅ {f['name']}：{subject} {len(entries)} 條")
+    return {"files": len(files), "parsed": len(changed) - failed, "failed": failed, "removed": len(removed)}
+
+
+def main(argv=None):
+    from review_cli import load_settings
+    from review_pipeline import ReviewConfig, ReviewPipeline
+
+    parser = argparse.ArgumentParser(prog="python -m curriculum_store", description="建立 / 更新本機課綱資料庫")
+    parser.add_argument("--folder", help="課綱資料夾 ID (預設 secrets 的 google_drive_folder_id)")
+    parser.add_argument("--db", help="資料庫路徑 (預設 CURRICULUM_DB 或快取資料夾)")
+    parser.add_argument("--rebuild", action="store_true", help="清空後重新解析全部檔案")
+    parser.add_argument("--show", nargs=2, metavar=("科目", "年級"), help="只查詢並印出條目，不連線 Drive")
+    parser.add_argument("--secrets", help="secrets.toml 路徑 (預設 .streamlit/secrets.toml)")
+    args = parser.parse_args(argv)
+
+    config = ReviewConfig.from_mapping(load_settings(args.secrets))
+    store = CurriculumStore(args.db or config.curriculum_db)
+    if args.show:
+        start = time.perf_counter()
+        entries = store.lookup(*args.show)
+        print(format_entries(entries))
+        print(f"\n{len(entries)} 條 ({(time.perf_counter() - start) * 1000:.1f} ms)", file=sys.stderr)
+        return 0 if entries else 1
+
+    folder_id = args.folder or config.drive_folder_id
+    if not folder_id: parser.error("找不到課綱資料夾 ID (--folder 或 google_drive_folder_id)")
+    stats = ingest_drive_folder(store, ReviewPipeline(config), folder_id, rebuild=args.rebuild,
+                                progress=lambda m: print(m, file=sys.stderr, flush=True))
+    for subject, kind, count in store.summary(): print(f"{subject or '(未分類)'}\t{kind}\t{count}")
+    print(f"完成：{stats['parsed']} 份解析、{stats['failed']} 份失敗、{stats['removed']} 份移除 → {store.path}",
+          file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# --- 本機磁碟快取 (LRU，容量上限) ---
+# 索引存在 SQLite，內容以檔案存放；可跨 Streamlit rerun 與程序重啟保留。
+
+DEFAULT_CACHE_ROOT = os.environ.get(
+    "REVIEW_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "exam_review"))
+
+
+class DiskLRUCache:
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, ttl=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "data"), exist_ok=True)
+        self._db_path = os.path.join(root, "index.sqlite3")
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, name TEXT, size INTEGER,
+                created REAL, atime REAL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_atime ON entries(atime)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def _path(self, name):
+        return os.path.join(self.root, "data", name[:2], name)
+
+    def get(self, key):
+        path = self.get_path(key)
+        if path is None: return None
+        try:
+            with open(path, "rb") as f: return f.read()
+        except OSError:
+            self.delete(key)
+            return None
+
+    def get_path(self, key):
+        # 只回傳內容檔路徑 (大型檔案可串流 / mmap 讀取，不整份讀進記憶體)
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT name, created FROM entries WHERE key=?", (key,)).fetchone()
+            if not row: return None
+            name, created = row
+            if self.ttl is not None and time.time() - created > self.ttl:
+                self._drop(db, key, name)
+                return None
+            if not os.path.exists(self._path(name)):
+                self._drop(db, key, name)
+                return None
+            db.execute("UPDATE entries SET atime=? WHERE key=?", (time.time(), key))
+            return self._path(name)
+
+    def put(self, key, data):
+        tmp = self.temp_path()
+        with open(tmp, "wb") as f: f.write(data)
+        return self.put_file(key, tmp)
+
+    def temp_path(self):
+        # 與快取同一檔案系統的暫存路徑 (寫完後以 put_file 搬入)
+        return os.path.join(self.root, "data", f"incoming.{os.getpid()}.{threading.get_ident()}.{time.time_ns()}.tmp")
+
+    def put_file(self, key, src_path):
+        # 將已寫好的檔案搬進快取 (os.replace，不複製內容)；回傳快取內的路徑
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(src_path)
+        os.replace(src_path, path)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                       (key, name, size, now, now))
+            self._evict(db)
+        return path
+
+    def delete(self, key):
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT name FROM entries WHERE key=?", (key,)).fetchone()
+            if row: self._drop(db, key, row[0])
+
+    def total_bytes(self):
+        with self._connect() as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _drop(self, db, key, name):
+        db.execute("DELETE FROM entries WHERE key=?", (key,))
+        try: os.remove(self._path(name))
+        except OSError: pass
+
+    def _evict(self, db):
+        if self.ttl is not None:
+            expired = db.execute("SELECT key, name FROM entries WHERE created < ?",
+                                 (time.time() - self.ttl,)).fetchall()
+            for key, name in expired: self._drop(db, key, name)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes: return
+        # 依最近使用時間由舊到新淘汰，直到回到容量上限內
+        for key, name, size in db.execute(
+                "SELECT key, name, size FROM entries ORDER BY atime ASC").fetchall():
+            if total <= self.max_bytes: break
+            self._drop(db, key, name)
+            total -= size
@@ -0,0 +1,65 @@
+from io import BytesIO
+import threading
+
+# --- Google Drive API 模組 (不依賴 Streamlit) ---
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+
+
+def make_drive_credentials(service_account_info):
+    try:
+        return service_account.Credentials.from_service_account_info(
+            dict(service_account_info), scopes=DRIVE_SCOPES)
+    except: return None
+
+
+def build_drive_service(creds):
+    try:
+        if not creds: return None
+        return build('drive', 'v3', credentials=creds, cache_discovery=False)
+    except: return None
+
+
+# googleapiclient 的 service 物件非執行緒安全，平行下載時每條執行緒各建一個
+_drive_local = threading.local()
+
+def thread_drive_service(creds):
+    if getattr(_drive_local, 'service', None) is None:
+        _drive_local.service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    return _drive_local.service
+
+
+def download_drive_file(service, file_id):
+    if not service: return None
+    try:
+        request = service.files().get_media(fileId=file_id)
+        file_io = BytesIO()
+        downloader = MediaIoBaseDownload(file_io, request)
+        done = False
+        while done is False: status, done = downloader.next_chunk()
+        file_io.seek(0)
+        return file_io
+    except: return None
+
+
+def download_drive_bytes(creds, file_id):
+    try: service = thread_drive_service(creds)
+    except: return None
+    f_stream = download_drive_file(service, file_id)
+    return f_stream.getvalue() if f_stream else None
+
+
+def download_drive_to_file(creds, file_id, path, chunk_size=8 * 1024 * 1024):
+    # 分段寫入磁碟，不在記憶體中保留整份檔案
+    try:
+        service = thread_drive_service(creds)
+        request = service.files().get_media(fileId=file_id)
+        with open(path, "wb") as f:
+            downloader = MediaIoBaseDownload(f, request, chunksize=chunk_size)
+            done = False
+            while done is False: status, done = downloader.next_chunk()
+        return True
+    except: return False
@@ -0,0 +1,78 @@
+import re
+import time
+import hashlib
+import threading
+import datetime
+
+# --- 本機假 Google Drive service (不需網路 / 服務帳號) ---
+# 支援本程式用到的 files().list(q, pageSize, pageToken, fields) 與 files().get_media(fileId)，
+# 介面與 drive_client.build_drive_service 回傳的 service 相同；可模擬每次請求延遲與下載頻寬。
+
+_PARENT = re.compile(r"'([^']+)' in parents")
+_MODIFIED = re.compile(r"modifiedTime >= '([^']+)'")
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class _Files:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q="", pageSize=100, pageToken=None, fields=None, **kwargs):
+        return _Request(lambda: self.drive._list(q, pageSize, pageToken))
+
+    def get_media(self, fileId, **kwargs):
+        return _Request(lambda: self.drive._download(fileId))
+
+
+class FakeDriveService:
+    def __init__(self, latency=0.0, bytes_per_second=None):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.list_calls = 0
+        self.downloads = 0
+
+    def add_file(self, folder_id, name, data, mime_type="application/pdf", modified=None):
+        file_id = hashlib.sha1(f"{folder_id}/{name}".encode("utf-8")).hexdigest()[:16]
+        modified = modified or datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        with self.lock:
+            self.entries[file_id] = {"id": file_id, "name": name, "parent": folder_id, "mimeType": mime_type,
+                                     "modifiedTime": modified, "md5Checksum": hashlib.md5(data).hexdigest(),
+                                     "trashed": False, "data": data}
+        return file_id
+
+    def files(self):
+        return _Files(self)
+
+    def _list(self, q, page_size, page_token):
+        time.sleep(self.latency)
+        parent = _PARENT.search(q)
+        since = _MODIFIED.search(q)
+        with self.lock:
+            self.list_calls += 1
+            matched = [e for e in self.entries.values()
+                       if (not parent or e["parent"] == parent.group(1))
+                       and ("mimeType='application/pdf'" not in q or e["mimeType"] == "application/pdf")
+                       and ("trashed=false" not in q or not e["trashed"])
+                       and (not since or e["modifiedTime"] >= since.group(1))]
+        matched.sort(key=lambda e: e["id"])
+        start = int(page_token or 0)
+        page = matched[start:start + page_size]
+        result = {"files": [{k: v for k, v in e.items() if k not in ("data", "parent", "mimeType")} for e in page]}
+        if start + page_size < len(matched): result["nextPageToken"] = str(start + page_size)
+        return result
+
+    def _download(self, file_id):
+        with self.lock:
+            self.downloads += 1
+            data = self.entries[file_id]["data"]
+        time.sleep(self.latency + (len(data) / self.bytes_per_second if self.bytes_per_second else 0))
+        return data
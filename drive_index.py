@@ -0,0 +1,111 @@
+import os
+import re
+import json
+import time
+import threading
+
+from disk_cache import DEFAULT_CACHE_ROOT
+
+# --- Google Drive 資料夾索引 ---
+# 完整跟隨 nextPageToken 分頁；結果存於本機並以 TTL 控制更新頻率。
+# 過期時只以 modifiedTime 增量查詢變動檔案，並定期做一次完整重建以清除被移走/刪除的檔案。
+
+SUBJECT_KEYWORDS = ["國語", "數學", "英語", "英文", "自然", "社會", "生活"]
+GRADE_PATTERN = re.compile(r'([一二三四五六1-6])\s*年級')
+_DIGIT_TO_ZH = str.maketrans("123456", "一二三四五六")
+STAGE_PATTERN = re.compile(r'第\s*([一二三])\s*學習階段')
+FILE_FIELDS = "id, name, modifiedTime, md5Checksum, trashed"
+
+
+def classify_file_name(name):
+    subjects = [s for s in SUBJECT_KEYWORDS if s in name]
+    grades = [f"{g.translate(_DIGIT_TO_ZH)}年級" for g in GRADE_PATTERN.findall(name)]
+    stages = [f"第{s}學習階段" for s in STAGE_PATTERN.findall(name)]
+    return {"subjects": subjects, "grades": grades, "stages": stages}
+
+
+def list_folder_pdfs(service, folder_id, modified_since=None, page_size=1000):
+    query = f"'{folder_id}' in parents and mimeType='application/pdf'"
+    if modified_since:
+        # 增量查詢需包含已丟到垃圾桶的檔案，才能把它們從索引移除
+        query += f" and modifiedTime >= '{modified_since}'"
+    else:
+        query += " and trashed=false"
+    files = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query, pageSize=page_size, pageToken=page_token,
+            fields=f"nextPageToken, files({FILE_FIELDS})").execute()
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token: return files
+
+
+class DriveFolderIndex:
+    def __init__(self, folder_id, root=None, ttl=300, full_resync=24 * 3600):
+        self.folder_id = folder_id
+        self.ttl = ttl
+        self.full_resync = full_resync
+        root = root or os.path.join(DEFAULT_CACHE_ROOT, "drive_index")
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"{re.sub(r'[^A-Za-z0-9_-]', '_', folder_id)}.json")
+        self._lock = threading.Lock()
+        self._state = self._load()
+        self._by_subject = self._build_subject_map()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError):
+            return {"files": {}, "last_modified": None, "checked_at": 0, "full_sync_at": 0}
+
+    def _save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(self._state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _build_subject_map(self):
+        by_subject = {}
+        for f in self._state["files"].values():
+            for sub in f["tags"]["subjects"]: by_subject.setdefault(sub, []).append(f)
+        for files in by_subject.values(): files.sort(key=lambda f: f["name"])
+        return by_subject
+
+    def _apply(self, files, full):
+        entries = {} if full else self._state["files"]
+        last_modified = None if full else self._state["last_modified"]
+        for f in files:
+            if f.get("trashed"):
+                entries.pop(f["id"], None)
+                continue
+            f = {k: f.get(k) for k in ("id", "name", "modifiedTime", "md5Checksum")}
+            f["tags"] = classify_file_name(f["name"])
+            entries[f["id"]] = f
+            if f["modifiedTime"] and (last_modified is None or f["modifiedTime"] > last_modified):
+                last_modified = f["modifiedTime"]
+        now = time.time()
+        self._state["files"] = entries
+        self._state["last_modified"] = last_modified
+        self._state["checked_at"] = now
+        if full: self._state["full_sync_at"] = now
+
+    def refresh(self, service, force=False):
+        with self._lock:
+            now = time.time()
+            if not force and now - self._state["checked_at"] < self.ttl: return False
+            full = force or not self._state["files"] or now - self._state["full_sync_at"] > self.full_resync
+            # 以 Drive 端的 modifiedTime 為基準，避免本機時鐘誤差漏掉變動
+            since = None if full else self._state["last_modified"]
+            files = list_folder_pdfs(service, self.folder_id, modified_since=since)
+            self._apply(files, full=full or since is None)
+            self._by_subject = self._build_subject_map()
+            self._save()
+            return True
+
+    def all_files(self):
+        return sorted(self._state["files"].values(), key=lambda f: f["name"])
+
+    def files_for_subject(self, subject):
+        if subject in SUBJECT_KEYWORDS: return list(self._by_subject.get(subject, []))
+        return [f for f in self.all_files() if subject in f["name"]]
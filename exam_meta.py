@@ -0,0 +1,36 @@
+import re
+import datetime
+
+# --- 強化版試卷資訊擷取 (自動偵測) ---
+def extract_exam_meta_enhanced(text):
+    today = datetime.date.today().strftime("%Y/%m/%d")
+    
+    meta = {
+        "year": "113學年度", "semester": "下學期", "exam_name": "定期評量",
+        "grade": "未偵測", "subject": "未偵測", "date_str": today
+    }
+    
+    sample = text[:1000] 
+    m_year = re.search(r'(\d{3})\s*學年度', sample)
+    if m_year: meta['year'] = f"{m_year.group(1)}學年度"
+    m_sem = re.search(r'(上|下)\s*學期', sample)
+    if m_sem: meta['semester'] = f"{m_sem.group(1)}學期"
+    
+    # 偵測年級 (擴充關鍵字)
+    m_grade = re.search(r'([一二三四五六])\s*年級', sample)
+    if m_grade: meta['grade'] = f"{m_grade.group(1)}年級"
+    
+    # 偵測科目
+    subjects = ["國語", "數學", "英語", "英文", "自然", "社會", "生活"]
+    for sub in subjects:
+        if sub in sample:
+            meta['subject'] = sub
+            break
+            
+    m_exam = re.search(r'(期中|期末|第[一二三]次|定期)評量', sample)
+    if m_exam: meta['exam_name'] = m_exam.group(0)
+    elif "期末" in sample: meta['exam_name'] = "期末評量"
+    elif "期中" in sample: meta['exam_name'] = "期中評量"
+    
+    meta['info_str'] = f"{meta['year']} {meta['semester']} {meta['grade']} {meta['subject']} {meta['exam_name']}"
+    return meta
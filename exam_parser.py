@@ -0,0 +1,289 @@
+import re
+from dataclasses import dataclass, field
+
+from exam_sections import find_sections, heading_number
+
+# --- 試卷結構解析：大題、題號、配分 (本機計算，不經 AI) ---
+# 題數、配分、比重與雙向細目表的加總都在這裡計算；AI 只負責判斷每題的單元與認知層次，
+# 回傳的「題目分類表」再由 build_spec_table 組成雙向細目表，取代報告中的 Step 4。
+
+LEVELS = ["記憶", "了解", "應用", "分析", "評鑑", "創造"]
+MIN_QUESTIONS = 3
+
+# (  ) 1. / 1. / 1、 / 1．；作答括號可在題號前
+_QUESTION = re.compile(r'^\s*(?:[（(][\s　A-Da-d○×Oo✓]*[）)]\s*)?(\d{1,3})\s*[.、．](?!\d)')
+# (1) / （1）：沒有一般題號的大題才使用 (常見於題組小題)
+_SUB_QUESTION = re.compile(r'^\s*[（(]\s*(\d{1,3})\s*[）)]')
+_POINTS = re.compile(r'[（(]\s*(\d+(?:\.\d+)?)\s*分\s*[）)]')
+_EACH = re.compile(r'每(?:題|小題|格|空)\s*(\d+(?:\.\d+)?)\s*分')
+_TOTAL = re.compile(r'共\s*(\d+(?:\.\d+)?)\s*分')
+
+
+@dataclass
+class Question:
+    qid: str
+    number: int
+    points: float = None
+    text: str = ""
+    body: str = ""       # 完整題目文字 (修訂版比對用)
+
+
+@dataclass
+class Section:
+    label: str
+    number: int = None
+    each: float = None
+    declared_total: float = None
+    preamble: str = ""   # 大題標題到第一題之間的文字 (題組的閱讀文本等)
+    questions: list = field(default_factory=list)
+
+    @property
+    def points(self):
+        return sum(q.points or 0 for q in self.questions)
+
+
+@dataclass
+class ExamStructure:
+    sections: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def questions(self):
+        return [q for s in self.sections for q in s.questions]
+
+    @property
+    def total_points(self):
+        return sum(s.points for s in self.sections)
+
+    @property
+    def points_known(self):
+        return all(q.points for q in self.questions)
+
+    @property
+    def usable(self):
+        return len(self.questions) >= MIN_QUESTIONS
+
+    def weight(self, q):
+        # 配分不完整時改以題數計算比重
+        return q.points if self.points_known else 1
+
+
+def _cn_numeral(n):
+    digits = "零一二三四五六七八九"
+    if n < 10: return digits[n]
+    tens, ones = divmod(n, 10)
+    return (digits[tens] if tens > 1 else "") + "十" + (digits[ones] if ones else "")
+
+
+def _num(s):
+    v = float(s)
+    return int(v) if v.is_integer() else v
+
+
+def _find_questions(lines, pattern):
+    found, expected = [], None
+    for i, line in enumerate(lines):
+        m = pattern.match(line)
+        if not m: continue
+        n = int(m.group(1))
+        # 題號須連續 (允許少量缺號)，避免把題目內文的數字誤判為題號
+        if (expected is None and n <= 3) or (expected is not None and expected <= n <= expected + 2):
+            found.append((i, n))
+            expected = n + 1
+    return found
+
+
+def _parse_section(label, text):
+    lines = text.split("\n")
+    head = lines[0] if label != "全卷" else ""
+    short = re.split(r'\s*[（(：:]', label)[0].strip() or label
+    section = Section(label=short, number=heading_number(head) if head else None)
+    if m := _EACH.search(head): section.each = _num(m.group(1))
+    if m := _TOTAL.search(head): section.declared_total = _num(m.group(1))
+
+    body = lines[1:] if head else lines
+    found = _find_questions(body, _QUESTION) or _find_questions(body, _SUB_QUESTION)
+    if found and head: section.preamble = "\n".join(body[:found[0][0]]).strip()
+    for k, (i, n) in enumerate(found):
+        end = found[k + 1][0] if k + 1 < len(found) else len(body)
+        q_text = "\n".join(body[i:end])
+        m = _POINTS.search(q_text)
+        section.questions.append(Question(qid=str(n), number=n, points=_num(m.group(1)) if m else section.each,
+                                          text=q_text.strip()[:80], body=q_text.strip()))
+
+    # 只標示「共 N 分」的大題，未標配分的題目平分剩餘分數
+    unknown = [q for q in section.questions if q.points is None]
+    if unknown and section.declared_total:
+        rest = section.declared_total - sum(q.points or 0 for q in section.questions)
+        if rest > 0:
+            for q in unknown: q.points = round(rest / len(unknown), 2)
+    return section
+
+
+def parse_exam(text):
+    _, found = find_sections(text)
+    if not found: found = [("全卷", text)]
+    exam = ExamStructure(sections=[_parse_section(label, body) for label, body in found])
+    exam.sections = [s for s in exam.sections if s.questions]
+
+    # 各大題題號重新從 1 起算時，題目代號加上大題編號 (一-1、二-1…)
+    numbers = [q.number for q in exam.questions]
+    if len(numbers) != len(set(numbers)):
+        for k, s in enumerate(exam.sections, 1):
+            prefix = _cn_numeral(s.number or k)
+            for q in s.questions: q.qid = f"{prefix}-{q.number}"
+
+    for s in exam.sections:
+        nums = [q.number for q in s.questions]
+        missing = sorted(set(range(nums[0], nums[-1] + 1)) - set(nums))
+        if missing: exam.warnings.append(f"{s.label}：題號 {', '.join(map(str, missing))} 缺漏或無法辨識")
+        if s.declared_total is not None and all(q.points for q in s.questions) and abs(s.points - s.declared_total) > 0.01:
+            exam.warnings.append(f"{s.label}：各題配分合計 {_num(s.points)} 分，與標示「共 {_num(s.declared_total)} 分」不符")
+    no_points = [q.qid for q in exam.questions if not q.points]
+    if no_points:
+        exam.warnings.append(f"{len(no_points)} 題無法判斷配分，比重改以題數計算")
+    elif exam.questions and abs(exam.total_points - 100) > 0.01:
+        exam.warnings.append(f"全卷配分合計 {_num(exam.total_points)} 分 (非 100 分)")
+    return exam
+
+
+def _pct(part, whole):
+    return f"{part / whole * 100:.1f}%" if whole else "-"
+
+
+def _id_range(questions):
+    return f"{questions[0].qid} ～ {questions[-1].qid}" if len(questions) > 1 else questions[0].qid
+
+
+def markdown_table(header, rows):
+    return "\n".join(["| " + " | ".join(map(str, header)) + " |", "|" + "---|" * len(header)] +
+                     ["| " + " | ".join(map(str, r)) + " |" for r in rows])
+
+
+def score_summary_rows(exam):
+    # 回傳 (表頭, 各列)；Markdown 與結構化報告共用
+    total = sum(exam.weight(q) for q in exam.questions)
+    rows = []
+    for s in exam.sections:
+        weight = sum(exam.weight(q) for q in s.questions)
+        points = _num(s.points) if exam.points_known else "-"
+        rows.append([s.label, _id_range(s.questions), len(s.questions), points, _pct(weight, total)])
+    rows.append(["**合計**", "", len(exam.questions), _num(exam.total_points) if exam.points_known else "-", "100%"])
+    return ["大題", "題號", "題數", "配分", "比重"], rows
+
+
+def score_summary_markdown(exam):
+    text = markdown_table(*score_summary_rows(exam))
+    if not exam.points_known: text += "\n\n(比重以題數計算)"
+    return text
+
+
+def score_block(exam):
+    # 放進 Prompt 的本機計算結果
+    text = "【系統計算配分】(依試卷文字自動計算，請直接採用，勿自行重算)：\n" + score_summary_markdown(exam)
+    text += "\n題目代號：" + "、".join(q.qid for q in exam.questions)
+    text += "\n(報告各表格的「題號」欄請一律使用上列題目代號)"
+    if exam.warnings: text += "\n" + "\n".join(f"⚠️ {w}" for w in exam.warnings)
+    return text + "\n"
+
+
+# --- AI 題目分類表 → 雙向細目表 ---
+def _normalize_qid(cell):
+    cell = re.sub(r'[\s*（）()【】\[\]第題]', '', cell)
+    cell = re.sub(r'^([一二三四五六七八九十壹貳參肆伍陸柒捌玖拾]+)[、.．]', r'\1-', cell)
+    return cell
+
+
+def expand_question_ids(cell, known):
+    cell = _normalize_qid(cell)
+    ids = []
+    for part in re.split(r'[,，、/]', cell):
+        if part in known:
+            ids.append(part)
+            continue
+        m = re.fullmatch(r'(.*?)(\d+)[~～\-–至](?:\1)?(\d+)', part)
+        if m:
+            prefix, a, b = m.group(1), int(m.group(2)), int(m.group(3))
+            ids += [f"{prefix}{n}" for n in range(a, b + 1) if f"{prefix}{n}" in known]
+    return ids
+
+
+def parse_classification(report, exam):
+    # 從報告中找出含「題號」與「認知層次」欄位的表格；回傳 {題目代號: (單元, 認知層次)}
+    known = {q.qid for q in exam.questions}
+    result, cols = {}, None
+    for line in report.split("\n"):
+        line = line.strip()
+        if not line.startswith("|"):
+            cols = None
+            continue
+        cells = [c.strip() for c in line.strip("|").split("|")]
+        if cols is None:
+            if any("題號" in c for c in cells) and any("層次" in c for c in cells):
+                cols = (next(i for i, c in enumerate(cells) if "題號" in c),
+                        next((i for i, c in enumerate(cells) if "單元" in c), None),
+                        next(i for i, c in enumerate(cells) if "層次" in c))
+            continue
+        if set("".join(cells)) <= set("-: "): continue
+        qi, ui, li = cols
+        if max(qi, li) >= len(cells): continue
+        level = next((lv for lv in LEVELS if lv in cells[li]), None)
+        if not level: continue
+        unit = cells[ui].replace("**", "").strip() if ui is not None and ui < len(cells) else ""
+        for qid in expand_question_ids(cells[qi], known):
+            result[qid] = (unit or "(未標示單元)", level)
+    return result
+
+
+def spec_table_rows(exam, classification):
+    # 雙向細目表：回傳 (表頭, 各列)
+    total = sum(exam.weight(q) for q in exam.questions) or 1
+    units, cells, unit_weight, level_weight = [], {}, {}, dict.fromkeys(LEVELS, 0)
+    for q in exam.questions:
+        unit, level = classification.get(q.qid, ("(未分類)", None))
+        if unit not in unit_weight:
+            units.append(unit)
+            unit_weight[unit] = 0
+        unit_weight[unit] += exam.weight(q)
+        if level:
+            cells.setdefault((unit, level), []).append(q.qid)
+            level_weight[level] += exam.weight(q)
+    if "(未分類)" in units: units.append(units.pop(units.index("(未分類)")))
+    rows = []
+    for unit in units:
+        points = _num(unit_weight[unit]) if exam.points_known else "-"
+        rows.append([unit] + [", ".join(cells.get((unit, lv), [])) or "-" for lv in LEVELS] +
+                    [points, _pct(unit_weight[unit], total)])
+    rows.append(["**分數比重**"] + [_pct(level_weight[lv], total) for lv in LEVELS] +
+                [_num(exam.total_points) if exam.points_known else "-", "100%"])
+    return ["單元名稱"] + LEVELS + ["配分", "比重"], rows
+
+
+def build_spec_table(exam, classification):
+    return markdown_table(*spec_table_rows(exam, classification))
+
+
+_STEP4 = re.compile(r'^#{2,4}\s*.*Step\s*4')
+_HEADING = re.compile(r'^#{2,3}\s')
+
+
+def apply_spec_table(report, exam):
+    # 以本機計算的雙向細目表取代報告的 Step 4 (保留 AI 的題目分類表作為明細)
+    if not exam or not exam.usable: return report
+    classification = parse_classification(report, exam)
+    missing = [q.qid for q in exam.questions if q.qid not in classification]
+    parts = ["### Step 4: 【雙向細目表核算】",
+             "*(題數、配分與比重由系統依試卷計算；單元與認知層次由 AI 判斷)*", "",
+             build_spec_table(exam, classification), "", "**各大題配分**", "", score_summary_markdown(exam)]
+    notes = list(exam.warnings)
+    if missing: notes.append(f"AI 未分類的題目：{'、'.join(missing)}")
+    if notes: parts += [""] + [f"- ⚠️ {n}" for n in notes]
+
+    lines = report.split("\n")
+    start = next((i for i, l in enumerate(lines) if _STEP4.match(l.strip())), None)
+    if start is None:
+        return report.rstrip() + "\n\n" + "\n".join(parts) + "\n"
+    end = next((i for i in range(start + 1, len(lines)) if _HEADING.match(lines[i].strip())), len(lines))
+    detail = [l for l in lines[start + 1:end] if l.strip()]
+    if detail: parts += ["", "**題目分類明細**", ""] + detail
+    return "\n".join(lines[:start] + parts + [""] + lines[end:])
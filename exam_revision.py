@@ -0,0 +1,353 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from disk_cache import DEFAULT_CACHE_ROOT
+from exam_parser import expand_question_ids, parse_classification
+
+# --- 修訂版試卷增量審題 ---
+# 每次審題後記錄試卷的逐題指紋與逐題審查結果 (Step 1/2/3/5 表格列、Step 4 單元與認知層次)。
+# 老師上傳修訂版時，依題目內容找出上一版並比對：只有修改 / 新增的題目送 Gemini 審查，
+# 其餘題目沿用上一版結果 (題號變動時自動換成新題號)，合併成完整報告並標示本版的變動。
+
+ROW_STEPS = ("1", "2", "3", "5")       # 以「題號」表格逐題列出的步驟
+ISSUE_STEPS = ("1", "2")
+STEP_TITLES = {"1": "【命題範圍與合規性檢核】", "2": "【題幹與邏輯品質審查】", "3": "【素養導向深度審查】",
+               "4": "【雙向細目表核算】", "5": "【難易度與負擔分析】", "6": "【總結與建議】"}
+DEFAULT_HEADERS = {"1": ["題號", "問題", "說明"], "2": ["題號", "問題", "說明"],
+                   "3": ["題號", "判定", "簡評"], "5": ["題號", "難度", "說明"]}
+PASS_LINE = "✅ 本大項全數通過，無異常試題。"
+MIN_OVERLAP = 0.5          # 與上一版相同的題目比例低於此值，視為不同試卷
+MAX_REVIEW_SHARE = 0.6     # 需重審的題目超過此比例時，直接整份重新審查
+MARK_CHANGED, MARK_ADDED = "✏️", "🆕"
+
+_STEP = re.compile(r'^#{2,4}\s*.*?Step\s*(\d)')
+# 題號本身 (含作答括號) 不列入指紋，題目只是重新編號時視為未變更
+_LEADING_NUMBER = re.compile(r'^\s*(?:[（(][\s　A-Da-d○×Oo✓]*[）)]\s*)?[（(]?\s*\d{1,3}\s*[)）.、．]')
+
+
+def _normalize(text):
+    return re.sub(r'\s+', '', unicodedata.normalize("NFKC", text or ""))
+
+
+def exam_questions(exam):
+    # [{qid, digest}]；大題的題組文本併入該大題每一題的指紋 (文本修改時整組重審)
+    out = []
+    for s in exam.sections:
+        for q in s.questions:
+            body = _LEADING_NUMBER.sub("", q.body, count=1)
+            digest = hashlib.sha256(f"{_normalize(s.preamble)}\n{_normalize(body)}".encode("utf-8")).hexdigest()
+            out.append({"qid": q.qid, "digest": digest[:16]})
+    return out
+
+
+@dataclass
+class RevisionDiff:
+    unchanged: dict = field(default_factory=dict)   # 本版題號 -> 上一版題號
+    changed: dict = field(default_factory=dict)     # 本版題號 -> 上一版題號 (內容不同)
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)     # 上一版題號
+
+    @property
+    def overlap(self):
+        total = len(self.unchanged) + len(self.changed) + len(self.added)
+        return len(self.unchanged) / total if total else 0.0
+
+    @property
+    def renumbered(self):
+        return {new: old for new, old in self.unchanged.items() if new != old}
+
+
+def diff_questions(old, new):
+    # 依題目順序對齊指紋序列：相同為未變更 (題號可不同)，對齊位置上內容不同為修改，其餘為新增 / 刪除；
+    # 內容相同但移到別處的題目仍視為未變更
+    diff = RevisionDiff()
+    inserted, deleted = [], []
+    matcher = SequenceMatcher(None, [q["digest"] for q in old], [q["digest"] for q in new], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        paired = i2 - i1 if tag == "equal" else min(i2 - i1, j2 - j1) if tag == "replace" else 0
+        target = diff.unchanged if tag == "equal" else diff.changed
+        for k in range(paired): target[new[j1 + k]["qid"]] = old[i1 + k]["qid"]
+        deleted += old[i1 + paired:i2]
+        inserted += new[j1 + paired:j2]
+    pool = {}
+    for q in deleted: pool.setdefault(q["digest"], deque()).append(q["qid"])
+    for q in inserted:
+        if pool.get(q["digest"]): diff.unchanged[q["qid"]] = pool[q["digest"]].popleft()
+        else: diff.added.append(q["qid"])
+    moved = set(diff.unchanged.values())
+    diff.removed = [q["qid"] for q in deleted if q["qid"] not in moved]
+    return diff
+
+
+# --- 報告 ↔ 逐題結果 ---
+def split_steps(report):
+    # 回傳 (第一個步驟前的文字, [(步驟編號, 標題列, 內容各列)])
+    lines = report.split("\n")
+    starts = [(i, m.group(1)) for i, l in enumerate(lines) if (m := _STEP.match(l.strip()))]
+    if not starts: return lines, []
+    steps = []
+    for k, (i, step) in enumerate(starts):
+        end = starts[k + 1][0] if k + 1 < len(starts) else len(lines)
+        steps.append((step, lines[i], lines[i + 1:end]))
+    return lines[:starts[0][0]], steps
+
+
+def _cells(line):
+    return [c.strip() for c in line.strip().strip("|").split("|")]
+
+
+def _tables(lines):
+    # 回傳 [(起始列, 結束列, 表頭, [資料列])]
+    tables, i = [], 0
+    while i < len(lines):
+        if not lines[i].strip().startswith("|"):
+            i += 1
+            continue
+        start = i
+        while i < len(lines) and lines[i].strip().startswith("|"): i += 1
+        rows = [_cells(l) for l in lines[start:i]]
+        body = [r for r in rows[1:] if not set("".join(r)) <= set("-: ")]
+        tables.append((start, i, rows[0], body))
+    return tables
+
+
+def _qid_column(header):
+    return next((i for i, c in enumerate(header) if "題號" in c), None)
+
+
+def question_findings(report, exam, only=None):
+    # 從報告解析逐題結果；only：只保留這些題號 (修訂版審查只採用本次送審的題目)
+    known = {q.qid for q in exam.questions}
+    keep = set(only) if only is not None else known
+    findings = {"headers": {}, "rows": {}, "class": {}, "unmapped": 0}
+    _, steps = split_steps(report)
+    for step, _, body in steps:
+        if step not in ROW_STEPS: continue
+        for _, _, header, rows in _tables(body):
+            col = _qid_column(header)
+            if col is None: continue
+            findings["headers"].setdefault(step, header)
+            for cells in rows:
+                if col >= len(cells): continue
+                ids = expand_question_ids(cells[col], known)
+                qids = [q for q in ids if q in keep]
+                if qids: findings["rows"].setdefault(step, []).append({"qids": qids, "col": col, "cells": cells})
+                elif not ids and step in ISSUE_STEPS and re.search(r'\d', cells[col]): findings["unmapped"] += 1
+    findings["class"] = {qid: list(v) for qid, v in parse_classification(report, exam).items() if qid in keep}
+    return findings
+
+
+def can_carry(previous):
+    # 上一版有對不到題目代號的問題列 (例如只寫「3」而各大題都有第 3 題) 時無法逐題沿用
+    return not previous.get("unmapped")
+
+
+def carry_findings(previous, diff):
+    # 上一版結果沿用到本版：未變更的題目換成新題號；同一列涉及修改 / 刪除題目時整列捨棄，
+    # 該列其他題目一併重審 (回傳 linked)
+    rename = {old: new for new, old in diff.unchanged.items()}
+    carried = {"headers": dict(previous.get("headers", {})), "rows": {}, "class": {}}
+    linked = set()
+    for step, rows in previous.get("rows", {}).items():
+        for row in rows:
+            if all(q in rename for q in row["qids"]):
+                qids = [rename[q] for q in row["qids"]]
+                cells = list(row["cells"])
+                if qids != row["qids"]: cells[row["col"]] = "、".join(qids)
+                carried["rows"].setdefault(step, []).append({"qids": qids, "col": row["col"], "cells": cells})
+            else:
+                linked.update(rename[q] for q in row["qids"] if q in rename)
+    for old, value in previous.get("class", {}).items():
+        if old in rename: carried["class"][rename[old]] = value
+    return carried, linked
+
+
+def merge_findings(carried, fresh):
+    merged = {"headers": dict(carried["headers"]), "rows": {}, "class": dict(carried["class"])}
+    for step, header in fresh["headers"].items(): merged["headers"].setdefault(step, header)
+    for step in set(carried["rows"]) | set(fresh["rows"]):
+        merged["rows"][step] = carried["rows"].get(step, []) + fresh["rows"].get(step, [])
+    merged["class"].update(fresh["class"])
+    return merged
+
+
+def resolved_issues(previous, diff, fresh):
+    # 上一版在 Step 1/2 標出問題、本版修改後不再有問題的題目：[(題號, 步驟)]
+    out = []
+    for step in ISSUE_STEPS:
+        flagged = {q for row in previous.get("rows", {}).get(step, []) for q in row["qids"]}
+        still = {q for row in fresh["rows"].get(step, []) for q in row["qids"]}
+        out += [(new, step) for new, old in diff.changed.items() if old in flagged and new not in still]
+    return out
+
+
+# --- 合併報告 ---
+def _fit(row, header):
+    # 本次審查的欄位數可能與上一版表頭不同：題號放到表頭的題號欄，其餘欄位依序填入 (多的併入最後一欄)
+    col = _qid_column(header) or 0
+    rest = [c for i, c in enumerate(row["cells"]) if i != row["col"]]
+    width = len(header) - 1
+    if len(rest) > width: rest = rest[:width - 1] + ["；".join(rest[width - 1:])] if width else []
+    rest += [""] * (width - len(rest))
+    return rest[:col] + [row["cells"][row["col"]]] + rest[col:]
+
+
+def _table(header, rows):
+    return ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)] + \
+           ["| " + " | ".join(cells) + " |" for cells in rows]
+
+
+def _row_table(step, findings, order, marks):
+    header = findings["headers"].get(step) or DEFAULT_HEADERS[step]
+    rows = sorted(findings["rows"].get(step, []), key=lambda r: order.get(r["qids"][0], len(order)))
+    out = []
+    for row in rows:
+        cells = _fit(row, header)
+        mark = next((marks[q] for q in row["qids"] if q in marks), None)
+        if mark:
+            col = _qid_column(header) or 0
+            cells[col] = f"{mark} {cells[col]}"
+        out.append(cells)
+    return _table(header, out) if out else []
+
+
+def _class_table(findings, order):
+    rows = [[qid, *findings["class"][qid]] for qid in sorted(findings["class"], key=lambda q: order.get(q, len(order)))]
+    return _table(["題號", "單元名稱", "認知層次"], rows) if rows else []
+
+
+def _strip_qid_tables(lines):
+    # 移除以題號列出的表格 (改由逐題結果重建)
+    out, last = [], 0
+    for start, end, header, _ in _tables(lines):
+        if _qid_column(header) is None: continue
+        out += lines[last:start]
+        last = end
+    return out + lines[last:]
+
+
+def _ids(qids):
+    return "、".join(qids) if qids else "-"
+
+
+def revision_summary(info, diff, resolved, linked):
+    lines = [f"### 🔁 修訂比對 (第 {info['version']} 版，對照 {info['previous_at']} 的第 {info['previous']} 版)", "",
+             "| 變動 | 題號 |", "|---|---|",
+             f"| {MARK_CHANGED} 修改 | {_ids([n if n == o else f'{n} (原 {o})' for n, o in diff.changed.items()])} |", f"| {MARK_ADDED} 新增 | {_ids(diff.added)} |",
+             f"| 🗑️ 刪除 | {_ids(diff.removed)}{' (上一版題號)' if diff.removed else ''} |",
+             f"| ＝ 未變更 | 共 {len(diff.unchanged)} 題，沿用上一版審查結果 |"]
+    if diff.renumbered:
+        lines.append(f"| 🔢 題號變動 | {'、'.join(f'{old}→{new}' for new, old in diff.renumbered.items())} |")
+    lines.append("")
+    if resolved:
+        lines.append(f"- ✅ 上一版標示的問題已排除：{'、'.join(f'{q} (Step {s})' for q, s in resolved)}")
+    if linked:
+        lines.append(f"- 🔁 與修改題目列在同一筆審查紀錄，一併重審：{'、'.join(linked)}")
+    lines.append(f"- *本版只將標示 {MARK_CHANGED} / {MARK_ADDED} 的題目送交 AI 審查；Step 3、Step 5 的文字分析與 "
+                 f"Step 6 建議沿用第 {info['base']} 版的完整審查。*")
+    return lines + [""]
+
+
+def render_revision_report(base_report, findings, exam, diff, marks, summary):
+    # base_report：最近一次完整審查的報告 (提供 Step 3/5/6 的文字分析)；表格列依 findings 重建
+    order = {q.qid: i for i, q in enumerate(exam.questions)}
+    preface, steps = split_steps(base_report)
+    present = {step for step, _, _ in steps}
+    for step in STEP_TITLES:
+        if step not in present: steps.append((step, f"### Step {step}: {STEP_TITLES[step]}", []))
+    steps.sort(key=lambda s: s[0])
+
+    out = preface + summary
+    for step, heading, body in steps:
+        if step == "4":
+            # 單元與認知層次；apply_spec_table 再據此產生雙向細目表
+            section = _class_table(findings, order)
+        elif step in ROW_STEPS:
+            kept = [l for l in _strip_qid_tables(body) if not (step in ISSUE_STEPS and "全數通過" in l)]
+            table = _row_table(step, findings, order, marks)
+            if step in ISSUE_STEPS:
+                section = [l for l in kept if l.strip()] + (table or [PASS_LINE])
+            else:
+                section = kept + ([""] + table if table else [])
+        else:
+            section = body
+        if not section and step not in present: continue
+        out += [heading] + section + [""]
+    return "\n".join(out).rstrip() + "\n"
+
+
+def revision_questions_text(exam, qids):
+    # 送審題目 (附題目代號與所屬大題；題組文本每個大題只附一次)
+    wanted = set(qids)
+    parts = []
+    for s in exam.sections:
+        questions = [q for q in s.questions if q.qid in wanted]
+        if not questions: continue
+        parts.append(f"【{s.label}】")
+        if s.preamble: parts.append(s.preamble)
+        parts += [f"[題目代號 {q.qid}]\n{q.body}" for q in questions]
+    return "\n\n".join(parts)
+
+
+# --- 版本紀錄 (SQLite) ---
+class RevisionStore:
+    def __init__(self, path=None, retention_days=120):
+        self.path = path or os.path.join(DEFAULT_CACHE_ROOT, "revisions.sqlite3")
+        self.retention = retention_days * 86400
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS versions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, lineage INTEGER, version INTEGER, base_version INTEGER,
+                context TEXT, name TEXT, created REAL, questions TEXT, findings TEXT, base_report TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_context ON versions(context, created)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def find_previous(self, context, questions, scan=50):
+        # 同一審題設定下，與本版題目重疊最多 (且超過 MIN_OVERLAP) 的最近一版；回傳 (紀錄, 差異) 或 None
+        with self._connect() as db:
+            rows = db.execute("SELECT id, lineage, version, base_version, name, created, questions, findings, "
+                              "base_report FROM versions WHERE context=? ORDER BY created DESC LIMIT ?",
+                              (context, scan)).fetchall()
+        best = None
+        for row in rows:
+            diff = diff_questions(json.loads(row[6]), questions)
+            if diff.overlap >= MIN_OVERLAP and (best is None or diff.overlap > best[1].overlap):
+                best = (row, diff)
+        if best is None: return None
+        row, diff = best
+        record = {"id": row[0], "lineage": row[1], "version": row[2], "base_version": row[3], "name": row[4],
+                  "created": row[5], "findings": json.loads(row[7]), "base_report": row[8]}
+        return record, diff
+
+    def add(self, context, name, questions, findings, base_report, previous=None, full=True):
+        # full：完整審查 (本版報告即為之後修訂版的文字分析來源)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM versions WHERE created < ?", (now - self.retention,))
+            version = previous["version"] + 1 if previous else 1
+            base_version = version if full or not previous else previous["base_version"]
+            cur = db.execute("INSERT INTO versions (lineage, version, base_version, context, name, created, "
+                             "questions, findings, base_report) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (previous["lineage"] if previous else None, version, base_version, context, name, now,
+                              json.dumps(questions), json.dumps(findings, ensure_ascii=False), base_report))
+            if not previous: db.execute("UPDATE versions SET lineage=id WHERE id=?", (cur.lastrowid,))
+        return version
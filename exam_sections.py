@@ -0,0 +1,92 @@
+import re
+
+# --- 長試卷依大題分段 (一、二、三… / 壹、貳… / 第一大題) ---
+# 超過單次 Prompt 上限的試卷不再截斷：依大題切段、相鄰大題合併到段落上限，
+# 單一大題過長時再依題號切開，確保每一題都會被審查到。
+
+_CN_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9,
+              "壹": 1, "貳": 2, "參": 3, "肆": 4, "伍": 5, "陸": 6, "柒": 7, "捌": 8, "玖": 9}
+_MAJOR_HEADING = re.compile(r'^\s*(?:第\s*([一二三四五六七八九十]{1,3})\s*大題|'
+                            r'([一二三四五六七八九十]{1,3}|[壹貳參肆伍陸柒捌玖拾]{1,3})\s*[、．.])')
+_QUESTION_START = re.compile(r'^\s*[（(]?\s*\d{1,3}\s*[)）.、．]')
+HEADER_CHARS = 1500
+
+
+def cn_number(s):
+    # 一 ~ 九十九 (含 壹/拾 大寫)
+    s = s.replace("拾", "十")
+    if s == "十": return 10
+    if "十" in s:
+        tens, _, ones = s.partition("十")
+        return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    return _CN_DIGITS.get(s)
+
+
+def heading_number(line):
+    m = _MAJOR_HEADING.match(line)
+    if not m: return None
+    return cn_number(m.group(1) or m.group(2))
+
+
+def find_sections(text):
+    # 回傳 (開頭文字, [(大題標題, 大題文字)])；大題編號須連續遞增，避免把題目內的條列誤判為大題
+    lines = text.split("\n")
+    starts, expected = [], None
+    for i, line in enumerate(lines):
+        n = heading_number(line)
+        if n is None: continue
+        if (expected is None and n <= 2) or n == expected:
+            starts.append(i)
+            expected = n + 1
+    if not starts: return text, []
+    header = "\n".join(lines[:starts[0]])
+    sections = []
+    for k, start in enumerate(starts):
+        end = starts[k + 1] if k + 1 < len(starts) else len(lines)
+        sections.append((lines[start].strip()[:30], "\n".join(lines[start:end])))
+    return header, sections
+
+
+def _split_long(label, text, max_chars):
+    # 單一大題超過上限：在題號處切開，找不到題號就依行切
+    lines = text.split("\n")
+    parts, buf, size = [], [], 0
+    for line in lines:
+        if buf and size + len(line) > max_chars and (_QUESTION_START.match(line) or size > max_chars * 1.2):
+            parts.append("\n".join(buf))
+            buf, size = [], 0
+        buf.append(line)
+        size += len(line) + 1
+    if buf: parts.append("\n".join(buf))
+    return [(label if i == 0 else f"{label} (續 {i + 1})", p) for i, p in enumerate(parts)]
+
+
+def split_exam_sections(text, max_chars=12000):
+    # 回傳 (開頭文字, [(段落標籤, 段落文字)])，每段不超過 max_chars (單題過長時例外)
+    header, sections = find_sections(text)
+    if not sections:
+        header, sections = "", [("全卷", text)]
+    elif len(header) > HEADER_CHARS:
+        # 開頭太長 (例如第一個大題前就有閱讀文本)，本身當作一段審查
+        sections.insert(0, ("卷首", header))
+        header = header[:HEADER_CHARS]
+
+    pieces = []
+    for label, body in sections:
+        pieces.extend(_split_long(label, body, max_chars) if len(body) > max_chars else [(label, body)])
+
+    # 相鄰大題合併，減少呼叫次數
+    groups, labels, buf, size = [], [], [], 0
+    for label, body in pieces:
+        if buf and size + len(body) > max_chars:
+            groups.append((_group_label(labels), "\n".join(buf)))
+            labels, buf, size = [], [], 0
+        labels.append(label)
+        buf.append(body)
+        size += len(body) + 1
+    if buf: groups.append((_group_label(labels), "\n".join(buf)))
+    return header, groups
+
+
+def _group_label(labels):
+    return labels[0] if len(labels) == 1 else f"{labels[0]} ～ {labels[-1]}"
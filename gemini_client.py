@@ -0,0 +1,203 @@
+import time
+import hashlib
+import logging
+import datetime
+import threading
+
+from retrieval import estimate_tokens
+
+# --- Gemini 連線與 context cache 管理 ---
+# API key 只設定一次、GenerativeModel 重複使用；系統指令 + 比對基準上傳為 Gemini context cache
+# (依內容雜湊命名，到期前自動延長)，同科目的後續審題只需送出試卷本身。
+# 後端可替換 (gemini_fake.FakeGeminiBackend)，不需網路即可測試。
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "exam-review-"
+# context cache 建立失敗後，這段時間內不再嘗試 (例如模型不支援或額度不足)
+RETRY_AFTER_FAILURE = 600
+_ADOPT = None    # _pending 中「列出既有 cache」的 key
+
+
+class CachedContext:
+    def __init__(self, name, display_name, model_name, expire_at, handle=None):
+        self.name = name
+        self.display_name = display_name
+        self.model_name = model_name
+        self.expire_at = expire_at    # epoch 秒
+        self.handle = handle
+        self.model = None
+
+
+class GenaiBackend:
+    # google.generativeai 的薄包裝 (延後匯入)
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+
+    def model(self, model_name, system_instruction=None):
+        return self._genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+    def _wrap(self, cache):
+        return CachedContext(cache.name, cache.display_name, cache.model, cache.expire_time.timestamp(), cache)
+
+    def create_cache(self, model_name, display_name, system_instruction, contents, ttl):
+        from google.generativeai import caching
+        cache = caching.CachedContent.create(
+            model=model_name, display_name=display_name, system_instruction=system_instruction,
+            contents=contents, ttl=datetime.timedelta(seconds=ttl))
+        return self._wrap(cache)
+
+    def list_caches(self):
+        from google.generativeai import caching
+        return [self._wrap(c) for c in caching.CachedContent.list()]
+
+    def extend_cache(self, ctx, ttl):
+        ctx.handle.update(ttl=datetime.timedelta(seconds=ttl))
+        ctx.expire_at = ctx.handle.expire_time.timestamp()
+
+    def delete_cache(self, ctx):
+        ctx.handle.delete()
+
+    def model_from_cache(self, ctx):
+        return self._genai.GenerativeModel.from_cached_content(cached_content=ctx.handle)
+
+
+def _model_id(name):
+    return name if name.startswith("models/") else f"models/{name}"
+
+
+class GeminiClient:
+    def __init__(self, api_key=None, model_name="models/gemini-3-pro-preview", context_cache=True,
+                 cache_ttl=3600, min_cache_tokens=4096, backend=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.context_cache = context_cache
+        self.cache_ttl = cache_ttl
+        self.min_cache_tokens = min_cache_tokens
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._models = {}
+        self._contexts = {}
+        self._adopted = False
+        self._pending = {}
+        self._failed_until = 0.0
+
+    def backend(self):
+        with self._lock:
+            if self._backend is None: self._backend = GenaiBackend(self.api_key)
+            return self._backend
+
+    def model(self, system_instruction=None, model_name=None):
+        # 不經 context cache 的共用 model (model_name 可指定其他型號，例如備援模型)
+        backend = self.backend()
+        key = (model_name or self.model_name, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._models[key] = backend.model(key[0], system_instruction)
+            return model
+
+    def caching_available(self):
+        return bool(self.context_cache) and time.time() >= self._failed_until
+
+    def context_key(self, system_instruction, reference):
+        h = hashlib.sha256()
+        for part in (_model_id(self.model_name), system_instruction or "", reference or ""):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()[:40]
+
+    def _claim(self, key):
+        # 須持有 self._lock；回傳 (Event, 是否由本請求負責)。同一個 key 只有一個請求連線，其他請求等待 Event
+        pending = self._pending.get(key)
+        if pending is not None: return pending, False
+        pending = self._pending[key] = threading.Event()
+        return pending, True
+
+    def _release(self, key):
+        with self._lock: self._pending.pop(key).set()
+
+    def _adopt_existing(self, backend):
+        # 程序重啟後沿用伺服器上尚未到期的 cache，不重複上傳 (只列出一次，列出時不持有 lock)
+        with self._lock:
+            if self._adopted: return
+            pending, owner = self._claim(_ADOPT)
+        if not owner:
+            pending.wait()
+            return
+        try:
+            try: caches = backend.list_caches()
+            except Exception as e:
+                logger.warning("context cache listing failed: %s", e)
+                caches = []
+            with self._lock:
+                for ctx in caches:
+                    if (ctx.display_name or "").startswith(CACHE_PREFIX) and _model_id(ctx.model_name or "") == _model_id(self.model_name):
+                        self._contexts.setdefault(ctx.display_name[len(CACHE_PREFIX):], ctx)
+                self._adopted = True
+        finally:
+            self._release(_ADOPT)
+
+    def context_model(self, system_instruction, reference):
+        # 回傳 (model, 狀態)；狀態 "hit" / "created" / "off" (回傳 None 時由呼叫端改送完整內容)
+        # lock 只保護 _contexts；列出 / 建立 / 延長 cache 的網路呼叫不持有 lock，其他科目的審題不必等待
+        if not reference or not self.caching_available(): return None, "off"
+        if estimate_tokens(system_instruction + reference) < self.min_cache_tokens: return None, "off"
+        backend = self.backend()
+        key = self.context_key(system_instruction, reference)
+        self._adopt_existing(backend)
+        while True:
+            with self._lock:
+                now = time.time()
+                for k in [k for k, c in self._contexts.items() if c.expire_at - now < 60]:
+                    del self._contexts[k]
+                ctx = self._contexts.get(key)
+                if ctx is None:
+                    pending, create = self._claim(key)
+                else:
+                    # 常用的比對基準到期前延長，避免中途失效重新上傳 (已有請求在延長時不重複)
+                    if ctx.model is None: ctx.model = backend.model_from_cache(ctx)
+                    model = ctx.model
+                    extend = ctx.expire_at - now < self.cache_ttl / 2 and key not in self._pending
+                    if extend: self._claim(key)
+            if ctx is not None: break
+            if create: return self._create_context(backend, key, system_instruction, reference)
+            # 同一份比對基準正由其他請求上傳：等待完成後重新查詢 (上傳失敗時改送完整內容)
+            pending.wait()
+            if not self.caching_available(): return None, "off"
+        if extend:
+            try: backend.extend_cache(ctx, self.cache_ttl)
+            except Exception as e: logger.warning("context cache extend failed: %s", e)
+            finally: self._release(key)
+        return model, "hit"
+
+    def _create_context(self, backend, key, system_instruction, reference):
+        try:
+            ctx = backend.create_cache(self.model_name, CACHE_PREFIX + key, system_instruction,
+                                       [reference], self.cache_ttl)
+            ctx.model = backend.model_from_cache(ctx)
+            with self._lock: self._contexts[key] = ctx
+            return ctx.model, "created"
+        except Exception as e:
+            logger.warning("context cache creation failed: %s", e)
+            with self._lock: self._failed_until = time.time() + RETRY_AFTER_FAILURE
+            return None, "off"
+        finally:
+            self._release(key)
+
+    def generation_target(self, prompt):
+        # prompt 為 prompts.ReviewPrompt；回傳 (model, contents, context cache 狀態)
+        model, status = self.context_model(prompt.system, prompt.reference)
+        if model is not None: return model, prompt.message, status
+        return self.model(prompt.system), prompt.contents(), status
+
+    def drop_contexts(self):
+        # 刪除本程序建立或沿用的所有 context cache
+        backend = self.backend()
+        with self._lock:
+            contexts, self._contexts = list(self._contexts.values()), {}
+        for ctx in contexts:
+            try: backend.delete_cache(ctx)
+            except Exception as e: logger.warning("context cache delete failed: %s", e)
@@ -0,0 +1,111 @@
+import time
+import threading
+from types import SimpleNamespace
+
+from retrieval import estimate_tokens
+from gemini_client import CachedContext
+
+# --- 本機假 Gemini 後端 (不需網路 / API key) ---
+# 與 gemini_client.GenaiBackend 介面相同，用於測試與離線效能量測：
+# 記錄呼叫次數、依內容估算 token 用量 (含 context cache 命中的 token)，並可模擬延遲與錯誤：
+# model_latency / model_errors 依模型名稱覆寫延遲或固定拋出錯誤；errors 為依序拋出一次的暫時性錯誤。
+
+DEFAULT_REPORT = """### Step 1: 【命題範圍與合規性檢核】
+✅ 本大項全數通過，無異常試題。
+
+### Step 2: 【題幹與邏輯品質審查】
+✅ 本大項全數通過，無異常試題。
+
+### Step 6: 【總結與建議】
+* 題目敘述清楚，建議增加情境題。
+"""
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    def __init__(self, text, usage, chunks):
+        self.text = text
+        self.usage_metadata = usage
+        self._chunks = chunks
+
+    def __iter__(self):
+        for piece in self._chunks: yield _Chunk(piece)
+
+
+class FakeModel:
+    def __init__(self, backend, system_instruction=None, context=None, model_name=None):
+        self.backend = backend
+        self.system_instruction = system_instruction or ""
+        self.context = context
+        self.model_name = model_name or (context.model_name if context else None)
+
+    def generate_content(self, contents, stream=False, request_options=None, generation_config=None):
+        text = contents if isinstance(contents, str) else "\n".join(contents)
+        cached = self.context.tokens if self.context else 0
+        fresh = estimate_tokens(text) + (0 if self.context else estimate_tokens(self.system_instruction))
+        b = self.backend
+        with b.lock:
+            b.calls.append({"contents": text, "cached_tokens": cached, "input_tokens": fresh,
+                            "context": self.context.name if self.context else None, "model": self.model_name,
+                            "schema": bool(generation_config and generation_config.get("response_schema"))})
+            error = b.errors.pop(0) if b.errors else b.model_errors.get(self.model_name, b.error)
+        if error: raise error
+        # 首段延遲與未快取的輸入量成正比，模擬 prefill 時間
+        latency = b.model_latency.get(self.model_name, b.base_latency)
+        time.sleep(latency + fresh / 1000 * b.seconds_per_1k_input)
+        report = b.reply(text) if callable(b.reply) else b.reply
+        usage = SimpleNamespace(prompt_token_count=fresh + cached, candidates_token_count=estimate_tokens(report),
+                                cached_content_token_count=cached)
+        chunks = [report[i:i + 200] for i in range(0, len(report), 200)]
+        return FakeResponse(report, usage, chunks)
+
+
+class FakeGeminiBackend:
+    def __init__(self, reply=DEFAULT_REPORT, base_latency=0.0, seconds_per_1k_input=0.0, clock=time.time):
+        self.reply = reply
+        self.base_latency = base_latency
+        self.seconds_per_1k_input = seconds_per_1k_input
+        self.clock = clock
+        self.error = None
+        self.errors = []
+        self.model_errors = {}
+        self.model_latency = {}
+        self.lock = threading.Lock()
+        self.calls = []
+        self.caches = {}
+        self.created = 0
+        self.extended = 0
+
+    def model(self, model_name, system_instruction=None):
+        return FakeModel(self, system_instruction, model_name=model_name)
+
+    def create_cache(self, model_name, display_name, system_instruction, contents, ttl):
+        with self.lock:
+            self.created += 1
+            ctx = CachedContext(f"cachedContents/fake-{self.created}", display_name, model_name, self.clock() + ttl)
+            ctx.tokens = estimate_tokens(system_instruction + "".join(contents))
+            ctx.system_instruction = system_instruction
+            self.caches[ctx.name] = ctx
+        return ctx
+
+    def list_caches(self):
+        now = self.clock()
+        with self.lock: return [c for c in self.caches.values() if c.expire_at > now]
+
+    def extend_cache(self, ctx, ttl):
+        with self.lock:
+            self.extended += 1
+            ctx.expire_at = self.clock() + ttl
+
+    def delete_cache(self, ctx):
+        with self.lock: self.caches.pop(ctx.name, None)
+
+    def model_from_cache(self, ctx):
+        return FakeModel(self, ctx.system_instruction, ctx)
+
+    def input_tokens(self):
+        return sum(c["input_tokens"] for c in self.calls)
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from disk_cache import DEFAULT_CACHE_ROOT
+
+# --- 背景審題工作 ---
+# 審題在全程序共用的執行緒池中執行，不隨 Streamlit rerun / 瀏覽器斷線中止；
+# 工作狀態 (queued / running / done / failed) 與結果存在本機，任何工作階段都能以工作編號重新接上。
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobStore:
+    def __init__(self, root=None):
+        self.root = root or os.path.join(DEFAULT_CACHE_ROOT, "jobs")
+        os.makedirs(os.path.join(self.root, "files"), exist_ok=True)
+        self._db_path = os.path.join(self.root, "jobs.sqlite3")
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT, title TEXT, owner TEXT, status TEXT,
+                created REAL, updated REAL, log TEXT, error TEXT, result TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def _file(self, job_id, name):
+        return os.path.join(self.root, "files", f"{job_id}.{name}")
+
+    def create(self, kind, title, owner=None):
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (job_id, kind, title, owner, QUEUED, now, now, "[]", None, None))
+        return job_id
+
+    def set_status(self, job_id, status, error=None):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status=?, error=?, updated=? WHERE id=?",
+                       (status, error, time.time(), job_id))
+
+    def set_log(self, job_id, messages):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET log=?, updated=? WHERE id=?",
+                       (json.dumps(messages, ensure_ascii=False), time.time(), job_id))
+
+    def save_result(self, job_id, meta, blobs):
+        # meta：可 JSON 序列化的結果；blobs：{名稱: bytes} 另存檔案
+        for name, data in blobs.items():
+            tmp = self._file(job_id, name) + ".tmp"
+            with open(tmp, "wb") as f: f.write(data)
+            os.replace(tmp, self._file(job_id, name))
+        record = {"meta": meta, "blobs": sorted(blobs)}
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET result=?, status=?, updated=? WHERE id=?",
+                       (json.dumps(record, ensure_ascii=False), DONE, time.time(), job_id))
+
+    def load_result(self, job_id):
+        job = self.get(job_id)
+        if not job or not job["result"]: return None, {}
+        blobs = {}
+        for name in job["result"]["blobs"]:
+            try:
+                with open(self._file(job_id, name), "rb") as f: blobs[name] = f.read()
+            except OSError: pass
+        return job["result"]["meta"], blobs
+
+    def result_files(self, job_id):
+        # 只回傳結果檔路徑 (供畫面依需要讀取)，不把檔案內容讀進記憶體
+        job = self.get(job_id)
+        if not job or not job["result"]: return None, {}
+        paths = {name: self._file(job_id, name) for name in job["result"]["blobs"]}
+        return job["result"]["meta"], {name: p for name, p in paths.items() if os.path.exists(p)}
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT id, kind, title, owner, status, created, updated, log, error, result "
+                             "FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def recent(self, limit=10, owner=None):
+        query = "SELECT id, kind, title, owner, status, created, updated, log, error, result FROM jobs"
+        args = []
+        if owner:
+            query += " WHERE owner=?"
+            args.append(owner)
+        query += " ORDER BY created DESC LIMIT ?"
+        args.append(limit)
+        with self._connect() as db: rows = db.execute(query, args).fetchall()
+        return [self._row(r) for r in rows]
+
+    def _row(self, row):
+        keys = ["id", "kind", "title", "owner", "status", "created", "updated", "log", "error", "result"]
+        job = dict(zip(keys, row))
+        job["log"] = json.loads(job["log"] or "[]")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def mark_interrupted(self):
+        # 程序重啟時，上一個程序中未完成的工作已不可能完成
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status=?, error=?, updated=? WHERE status IN (?, ?)",
+                       (FAILED, "系統重新啟動，工作已中斷，請重新送出。", time.time(), QUEUED, RUNNING))
+
+    def purge(self, max_age):
+        cutoff = time.time() - max_age
+        with self._connect() as db:
+            rows = db.execute("SELECT id, result FROM jobs WHERE created < ? AND status IN (?, ?)",
+                              (cutoff, DONE, FAILED)).fetchall()
+            db.execute("DELETE FROM jobs WHERE created < ? AND status IN (?, ?)", (cutoff, DONE, FAILED))
+        for job_id, result in rows:
+            for name in (json.loads(result)["blobs"] if result else []):
+                try: os.remove(self._file(job_id, name))
+                except OSError: pass
+
+
+class JobContext:
+    # 傳給工作函式：progress() 累積狀態訊息、on_text() 更新串流中的報告片段、
+    # notice() 顯示會被覆寫的即時狀態 (例如排隊位置)，傳 None 清除
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self.messages = []
+        self._last_flush = 0.0
+
+    def progress(self, message, level="info"):
+        self.messages.append({"level": level, "message": message})
+        now = time.monotonic()
+        if now - self._last_flush >= 0.5:
+            self.flush()
+            self._last_flush = now
+
+    def flush(self):
+        self.runner.store.set_log(self.job_id, self.messages)
+
+    def on_text(self, partial, ttft=None):
+        self.runner._partials[self.job_id] = partial
+
+    def notice(self, message):
+        if message: self.runner._notices[self.job_id] = message
+        else: self.runner._notices.pop(self.job_id, None)
+
+
+class JobRunner:
+    def __init__(self, store=None, max_workers=2, retention_hours=72):
+        self.store = store or JobStore()
+        self.retention = retention_hours * 3600
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="review-job")
+        self._partials = {}
+        self._notices = {}
+        self.store.mark_interrupted()
+        self.store.purge(self.retention)
+
+    def submit(self, kind, title, fn, owner=None):
+        # fn(ctx) 回傳 (meta, blobs)，meta 需可 JSON 序列化
+        job_id = self.store.create(kind, title, owner)
+        self._pool.submit(self._run, job_id, fn)
+        try: self.store.purge(self.retention)
+        except Exception as e: logger.warning("job purge failed: %s", e)
+        return job_id
+
+    def _run(self, job_id, fn):
+        ctx = JobContext(self, job_id)
+        self.store.set_status(job_id, RUNNING)
+        try:
+            meta, blobs = fn(ctx)
+            ctx.flush()
+            self.store.save_result(job_id, meta, blobs)
+        except Exception as e:
+            logger.exception("job %s failed", job_id)
+            ctx.progress(f"❌ {e}", "error")
+            ctx.flush()
+            self.store.set_status(job_id, FAILED, error=str(e))
+        finally:
+            self._partials.pop(job_id, None)
+            self._notices.pop(job_id, None)
+
+    def partial(self, job_id):
+        return self._partials.get(job_id)
+
+    def notice(self, job_id):
+        return self._notices.get(job_id)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from disk_cache import DEFAULT_CACHE_ROOT
+
+# --- 審題效能紀錄：各階段耗時、字數與 token 用量 ---
+# 每次審題建立一個 ReviewTrace，流程中以 span("階段") 計時；結束時寫入本機 SQLite，
+# 供管理頁面統計各階段 p50/p95 與每日 token 用量。
+
+_current_trace = contextvars.ContextVar("review_trace", default=None)
+
+
+class ReviewTrace:
+    def __init__(self, kind="single"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.stages = {}
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock: self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def set(self, key, value):
+        with self._lock: self.values[key] = value
+
+    def add(self, key, value):
+        with self._lock: self.values[key] = self.values.get(key, 0) + (value or 0)
+
+    def add_usage(self, usage):
+        # Gemini 回應的 usage_metadata (prompt_token_count / candidates_token_count)
+        if usage is None: return
+        self.add("prompt_tokens", getattr(usage, "prompt_token_count", 0))
+        self.add("response_tokens", getattr(usage, "candidates_token_count", 0))
+        self.add("cached_tokens", getattr(usage, "cached_content_token_count", 0))
+
+    def total_seconds(self):
+        return time.perf_counter() - self._t0
+
+
+@contextmanager
+def start_trace(kind="single"):
+    trace = ReviewTrace(kind)
+    token = _current_trace.set(trace)
+    try: yield trace
+    finally: _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    try: yield
+    finally:
+        if trace is not None: trace.add_stage(name, time.perf_counter() - start)
+
+
+def record(key, value):
+    trace = _current_trace.get()
+    if trace is not None: trace.set(key, value)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values: return None
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class MetricsLog:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_ROOT, "metrics.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS reviews (
+                id TEXT PRIMARY KEY, ts REAL, day TEXT, kind TEXT, status TEXT, model TEXT,
+                cached INTEGER, total_ms REAL, prompt_tokens INTEGER, response_tokens INTEGER,
+                cached_tokens INTEGER, detail TEXT)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS stages (
+                review_id TEXT, stage TEXT, ms REAL)""")
+            # 結構化審題結果的逐題問題 (全校常見問題統計)
+            db.execute("""CREATE TABLE IF NOT EXISTS findings (
+                review_id TEXT, ts REAL, exam TEXT, subject TEXT, grade TEXT, question TEXT,
+                step TEXT, type TEXT, severity TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_reviews_ts ON reviews(ts)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_findings_ts ON findings(ts)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_stages_review ON stages(review_id)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def write(self, trace, status="ok", model=None, cached=False):
+        v = trace.values
+        day = datetime.date.fromtimestamp(trace.started).isoformat()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                trace.id, trace.started, day, trace.kind, status, model, int(bool(cached)),
+                trace.total_seconds() * 1000, int(v.get("prompt_tokens", 0)),
+                int(v.get("response_tokens", 0)), int(v.get("cached_tokens", 0)),
+                json.dumps(v, ensure_ascii=False, default=str)))
+            db.executemany("INSERT INTO stages VALUES (?, ?, ?)",
+                           [(trace.id, name, sec * 1000) for name, sec in trace.stages.items()])
+
+    def write_findings(self, review_id, exam, exam_meta, data):
+        # data：review_schema.ReviewData
+        now = time.time()
+        with self._connect() as db:
+            db.execute("DELETE FROM findings WHERE review_id = ? AND exam = ?", (review_id, exam))
+            db.executemany("INSERT INTO findings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (review_id, now, exam, exam_meta.get("subject"), exam_meta.get("grade"), i.question, i.step,
+                 i.type, i.severity) for i in data.issues])
+
+    def finding_summary(self, days=90, limit=30):
+        # 依科目 / 步驟 / 問題類型彙整，出現次數多的在前
+        since = time.time() - days * 86400
+        with self._connect() as db:
+            rows = db.execute("""SELECT subject, step, type, COUNT(*), SUM(severity = 'error'),
+                                        COUNT(DISTINCT review_id || '|' || exam)
+                                 FROM findings WHERE ts >= ? GROUP BY subject, step, type
+                                 ORDER BY COUNT(*) DESC LIMIT ?""", (since, limit)).fetchall()
+        steps = {"scope": "Step 1 命題範圍", "quality": "Step 2 題幹與邏輯"}
+        return [{"科目": subject or "-", "步驟": steps.get(step, step), "問題類型": kind, "次數": n,
+                 "必須修改": errors or 0, "試卷份數": exams} for subject, step, kind, n, errors, exams in rows]
+
+    def stage_percentiles(self, days=30):
+        since = time.time() - days * 86400
+        with self._connect() as db:
+            rows = db.execute("""SELECT s.stage, s.ms FROM stages s JOIN reviews r ON r.id = s.review_id
+                                 WHERE r.ts >= ?""", (since,)).fetchall()
+            totals = db.execute("SELECT total_ms FROM reviews WHERE ts >= ? AND cached = 0",
+                                (since,)).fetchall()
+        by_stage = {}
+        for stage, ms in rows: by_stage.setdefault(stage, []).append(ms)
+        by_stage["(整體，不含快取)"] = [ms for (ms,) in totals]
+        result = []
+        for stage, values in sorted(by_stage.items()):
+            values.sort()
+            if not values: continue
+            result.append({"階段": stage, "次數": len(values),
+                           "p50 (秒)": round(_percentile(values, 0.5) / 1000, 2),
+                           "p95 (秒)": round(_percentile(values, 0.95) / 1000, 2)})
+        return result
+
+    def daily_usage(self, days=30):
+        since = time.time() - days * 86400
+        with self._connect() as db:
+            rows = db.execute("""SELECT day, COUNT(*), SUM(cached), SUM(prompt_tokens),
+                                        SUM(response_tokens), SUM(cached_tokens)
+                                 FROM reviews WHERE ts >= ? GROUP BY day ORDER BY day""",
+                              (since,)).fetchall()
+        return [{"日期": day, "審題次數": n, "快取命中": hits or 0, "輸入 tokens": p or 0,
+                 "輸出 tokens": r or 0, "快取 tokens": c or 0} for day, n, hits, p, r, c in rows]
+
+    def recent(self, limit=50):
+        with self._connect() as db:
+            rows = db.execute("""SELECT ts, kind, status, model, cached, total_ms, prompt_tokens,
+                                        response_tokens, detail FROM reviews ORDER BY ts DESC LIMIT ?""",
+                              (limit,)).fetchall()
+        out = []
+        for ts, kind, status, model, cached, total_ms, p, r, detail in rows:
+            row = {"時間": time.strftime("%m/%d %H:%M", time.localtime(ts)), "類型": kind, "狀態": status,
+                   "模型": model, "快取": bool(cached), "總耗時(秒)": round(total_ms / 1000, 1),
+                   "輸入 tokens": p, "輸出 tokens": r}
+            row.update(json.loads(detail or "{}"))
+            out.append(row)
+        return out
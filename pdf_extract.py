@@ -0,0 +1,164 @@
+import os
+import mmap
+import logging
+import tempfile
+import multiprocessing
+from io import BytesIO
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from text_normalize import normalize_pages
+
+# 嘗試匯入 PDF 讀取套件
+try:
+    from pypdf import PdfReader
+except ImportError:
+    from PyPDF2 import PdfReader
+
+# --- PDF 文字擷取引擎 (不依賴 Streamlit，可在子程序中執行) ---
+# 大型 PDF 依頁碼區段分給程序池平行解析；單頁失敗只記錄該頁，不影響整份文件；
+# 可只解析前 N 頁 (例如試卷資訊偵測只需要開頭)。
+# 有檔案路徑的來源 (本機檔 / 暫存上傳檔 / 快取的 Drive 原檔) 以 mmap 讀取，子程序只傳路徑。
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_TASK = 16
+PARALLEL_MIN_PAGES = 32
+# 超過此大小改以暫存檔路徑傳給子程序，避免每個區段都複製一份 PDF 內容
+INLINE_BYTES_LIMIT = 4 * 1024 * 1024
+
+_cpu_pool = None
+
+def get_cpu_pool(max_workers=None):
+    # 全程序共用一個解析程序池 (spawn 避免 fork 多執行緒的 Streamlit 程序)
+    global _cpu_pool
+    if _cpu_pool is None:
+        workers = max_workers or min(4, os.cpu_count() or 1)
+        _cpu_pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _cpu_pool
+
+def reset_cpu_pool():
+    global _cpu_pool
+    if _cpu_pool is not None: _cpu_pool.shutdown(wait=False, cancel_futures=True)
+    _cpu_pool = None
+
+def _in_worker():
+    # 已在子程序中 (例如多份教材平行解析) 就不再開第二層程序池
+    return multiprocessing.parent_process() is not None
+
+
+class PdfText:
+    def __init__(self, pages, failures, total_pages):
+        self.pages = pages
+        self.failures = failures      # [(頁碼 (1 起算), 錯誤訊息)]
+        self.total_pages = total_pages
+
+    @property
+    def text(self):
+        return "".join(page + "\n" for page in self.pages)
+
+    def normalized(self):
+        # 去除跨頁重複的頁首頁尾、填充字元並 NFKC (回傳 NormalizedText，含節省的字數 / token)
+        return normalize_pages(self.pages)
+
+
+def _read_bytes(file):
+    if isinstance(file, (bytes, bytearray)): return bytes(file)
+    if hasattr(file, "getvalue"): return file.getvalue()
+    return file.read()
+
+
+def _source_path(file):
+    if isinstance(file, str): return file
+    return getattr(file, "path", None)
+
+
+@contextmanager
+def _open_pdf(file):
+    # 回傳 (子程序可用的來源：路徑或 bytes, 可讀取的串流)
+    path = _source_path(file)
+    if path is None:
+        data = _read_bytes(file)
+        yield data, BytesIO(data)
+        return
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield path, BytesIO(b"")
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield path, mm
+
+
+def _extract_pages(reader, start, stop):
+    pages, failures = [], []
+    for i in range(start, stop):
+        try:
+            pages.append(reader.pages[i].extract_text() or "")
+        except Exception as e:
+            pages.append("")
+            failures.append((i + 1, f"{type(e).__name__}: {e}"))
+    return pages, failures
+
+
+def _extract_range(source, start, stop):
+    # 子程序進入點：source 為 PDF bytes 或檔案路徑
+    reader = PdfReader(source if isinstance(source, str) else BytesIO(source))
+    return _extract_pages(reader, start, stop)
+
+
+def _extract_parallel(reader, source, n):
+    tmp_path = None
+    if not isinstance(source, str) and len(source) > INLINE_BYTES_LIMIT:
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f: f.write(source)
+        source = tmp_path
+    try:
+        ranges = [(s, min(s + PAGES_PER_TASK, n)) for s in range(0, n, PAGES_PER_TASK)]
+        try:
+            pool = get_cpu_pool()
+            futures = [pool.submit(_extract_range, source, s, e) for s, e in ranges]
+            return [f.result() for f in futures]
+        except BrokenProcessPool:
+            reset_cpu_pool()
+            return [_extract_pages(reader, s, e) for s, e in ranges]
+    finally:
+        if tmp_path:
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+
+def extract_pdf_pages(file, max_pages=None, parallel=None):
+    with _open_pdf(file) as (source, stream):
+        reader = PdfReader(stream)
+        total = len(reader.pages)
+        n = min(total, max_pages) if max_pages else total
+        if parallel is None:
+            parallel = n >= PARALLEL_MIN_PAGES and (os.cpu_count() or 1) > 1 and not _in_worker()
+        if not parallel:
+            pages, failures = _extract_pages(reader, 0, n)
+            return PdfText(pages, failures, total)
+        parts = _extract_parallel(reader, source, n)
+
+    pages, failures = [], []
+    for p, f in parts:
+        pages.extend(p)
+        failures.extend(f)
+    return PdfText(pages, failures, total)
+
+
+def extract_pdf_text(file, max_pages=None, normalize=False):
+    try:
+        result = extract_pdf_pages(file, max_pages=max_pages)
+    except Exception as e:
+        logger.warning("PDF extraction failed: %s", e)
+        return ""
+    if result.failures:
+        logger.warning("PDF extraction: %d/%d pages failed (%s)", len(result.failures),
+                       len(result.pages), ", ".join(str(p) for p, _ in result.failures[:10]))
+    return result.normalized().text if normalize else result.text
+
+def extract_pdf_bytes(data):
+    # 教材與批次試卷：解析後直接正規化 (教材快取存的是正規化後的文字)
+    return extract_pdf_text(data, normalize=True)
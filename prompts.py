@@ -0,0 +1,299 @@
+# --- 審題 Prompt 範本 (V12.2：固定系統指令 + 比對基準 + 試卷) ---
+# 範本內容有任何修改時請調高 PROMPT_VERSION，審題結果快取會因此失效。
+# 系統指令與比對基準不含試卷內容，可整段上傳為 Gemini context cache；每次只送出試卷本身。
+
+PROMPT_VERSION = "12.5"
+# 單次 Prompt 送出的試卷字數上限；超過時改為依大題分段審查再彙整 (map-reduce)
+EXAM_CHAR_LIMIT = 25000
+
+SYSTEM_INSTRUCTION = """
+# Role: 台灣國小教育評量暨素養導向命題專家
+
+# 角色定義
+你是一位精通「台灣教育部 108 課綱」與各版本教科書的資深教材審題專家。你的任務是審查使用者上傳的試卷，確保其符合教學進度、邏輯嚴謹，且具備真實的素養評量功能。
+
+## 1. 任務目標
+針對上傳的試卷進行專業審題，產出一份符合 Markdown 格式的審查報告。
+試卷資訊、考試範圍、審查嚴格度與「## 2. 審查基準」會隨每份試卷一併提供。
+
+## 3. 輸出規範 (Strict Output Rules)
+你必須嚴格遵守以下輸出規則，否則任務失敗：
+1. **例外報告 (Exception Reporting)**：在 Step 1 和 Step 2，**僅列出有問題** (❌超綱、⚠️疑義) 的題目。
+   - ⛔ **若該大項無任何問題，請直接輸出單行文字：「✅ 本大項全數通過，無異常試題。」**
+   - ⛔ **嚴禁**在無問題時繪製空表格或列出「通過」的題目。
+2. **格式要求**：
+   - 表格優先，檢核結果請務必使用 **Markdown Table** 呈現。
+   - 必須使用 Markdown 語法。
+   - 不要使用 Code Block (```) 包覆報告。
+   - 標題層級清楚 (###)。
+   - 視覺標示：使用 ✅、⚠️、❌ 進行視覺引導。
+
+## 4. 審查流程 (Analysis Workflow)
+請依序填寫以下報告內容：
+
+### Step 1: 【命題範圍與合規性檢核】 (Scope & Compliance)
+**[資料來源判定邏輯]**
+請依照以下**優先順序**決定審查基準：
+1.  **優先 (User Upload)**：若 `[使用者上傳教材]` 區塊有內容，以此為「唯一真理」進行比對。
+2.  **次要 (Database Fallback)**：若使用者未上傳，讀取 `[資料庫課綱基準]` 區塊。
+    * **解析與比對**：確認題目是否符合該年級/科目的「學習內容」與「學習表現」。
+
+**[檢核重點]**
+* **超綱判斷**：題目概念是否超出上述基準？
+* **課綱對應**：題目是否符合該領域的學習表現。
+* **輸出內容**：僅列出違規題目。若全數符合，請依「例外報告」規則處理。
+
+### Step 2: 【題幹與邏輯品質審查】 (Logic & Quality)
+* **邏輯封閉性**：單選題是否僅有唯一正解？選項間是否互斥？
+* **語意清晰度**：是否存在雙重否定、語意歧義或條件不足。
+* **誘答項檢核**：錯誤選項是否具備合理的誘答力。
+* **輸出內容**：僅列出有瑕疵題目。若全數符合，請依「例外報告」規則處理。
+
+### Step 3: 【素養導向深度審查】
+請依據科目類別，執行「真偽素養」辨識（生活課程請依內容屬性併入自然或社會判斷）：
+
+* **國語文**：
+    * ✅ **真素養**：需運用預測、推論、摘要策略；含連續/非連續文本。
+    * ⚠️ **假素養**：僅圈錯字或直接摘錄句子，未涉及層次思考。
+* **數學**：
+    * ✅ **真素養**：具備「數學建模」過程；情境數據符合現實邏輯。
+    * ⚠️ **假素養**：情境與算式無關（裝飾性）；數據違背常理。
+* **自然科學** (含生活-觀察體驗)：
+    * ✅ **真素養**：評量觀察、假設、實驗設計或數據解釋。
+    * ⚠️ **假素養**：答案可直接從文中複製，無需先備知識。
+* **社會** (含生活-人際環境)：
+    * ✅ **真素養**：評量多重觀點、史料判讀或社會參與。
+    * ⚠️ **假素養**：僅考碎片化記憶，缺乏因果分析。
+* **英語文**：
+    * ✅ **真素養**：符合真實語用 (Pragmatics)，模擬真實溝通。
+    * ⚠️ **假素養**：對話生硬，僅為考文法規則而堆砌。
+
+* **輸出內容**：列出具代表性的「✅ 真素養題」與「⚠️ 假素養題」並給予簡評。
+
+### Step 4: 【雙向細目表核算】
+若訊息附有【系統計算配分】：題數、配分與比重已由系統依試卷計算，**請勿自行計算或繪製雙向細目表**，
+只需輸出「題目分類表」，每題一列 (題號沿用【系統計算配分】的題目代號)，系統會據此產生雙向細目表：
+| 題號 | 單元名稱 | 認知層次 |
+|---|---|---|
+| (題目代號) | (填入) | (記憶/了解/應用/分析/評鑑/創造 擇一) |
+
+若未附【系統計算配分】，請務必繪製 Markdown 表格：
+| 單元名稱 | 記憶 | 了解 | 應用 | 分析 | 評鑑 | 創造 |
+|---|---|---|---|---|---|---|
+| (填入) | (填題號) | ... | ... | ... | ... | ... |
+| **分數比重** | % | % | % | % | % | % |
+*(注意：分數比重加總須為 100%)*
+
+### Step 5: 【難易度與負擔分析】
+* **無效難度檢查**：標註「計算過度繁瑣」但觀念簡單的題目。
+* **成績分佈預測**：依據題目難度 (L1易/L2中/L3難) 預測三種分數區間的學生表現。
+
+### Step 6: 【總結與建議】
+* 針對紅色警示 (❌) 的題目提出具體修改建議。
+* 給予命題教師 3-5 點總體優化建議。
+"""
+
+
+# --- 結構化輸出 (JSON)：第 3 節改為 JSON 規則，審查流程不變 ---
+STRUCTURED_OUTPUT_RULES = """## 3. 輸出規範 (Strict Output Rules)
+本次以 **JSON** 輸出審查結果 (欄位定義由系統提供)，系統會依此自動產生報告：
+1. 只輸出 JSON 物件，不要輸出 Markdown 報告或任何說明文字。
+2. 「## 4. 審查流程」各步驟對應的欄位：
+   - Step 1 → `issues` (step = "scope")；Step 2 → `issues` (step = "quality")：**僅列出有問題的題目**，全數通過時為空陣列。
+     severity：❌ 必須修改為 "error"、⚠️ 疑義為 "warning"；suggestion 填具體修改建議。
+   - Step 3 → `literacy`：具代表性的真 / 假素養題與簡評。
+   - Step 4 → `classification`：**每題一筆**，填單元名稱與認知層次；題數、配分、比重與雙向細目表由系統計算，勿自行計算。
+   - Step 5 → `difficulty`：只列難度 L3 或「計算過度繁瑣」的題目；`distribution`：成績分佈預測。
+   - Step 6 → `suggestions`：3-5 點總體優化建議 (個別題目的修改建議已寫在 issues 的 suggestion)。
+3. question 欄位一律填題目代號 (有【系統計算配分】時沿用其題目代號)，一筆只填一題。
+4. 「## 4. 審查流程」中關於 Markdown 表格或輸出格式的說明，一律改以上述欄位呈現。
+
+"""
+
+
+def _structured_instruction(system):
+    head, rest = system.split("## 3. 輸出規範", 1)
+    head = head.replace("產出一份符合 Markdown 格式的審查報告", "以 JSON 輸出逐題審查結果")
+    return head + STRUCTURED_OUTPUT_RULES + rest[rest.index("## 4. 審查流程"):]
+
+
+STRUCTURED_SYSTEM_INSTRUCTION = _structured_instruction(SYSTEM_INSTRUCTION)
+
+
+class ReviewPrompt:
+    # system：固定系統指令；reference：比對基準 (同科目可共用)；message：本份試卷
+    # schema：結構化輸出的 response_schema (None 為 Markdown 報告)
+    def __init__(self, system, reference, message, schema=None):
+        self.system = system
+        self.reference = reference
+        self.message = message
+        self.schema = schema
+
+    def contents(self):
+        # 未使用 context cache 時，比對基準與試卷一起送出
+        if not self.reference: return self.message
+        return f"{self.reference}\n---\n{self.message}"
+
+    def __len__(self):
+        return len(self.system) + len(self.reference) + len(self.message)
+
+
+def build_exam_message(exam_meta, exam_scope, strictness, scenario_msg, exam_text, score_block=""):
+    # score_block：exam_parser 本機計算的題數與配分 (無法解析時為空字串)
+    return f"""
+## 1. 任務目標
+**試卷資訊：** {exam_meta['info_str']}
+**考試範圍：** {exam_scope if exam_scope else "未指定"}
+**審查嚴格度：** {strictness}
+
+## 2. 審查基準 (Ground Truth)
+{scenario_msg}
+
+{score_block}
+---
+【試卷原始內容】：
+{exam_text[:EXAM_CHAR_LIMIT]}
+"""
+
+
+def _review_prompt(reference, message, structured):
+    if not structured: return ReviewPrompt(SYSTEM_INSTRUCTION, reference, message)
+    from review_schema import REVIEW_SCHEMA
+    return ReviewPrompt(STRUCTURED_SYSTEM_INSTRUCTION, reference, message, REVIEW_SCHEMA)
+
+
+def build_review_prompt(exam_meta, exam_scope, strictness, scenario_msg, ref_block, exam_text, score_block="",
+                        structured=False):
+    return _review_prompt(ref_block, build_exam_message(exam_meta, exam_scope, strictness, scenario_msg, exam_text,
+                                                        score_block), structured)
+
+
+# --- 長試卷分段審查 (map) 與彙整 (reduce) ---
+def build_section_message(exam_meta, exam_scope, strictness, scenario_msg, header, label, section_text, index, total,
+                          score_block=""):
+    return f"""
+## 1. 任務目標 (分段審查：第 {index}/{total} 段)
+**試卷資訊：** {exam_meta['info_str']}
+**考試範圍：** {exam_scope if exam_scope else "未指定"}
+**審查嚴格度：** {strictness}
+**本段範圍：** {label}
+
+本試卷較長，已依大題分段平行審查。請**只審查本段題目**，不要撰寫完整報告，
+依下列格式輸出本段審查紀錄 (題號沿用試卷原題號，並註明所屬大題)：
+### 本段 Step 1 違規題目
+(表格；若無問題輸出「✅ 本段全數通過」)
+### 本段 Step 2 瑕疵題目
+(表格；若無問題輸出「✅ 本段全數通過」)
+### 本段 Step 3 素養題
+(具代表性的 ✅ 真素養題 / ⚠️ 假素養題與簡評)
+### 本段 Step 4 細目表資料
+| 題號 | 單元名稱 | 認知層次 (記憶/了解/應用/分析/評鑑/創造) | 配分 |
+|---|---|---|---|
+### 本段 Step 5 難度
+(每題 L1/L2/L3，並標註計算過度繁瑣的題目)
+
+## 2. 審查基準 (Ground Truth)
+{scenario_msg}
+
+{score_block}
+---
+【試卷開頭 (僅供辨識，不需審查)】：
+{header}
+
+---
+【本段試卷內容】：
+{section_text}
+"""
+
+
+def build_section_prompt(exam_meta, exam_scope, strictness, scenario_msg, ref_block, header, label, section_text,
+                         index, total, score_block=""):
+    # 與整份審題相同的系統指令與比對基準，context cache 可共用
+    return ReviewPrompt(SYSTEM_INSTRUCTION, ref_block,
+                        build_section_message(exam_meta, exam_scope, strictness, scenario_msg,
+                                              header, label, section_text, index, total, score_block))
+
+
+def build_reduce_message(exam_meta, exam_scope, strictness, findings, failed_labels=(), score_block=""):
+    # findings: [(段落標籤, 分段審查紀錄)]
+    step4 = ("- Step 4：依【系統計算配分】的題目代號，將各段「細目表資料」合併為**一張**題目分類表 "
+             "(| 題號 | 單元名稱 | 認知層次 |)，勿自行計算配分或比重。" if score_block else
+             "- Step 4：將各段「細目表資料」合併為**一張**雙向細目表，依單元彙整題號，分數比重依配分重新計算 (加總須為 100%)。")
+    notes = ""
+    if failed_labels:
+        notes = f"\n- ⚠️ 以下段落審查失敗，請在 Step 6 註明需人工複核：{'、'.join(failed_labels)}"
+    records = "\n\n".join(f"#### 第 {i} 段：{label}\n{text}" for i, (label, text) in enumerate(findings, 1))
+    return f"""
+## 1. 任務目標 (彙整分段審查結果)
+**試卷資訊：** {exam_meta['info_str']}
+**考試範圍：** {exam_scope if exam_scope else "未指定"}
+**審查嚴格度：** {strictness}
+
+本試卷較長，已依大題分成 {len(findings) + len(failed_labels)} 段分別審查，以下為各段審查紀錄。
+請彙整為**一份完整報告**，依「## 4. 審查流程」Step 1 ～ Step 6 的格式輸出，並遵守「## 3. 輸出規範」：
+- Step 1、Step 2：合併各段的問題題目 (依題號排序)；全部段落皆無問題時依「例外報告」規則處理。
+- Step 3：從各段挑選最具代表性的真/假素養題。
+{step4}
+- Step 5、Step 6：以全卷角度綜合評估難易度、成績分佈與修改建議。{notes}
+
+{score_block}
+---
+【分段審查紀錄】：
+{records}
+"""
+
+
+def build_reduce_prompt(exam_meta, exam_scope, strictness, findings, failed_labels=(), score_block="",
+                        structured=False):
+    # 彙整只需要各段紀錄，不再送比對基準；分段紀錄維持 Markdown，結構化輸出只用在彙整
+    return _review_prompt("", build_reduce_message(exam_meta, exam_scope, strictness, findings, failed_labels,
+                                                   score_block), structured)
+
+
+# --- 修訂版試卷：只審查修改 / 新增的題目，其餘題目沿用上一版結果 ---
+def build_revision_message(exam_meta, exam_scope, strictness, scenario_msg, header, questions_text, qids,
+                           score_block=""):
+    # 各步驟一律以「題號」表格輸出 (一列一題)，系統依題號與上一版的逐題結果合併
+    return f"""
+## 1. 任務目標 (修訂版審查：只審查修改或新增的題目)
+**試卷資訊：** {exam_meta['info_str']}
+**考試範圍：** {exam_scope if exam_scope else "未指定"}
+**審查嚴格度：** {strictness}
+**本次審查題目：** {'、'.join(qids)}
+
+本試卷為修訂版，其餘題目已於上一版審查過。請**只審查下列題目**，不要撰寫完整報告，
+依下列格式輸出，每個表格的「題號」欄填上列題目代號、一列一題：
+### 本段 Step 1 違規題目
+| 題號 | 問題 | 說明 |
+(若無問題輸出「✅ 本段全數通過」)
+### 本段 Step 2 瑕疵題目
+| 題號 | 問題 | 說明 |
+(若無問題輸出「✅ 本段全數通過」)
+### 本段 Step 3 素養題
+| 題號 | 判定 (✅ 真素養 / ⚠️ 假素養) | 簡評 |
+(只列具代表性的題目，沒有則輸出「無」)
+### 本段 Step 4 細目表資料
+| 題號 | 單元名稱 | 認知層次 (記憶/了解/應用/分析/評鑑/創造) |
+### 本段 Step 5 難度
+| 題號 | 難度 (L1/L2/L3) | 說明 (計算過度繁瑣請註明) |
+
+## 2. 審查基準 (Ground Truth)
+{scenario_msg}
+
+{score_block}
+---
+【試卷開頭 (僅供辨識，不需審查)】：
+{header}
+
+---
+【本次審查題目】：
+{questions_text}
+"""
+
+
+def build_revision_prompt(exam_meta, exam_scope, strictness, scenario_msg, ref_block, header, questions_text, qids,
+                          score_block=""):
+    # 與整份審題相同的系統指令與比對基準，context cache 可共用
+    return ReviewPrompt(SYSTEM_INSTRUCTION, ref_block,
+                        build_revision_message(exam_meta, exam_scope, strictness, scenario_msg, header,
+                                               questions_text, qids, score_block))
@@ -0,0 +1,138 @@
+import time
+import threading
+import contextvars
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+# --- Gemini 額度控管 (全程序共用) ---
+# 每分鐘請求數 (RPM) 與每分鐘輸入 token (TPM) 各一個 token bucket；超過額度的呼叫排隊等待，
+# 而不是同時送出後一起收到 429。排隊依工作階段輪流 (每位老師各自 FIFO，輪到誰就放行誰的第一個)，
+# 一次送出大量批次的老師不會讓其他人一直等。等待中定期回報排隊位置與預估開始時間。
+
+_admission = contextvars.ContextVar("quota_admission", default=None)
+
+
+class _Bucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, amount):
+        # 還要多久才夠 amount (level 可為負：重試或實際用量超出估計時先欠著)
+        return max(0.0, (amount - self.level) / self.rate) if self.rate else 0.0
+
+
+class _Ticket:
+    def __init__(self, owner, tokens):
+        self.owner = owner
+        self.tokens = tokens
+
+
+class QuotaGovernor:
+    def __init__(self, rpm=60, tpm=1_000_000, report_interval=2.0):
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self.report_interval = report_interval
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()    # owner -> deque[_Ticket]，順序即輪流順序
+        self._paused_until = 0.0
+
+    @property
+    def enabled(self):
+        return self.requests is not None or self.tokens is not None
+
+    def _refill(self, now):
+        for b in (self.requests, self.tokens):
+            if b: b.refill(now)
+
+    def _cost(self, ticket):
+        # 單一請求超過整個 TPM 時以 TPM 上限計，避免永遠排不到
+        return 1, min(ticket.tokens, self.tokens.capacity) if self.tokens else 0
+
+    def _order(self):
+        # 目前的放行順序：各工作階段輪流，每輪取各自佇列的下一個
+        queues = [list(q) for q in self._queues.values()]
+        order = []
+        for i in range(max((len(q) for q in queues), default=0)):
+            order += [q[i] for q in queues if i < len(q)]
+        return order
+
+    def _wait_seconds(self, now, tickets):
+        # 依序放行 tickets 全部所需時間 (粗估)
+        requests = sum(self._cost(t)[0] for t in tickets)
+        tokens = sum(self._cost(t)[1] for t in tickets)
+        wait = max(0.0, self._paused_until - now)
+        if self.requests: wait = max(wait, self.requests.wait_for(requests))
+        if self.tokens: wait = max(wait, self.tokens.wait_for(tokens))
+        return wait
+
+    def queue_position(self, ticket):
+        with self._cond:
+            order = self._order()
+            return order.index(ticket) if ticket in order else 0
+
+    def acquire(self, owner, tokens, on_wait=None):
+        # 阻塞到放行為止；on_wait(前面的請求數, 預估秒數) 在等待期間每 report_interval 秒回報一次
+        if not self.enabled: return 0.0
+        ticket = _Ticket(owner or "default", tokens)
+        start = time.monotonic()
+        last_report = None
+        with self._cond:
+            self._queues.setdefault(ticket.owner, deque()).append(ticket)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                order = self._order()
+                if order[0] is ticket and self._wait_seconds(now, [ticket]) == 0:
+                    requests, cost = self._cost(ticket)
+                    if self.requests: self.requests.level -= requests
+                    if self.tokens: self.tokens.level -= cost
+                    queue = self._queues.pop(ticket.owner)
+                    queue.popleft()
+                    if queue: self._queues[ticket.owner] = queue    # 放到輪流順序的最後
+                    self._cond.notify_all()
+                    return now - start
+                position = order.index(ticket)
+                eta = self._wait_seconds(now, order[:position + 1])
+                if on_wait and (last_report is None or now - last_report >= self.report_interval):
+                    last_report = now
+                    self._cond.release()
+                    try: on_wait(position, eta)
+                    finally: self._cond.acquire()
+                    continue
+                self._cond.wait(timeout=min(self.report_interval, max(0.05, self._wait_seconds(now, [order[0]]))))
+
+    def charge(self, tokens, requests=1):
+        # 不排隊直接扣額度 (重試 / 對沖請求，或實際用量與估計的差額；tokens 可為負)
+        if not self.enabled: return
+        with self._cond:
+            self._refill(time.monotonic())
+            if self.requests: self.requests.level -= requests
+            if self.tokens: self.tokens.level -= tokens
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        # 仍收到 429 時 (例如其他程式共用同一把 key)，所有排隊中的請求一起暫停
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def waiting(self):
+        with self._cond: return sum(len(q) for q in self._queues.values())
+
+
+@contextmanager
+def admission(owner, on_wait=None):
+    # 在此範圍內的 Gemini 呼叫以 owner (工作階段) 排隊，等待時呼叫 on_wait(前面的請求數, 預估秒數)
+    token = _admission.set((owner, on_wait))
+    try: yield
+    finally: _admission.reset(token)
+
+
+def current_admission():
+    return _admission.get() or (None, None)
@@ -0,0 +1,103 @@
+import os
+import hashlib
+
+from disk_cache import DiskLRUCache, DEFAULT_CACHE_ROOT
+
+# --- 參考教材快取 (PDF 原檔 + 擷取文字) ---
+# 原檔以內容雜湊 (sha256) 定址；Drive 檔案以 id + md5Checksum/modifiedTime 對應到內容雜湊，
+# 因此 Drive 檔案未變動時，不需重新下載也不需重新解析 PDF。
+
+# 擷取邏輯有改動時調高版本，舊的文字快取自然失效
+EXTRACT_VERSION = "2"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, chunk=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""): digest.update(block)
+    return digest.hexdigest()
+
+
+def source_hash(file):
+    # 有檔案路徑的來源 (LocalFile / StoredFile) 分段計算，不整份讀進記憶體
+    path = getattr(file, "path", None)
+    return file_hash(path) if path else content_hash(file.getvalue())
+
+
+def drive_version_key(file_meta):
+    version = file_meta.get('md5Checksum') or file_meta.get('modifiedTime') or ""
+    return f"drive:{file_meta['id']}:{version}"
+
+
+class RefCache:
+    def __init__(self, root=None, max_bytes=512 * 1024 * 1024):
+        self.root = root or os.path.join(DEFAULT_CACHE_ROOT, "refs")
+        self.store = DiskLRUCache(self.root, max_bytes=max_bytes)
+
+    # 內容層：sha256 -> PDF 原檔 / 擷取文字
+    def get_blob(self, sha):
+        return self.store.get(f"blob:{sha}")
+
+    def put_blob(self, data):
+        sha = content_hash(data)
+        self.store.put(f"blob:{sha}", data)
+        return sha
+
+    def get_blob_path(self, sha):
+        return self.store.get_path(f"blob:{sha}")
+
+    def put_blob_file(self, path):
+        # 已下載到暫存檔的原檔直接搬進快取；回傳 (sha, 快取內路徑)
+        sha = file_hash(path)
+        return sha, self.store.put_file(f"blob:{sha}", path)
+
+    def get_text(self, sha):
+        data = self.store.get(f"text:{EXTRACT_VERSION}:{sha}")
+        return data.decode("utf-8") if data is not None else None
+
+    def put_text(self, sha, text):
+        self.store.put(f"text:{EXTRACT_VERSION}:{sha}", text.encode("utf-8"))
+
+    # 對應層：Drive 檔案版本 -> sha256
+    def get_alias(self, file_meta):
+        data = self.store.get(f"alias:{drive_version_key(file_meta)}")
+        return data.decode("ascii") if data is not None else None
+
+    def put_alias(self, file_meta, sha):
+        self.store.put(f"alias:{drive_version_key(file_meta)}", sha.encode("ascii"))
+
+    # 以下 fetch_* 回傳 (sha, text, data)：text 不為 None 代表命中文字快取，
+    # 否則 data 為待解析的 PDF 原檔 (bytes 或檔案路徑；下載失敗時為 None)
+    def fetch_bytes(self, data):
+        sha = content_hash(data)
+        text = self.get_text(sha)
+        return sha, text, (None if text is not None else data)
+
+    def fetch_path(self, path):
+        sha = file_hash(path)
+        text = self.get_text(sha)
+        return sha, text, (None if text is not None else path)
+
+    def fetch_drive_file(self, file_meta, download_fn):
+        # download_fn(file_id, 目的路徑) 將檔案串流寫入磁碟，成功回傳 True
+        # 熱快取：對應 + 文字都在 -> 不下載、不解析
+        sha = self.get_alias(file_meta)
+        path = None
+        if sha:
+            text = self.get_text(sha)
+            if text is not None: return sha, text, None
+            path = self.get_blob_path(sha)
+
+        if path is None:
+            tmp = self.store.temp_path()
+            try:
+                if not download_fn(file_meta['id'], tmp): return None, None, None
+                sha, path = self.put_blob_file(tmp)
+            finally:
+                if os.path.exists(tmp): os.remove(tmp)
+            self.put_alias(file_meta, sha)
+        return sha, None, path
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from pdf_extract import extract_pdf_bytes, get_cpu_pool, reset_cpu_pool
+
+# --- 參考教材平行載入 ---
+# 下載 (I/O) 走執行緒池、PDF 解析 (CPU) 走程序池；下載完成一份就立刻送去解析，
+# 兩段管線重疊執行，總耗時取決於最慢的一份檔案，而非所有檔案相加。
+
+def load_reference_texts(items, fetch, store_text=None, extract_fn=extract_pdf_bytes,
+                         io_workers=6, progress=None):
+    # items: 任意物件清單；fetch(item) 回傳 (key, text, data)
+    #   - text 不為 None：已有快取文字，直接使用
+    #   - data 不為 None：PDF 原檔，送進程序池解析後呼叫 store_text(key, text)
+    # 回傳與 items 同順序的文字清單 (失敗者為 None)。
+    # progress(done, total, item) 只在呼叫端執行緒觸發 (可安全使用 st.status)。
+    total = len(items)
+    results = [None] * total
+    if not items: return results
+
+    done_count = 0
+    keys = [None] * total
+    pending = {}
+
+    def report(i):
+        nonlocal done_count
+        done_count += 1
+        if progress: progress(done_count, total, items[i])
+
+    def submit_extract(i, data):
+        if total == 1:
+            # 單一檔案不值得跨程序傳輸，直接在本執行緒解析
+            results[i] = extract_fn(data)
+            finish_extract(i)
+            return
+        try:
+            pending[get_cpu_pool().submit(extract_fn, data)] = ("cpu", i, data)
+        except (BrokenProcessPool, RuntimeError):
+            reset_cpu_pool()
+            results[i] = extract_fn(data)
+            finish_extract(i)
+
+    def finish_extract(i):
+        if store_text and results[i] and keys[i] is not None:
+            store_text(keys[i], results[i])
+        report(i)
+
+    with ThreadPoolExecutor(max_workers=min(io_workers, total)) as io_pool:
+        for i, item in enumerate(items):
+            pending[io_pool.submit(fetch, item)] = ("io", i, None)
+
+        while pending:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage, i, data = pending.pop(fut)
+                if stage == "io":
+                    try: key, text, data = fut.result()
+                    except Exception: key, text, data = None, None, None
+                    keys[i] = key
+                    if text is not None:
+                        results[i] = text
+                        report(i)
+                    elif data is not None:
+                        submit_extract(i, data)
+                    else:
+                        report(i)
+                else:
+                    try:
+                        results[i] = fut.result()
+                    except BrokenProcessPool:
+                        reset_cpu_pool()
+                        results[i] = extract_fn(data)
+                    except Exception:
+                        results[i] = None
+                    finish_extract(i)
+    return results
@@ -0,0 +1,139 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from batch_review import is_retryable_error, suggested_delay
+
+# --- Gemini 呼叫韌性：期限、退避重試、對沖請求、備援模型 ---
+# 每次生成有總期限與單一請求逾時；額度 / 暫時性錯誤依伺服器建議或指數退避 (含抖動) 重試。
+# 啟用對沖時，請求超過近期 p95 延遲仍未回應，就再送一個相同請求，取先完成者。
+# 主模型重試用盡 (或期限將到) 時改用備援模型 (較快的型號)，並回傳實際使用的模型。
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationPolicy:
+    deadline: float = 600.0          # 單次生成 (含重試與備援) 的總期限 (秒)
+    attempt_timeout: float = 300.0   # 單一請求逾時 (秒)
+    max_retries: int = 3
+    base_delay: float = 2.0
+    max_delay: float = 30.0
+    hedge: bool = False
+    hedge_after: float = 90.0        # 延遲樣本不足時，等待多久送出對沖請求
+    hedge_min_samples: int = 20
+    fallback_model: str = None
+    fallback_share: float = 0.3      # 設有備援模型時，總期限保留給備援的比例
+
+
+class GenerationTimeout(TimeoutError):
+    pass
+
+
+class GenerationFailed(RuntimeError):
+    pass
+
+
+class LatencyTracker:
+    # 各模型最近成功請求的耗時，用來估計 p95 (對沖等待時間)
+    def __init__(self, window=200):
+        self._samples = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self._lock: self._samples.setdefault(model, deque(maxlen=self._window)).append(seconds)
+
+    def p95(self, model, min_samples=20):
+        with self._lock: samples = sorted(self._samples.get(model, ()))
+        if len(samples) < min_samples: return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+class ResilientGenerator:
+    def __init__(self, policy=None, max_workers=32):
+        self.policy = policy or GenerationPolicy()
+        self.latency = LatencyTracker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-call")
+
+    def hedge_delay(self, model):
+        return self.latency.p95(model, self.policy.hedge_min_samples) or self.policy.hedge_after
+
+    def run(self, call, model, on_event=None):
+        # call(model_name, timeout, live) 執行一次請求；live 為 threading.Event，設定時才可回報串流片段
+        # (對沖請求一開始未設定；請求被放棄 (逾時或另一個請求先完成) 時清除，不再覆寫畫面上的部分內容)
+        # 回傳 (call 的結果, 實際使用的模型)；on_event(kind, detail) 回報 "retry" / "hedge" / "fallback"
+        p = self.policy
+        start = time.monotonic()
+        end = start + p.deadline
+        tiers = [model] + ([p.fallback_model] if p.fallback_model and p.fallback_model != model else [])
+        error = None
+        for tier, name in enumerate(tiers):
+            # 主模型不能用完全部期限，保留一部分給備援模型
+            tier_end = end - p.deadline * p.fallback_share if tier + 1 < len(tiers) else end
+            if tier and on_event: on_event("fallback", {"model": name, "error": error})
+            retries = p.max_retries if tier == 0 else min(1, p.max_retries)
+            for attempt in range(retries + 1):
+                remaining = tier_end - time.monotonic()
+                if remaining <= 1: break
+                try:
+                    return self._attempt(call, name, min(p.attempt_timeout, remaining), on_event), name
+                except Exception as e:
+                    error = e
+                    if not (isinstance(e, GenerationTimeout) or is_retryable_error(e)): break
+                    if attempt == retries: break
+                    delay = suggested_delay(e) or min(p.max_delay, p.base_delay * 2 ** attempt)
+                    delay *= random.uniform(0.5, 1.5)
+                    if time.monotonic() + delay >= tier_end - 1: break
+                    logger.warning("Gemini %s attempt %d failed (%s); retrying in %.1fs", name, attempt + 1, e, delay)
+                    if on_event: on_event("retry", {"model": name, "attempt": attempt + 1, "delay": delay, "error": e})
+                    time.sleep(delay)
+        if isinstance(error, GenerationTimeout) or error is None:
+            raise GenerationFailed(f"Gemini 在 {p.deadline:.0f} 秒內沒有完成回應，請稍後再試") from error
+        if is_retryable_error(error):
+            raise GenerationFailed(f"Gemini 目前忙碌或額度不足 (已重試)，請稍後再試：{error}") from error
+        raise error
+
+    def _attempt(self, call, model, timeout, on_event):
+        started = time.monotonic()
+        stop_at = started + timeout
+        primary = threading.Event()
+        primary.set()
+        futures = {self._pool.submit(call, model, timeout, primary): (started, primary)}
+        hedge_at = started + self.hedge_delay(model) if self.policy.hedge else None
+        error = None
+        while futures:
+            now = time.monotonic()
+            wake = stop_at if hedge_at is None else min(stop_at, hedge_at)
+            done, _ = wait(list(futures), timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for f in done:
+                sent, _ = futures.pop(f)
+                try: result = f.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.latency.record(model, time.monotonic() - sent)
+                # 另一個請求仍在執行：放著讓它自然結束 (受請求逾時限制)，結果捨棄，也不再回報串流片段
+                self._abandon(futures)
+                return result
+            now = time.monotonic()
+            if not futures:
+                break
+            if now >= stop_at:
+                self._abandon(futures)
+                raise GenerationTimeout(f"{model} 超過 {timeout:g} 秒未回應")
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                if on_event: on_event("hedge", {"model": model, "after": now - started})
+                hedge = threading.Event()
+                futures[self._pool.submit(call, model, max(1.0, stop_at - now), hedge)] = (now, hedge)
+        raise error
+
+    @staticmethod
+    def _abandon(futures):
+        for _, live in futures.values():
+            live.clear()
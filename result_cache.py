@@ -0,0 +1,54 @@
+import os
+import json
+import time
+import base64
+import hashlib
+
+from disk_cache import DiskLRUCache, DEFAULT_CACHE_ROOT
+
+# --- 審題結果快取 ---
+# 同一份試卷 + 同一組教材 + 同樣的範圍/嚴格度/模型/Prompt 版本，直接回傳上次的報告與 Word 檔，
+# 不再呼叫 Gemini。
+
+
+def review_cache_key(exam_text, ref_ids, exam_scope, strictness, model_name, prompt_version):
+    payload = json.dumps({
+        "exam": hashlib.sha256(exam_text.encode("utf-8")).hexdigest(),
+        "refs": sorted(ref_ids),
+        "scope": (exam_scope or "").strip(),
+        "strictness": strictness,
+        "model": model_name,
+        "prompt": prompt_version,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root=None, max_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600):
+        root = root or os.path.join(DEFAULT_CACHE_ROOT, "results")
+        self.store = DiskLRUCache(root, max_bytes=max_bytes, ttl=ttl)
+
+    def get(self, key):
+        data = self.store.get(f"review:{key}")
+        if data is None: return None
+        try:
+            record = json.loads(data.decode("utf-8"))
+            return (record["ai_report"], base64.b64decode(record["word"]),
+                    record["exam_meta"], record["created"], record.get("data"))
+        except (ValueError, KeyError):
+            self.store.delete(f"review:{key}")
+            return None
+
+    def put(self, key, ai_report, word_bytes, exam_meta, data=None):
+        # data：結構化審題結果 (dict)，Markdown 模式為 None
+        record = {
+            "ai_report": ai_report,
+            "word": base64.b64encode(word_bytes).decode("ascii"),
+            "exam_meta": exam_meta,
+            "created": time.time(),
+            "data": data,
+        }
+        self.store.put(f"review:{key}", json.dumps(record, ensure_ascii=False).encode("utf-8"))
+
+    def invalidate(self, key):
+        self.store.delete(f"review:{key}")
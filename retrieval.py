@@ -0,0 +1,159 @@
+import re
+import json
+import zlib
+import math
+import hashlib
+from collections import Counter
+
+# --- 參考教材相關段落檢索 (BM25，中文字元 bigram，不需斷詞) ---
+# 取代直接截斷 ref_text[:60000]：把教材切成段落、建立倒排索引，
+# 依試卷內容 / 考試範圍 / 年級挑出最相關的段落，在預算內送進 Prompt。
+
+INDEX_VERSION = "1"
+BM25_K1 = 1.5
+BM25_B = 0.75
+MAX_QUERY_TERMS = 400
+
+_CJK_RUN = re.compile(r'[㐀-鿿豈-﫿]+')
+_WORD = re.compile(r'[A-Za-z]+(?:-[IVX]+-\d+)?|\d+')
+_SECTION_START = re.compile(r'^\s*(第[一二三四五六七八九十\d]+[單元課章節]|[一二三四五六七八九十]+、|學習表現|學習內容|【)')
+
+_GRADE_STAGE = {"一年級": ("第一學習階段", "I"), "二年級": ("第一學習階段", "I"),
+                "三年級": ("第二學習階段", "II"), "四年級": ("第二學習階段", "II"),
+                "五年級": ("第三學習階段", "III"), "六年級": ("第三學習階段", "III")}
+
+
+def estimate_tokens(text):
+    # 中日韓文字約 1 字 1 token，其餘約 4 字元 1 token
+    cjk = sum(len(m) for m in _CJK_RUN.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+
+def tokenize(text):
+    terms = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1: terms.append(run)
+        else: terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(w.lower() for w in _WORD.findall(text))
+    return terms
+
+
+def chunk_text(text, target=800):
+    # 以段落/標題為界切塊，太短的合併、太長的依行切開
+    chunks, buf, size = [], [], 0
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line: continue
+        if buf and (size + len(line) > target or (_SECTION_START.match(line) and size > target // 4)):
+            chunks.append("\n".join(buf))
+            buf, size = [], 0
+        buf.append(line)
+        size += len(line) + 1
+    if buf: chunks.append("\n".join(buf))
+    return chunks
+
+
+def build_index(text):
+    chunks = chunk_text(text)
+    postings = {}
+    lengths = []
+    for ci, chunk in enumerate(chunks):
+        tf = Counter(tokenize(chunk))
+        lengths.append(sum(tf.values()))
+        for term, n in tf.items(): postings.setdefault(term, []).append((ci, n))
+    return {"chunks": chunks, "lengths": lengths, "postings": postings}
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_or_build_index(text, store=None):
+    # store 為 DiskLRUCache (與參考教材快取同一處)，依文字內容雜湊保存索引
+    key = f"bm25:{INDEX_VERSION}:{text_key(text)}"
+    if store is not None:
+        data = store.get(key)
+        if data is not None:
+            try: return json.loads(zlib.decompress(data).decode("utf-8"))
+            except (zlib.error, ValueError): pass
+    index = build_index(text)
+    if store is not None:
+        store.put(key, zlib.compress(json.dumps(index, ensure_ascii=False).encode("utf-8")))
+    return index
+
+
+def _query_weights(exam_text, exam_scope, grade):
+    weights = Counter(tokenize(exam_text))
+    for term in tokenize(exam_scope or ""): weights[term] += 5
+    for term in tokenize(grade or ""): weights[term] += 3
+    return weights
+
+
+def _grade_markers(grade):
+    stage = _GRADE_STAGE.get(grade)
+    if not stage: return []
+    return [grade, stage[0], f"-{stage[1]}-"]
+
+
+def select_reference_chunks(docs, exam_text, exam_scope="", grade="", budget_tokens=15000, store=None):
+    # docs: [(來源名稱, 文字)]；回傳 (挑選結果文字, 統計資訊)
+    indexes = [load_or_build_index(text, store) for _, text in docs]
+    n_chunks = sum(len(ix["chunks"]) for ix in indexes)
+    if not n_chunks: return "", {"chunks": 0, "selected": 0, "tokens": 0}
+    avg_len = sum(sum(ix["lengths"]) for ix in indexes) / n_chunks or 1.0
+
+    df = Counter()
+    for ix in indexes:
+        for term, plist in ix["postings"].items(): df[term] += len(plist)
+
+    weights = _query_weights(exam_text, exam_scope, grade)
+    idf = {t: math.log(1 + (n_chunks - df[t] + 0.5) / (df[t] + 0.5)) for t in weights if df[t]}
+    query = sorted(idf, key=lambda t: weights[t] * idf[t], reverse=True)[:MAX_QUERY_TERMS]
+
+    scores = Counter()
+    for di, ix in enumerate(indexes):
+        lengths = ix["lengths"]
+        for term in query:
+            plist = ix["postings"].get(term)
+            if not plist: continue
+            qw = math.log1p(weights[term]) * idf[term]
+            for ci, tf in plist:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ci] / avg_len)
+                scores[(di, ci)] += qw * tf * (BM25_K1 + 1) / (tf + norm)
+
+    markers = _grade_markers(grade)
+    if markers:
+        for key in scores:
+            chunk = indexes[key[0]]["chunks"][key[1]]
+            if any(m in chunk for m in markers): scores[key] *= 1.5
+
+    picked, used = [], 0
+    for key, _ in scores.most_common():
+        chunk = indexes[key[0]]["chunks"][key[1]]
+        cost = estimate_tokens(chunk)
+        if used + cost > budget_tokens: continue
+        picked.append(key)
+        used += cost
+        if used >= budget_tokens * 0.98: break
+
+    # 依原始文件順序輸出，保留上下文的閱讀順序
+    parts, last_doc = [], None
+    for di, ci in sorted(picked):
+        if di != last_doc:
+            parts.append(f"《{docs[di][0]}》")
+            last_doc = di
+        parts.append(indexes[di]["chunks"][ci])
+    stats = {"chunks": n_chunks, "selected": len(picked), "tokens": used}
+    return "\n".join(parts), stats
+
+
+def build_reference_context(docs, exam_text, exam_scope="", grade="", budget_tokens=15000, store=None):
+    # 教材總量在預算內就全部送出；超過才做檢索 (逐份估算，不先串接成一整份全文)
+    full_tokens = sum(estimate_tokens(text) for _, text in docs)
+    if full_tokens <= budget_tokens:
+        return "\n".join(text for _, text in docs), {"chunks": None, "selected": None, "tokens": full_tokens,
+                                                      "retrieved": False}
+    context, stats = select_reference_chunks(docs, exam_text, exam_scope, grade, budget_tokens, store)
+    stats["retrieved"] = True
+    stats["full_tokens"] = full_tokens
+    return context, stats
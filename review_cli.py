@@ -0,0 +1,123 @@
+import os
+import sys
+import glob
+import json
+import argparse
+
+from review_pipeline import ReviewConfig, ReviewPipeline, LocalFile, batch_summary_rows
+
+# --- 命令列審題 (不需瀏覽器 / Streamlit) ---
+# 用法：python -m review_cli 試卷.pdf [更多試卷或資料夾] --refs 課本.pdf --scope "康軒版 第3-4單元" -o 輸出資料夾
+# 設定沿用 .streamlit/secrets.toml，環境變數 (GEMINI_API_KEY 等同名鍵) 可覆寫。
+
+_ENV_KEYS = ["GEMINI_API_KEY", "GEMINI_MODEL", "google_drive_folder_id", "REF_CACHE_DIR",
+             "REF_CACHE_MAX_MB", "DRIVE_INDEX_DIR", "DRIVE_INDEX_TTL", "REF_TOKEN_BUDGET",
+             "RESULT_CACHE_DIR", "RESULT_CACHE_MAX_MB", "RESULT_CACHE_TTL_HOURS",
+             "GEMINI_STREAM", "BATCH_CONCURRENCY", "CONTEXT_CACHE", "CONTEXT_CACHE_TTL",
+             "CONTEXT_CACHE_MIN_TOKENS", "CONTEXT_REF_TOKEN_BUDGET", "EXAM_SECTION_CHARS", "CURRICULUM_DB",
+             "GEMINI_DEADLINE", "GEMINI_ATTEMPT_TIMEOUT", "GEMINI_MAX_RETRIES", "GEMINI_HEDGE",
+             "GEMINI_HEDGE_AFTER", "GEMINI_FALLBACK_MODEL", "GEMINI_RPM", "GEMINI_TPM",
+             "INCREMENTAL_REVIEW", "REVISION_DB", "STRUCTURED_OUTPUT"]
+
+
+def load_settings(secrets_path=None):
+    settings = {}
+    path = secrets_path or os.path.join(".streamlit", "secrets.toml")
+    if os.path.exists(path):
+        import tomllib
+        with open(path, "rb") as f: settings.update(tomllib.load(f))
+    for key in _ENV_KEYS:
+        if os.environ.get(key) is not None: settings[key] = os.environ[key]
+    account_file = os.environ.get("GCP_SERVICE_ACCOUNT_FILE")
+    if account_file:
+        import json
+        with open(account_file, encoding="utf-8") as f: settings["gcp_service_account"] = json.load(f)
+    return settings
+
+
+def collect_pdfs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "*.pdf")) + glob.glob(os.path.join(path, "*.PDF")))
+        else:
+            files.append(path)
+    return files
+
+
+def _progress(message, level="info"):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _write_outputs(out_dir, stem, ai_report, word_bytes, formats, data=None):
+    written = []
+    if "json" in formats and data:
+        path = os.path.join(out_dir, f"{stem}_審題結果.json")
+        with open(path, "w", encoding="utf-8") as f: json.dump(data.to_dict(), f, ensure_ascii=False, indent=2)
+        written.append(path)
+    if "md" in formats and ai_report:
+        path = os.path.join(out_dir, f"{stem}_審題報告.md")
+        with open(path, "w", encoding="utf-8") as f: f.write(ai_report)
+        written.append(path)
+    if "docx" in formats and word_bytes:
+        path = os.path.join(out_dir, f"{stem}_審題報告.docx")
+        with open(path, "wb") as f: f.write(word_bytes)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m review_cli", description="智慧審題：命令列版")
+    parser.add_argument("exams", nargs="+", help="試卷 PDF 或包含試卷 PDF 的資料夾")
+    parser.add_argument("--refs", nargs="*", default=[], help="課本/習作 PDF (未指定則使用雲端課綱)")
+    parser.add_argument("--scope", default="", help="考試範圍，例如：康軒版 第3-4單元")
+    parser.add_argument("--strictness", default="嚴格")
+    parser.add_argument("-o", "--out", default=".", help="輸出資料夾")
+    parser.add_argument("--format", choices=["docx", "md", "json", "both", "all"], default="both",
+                        help="both：docx + md；json / all 會啟用結構化審題 (STRUCTURED_OUTPUT)")
+    parser.add_argument("--force", action="store_true", help="忽略審題結果快取與上一版結果，整份重新呼叫 Gemini")
+    parser.add_argument("--secrets", help="secrets.toml 路徑 (預設 .streamlit/secrets.toml)")
+    parser.add_argument("--concurrency", type=int, help="批次審題同時呼叫數")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.secrets)
+    if args.concurrency: settings["BATCH_CONCURRENCY"] = args.concurrency
+    if args.format in ("json", "all"): settings["STRUCTURED_OUTPUT"] = True
+    config = ReviewConfig.from_mapping(settings)
+    if not config.gemini_api_key:
+        parser.error("找不到 GEMINI_API_KEY (請設定環境變數或 secrets.toml)")
+
+    exams = collect_pdfs(args.exams)
+    if not exams: parser.error("找不到任何試卷 PDF")
+    refs = [LocalFile(p) for p in collect_pdfs(args.refs)]
+    formats = {"both": {"docx", "md"}, "all": {"docx", "md", "json"}}.get(args.format, {args.format})
+    os.makedirs(args.out, exist_ok=True)
+    pipeline = ReviewPipeline(config)
+
+    if len(exams) == 1:
+        config.stream = False
+        with open(exams[0], "rb") as f:
+            result = pipeline.review(f, refs, args.strictness, args.scope,
+                                     force_refresh=args.force, progress=_progress)
+        stem = os.path.splitext(os.path.basename(exams[0]))[0]
+        for path in _write_outputs(args.out, stem, result.ai_report, result.word_bytes, formats, result.data):
+            print(path)
+        return 0
+
+    files = [LocalFile(p) for p in exams]
+    texts = pipeline.load_local_files(
+        files, progress=lambda done, total, f: _progress(f"　📄 ({done}/{total}) 已讀取試卷：{f.name}"))
+    items = pipeline.review_batch([(f.name, t or "") for f, t in zip(files, texts)], refs,
+                                  args.strictness, args.scope, force_refresh=args.force, progress=_progress)
+    failed = 0
+    for f, item in zip(files, items):
+        stem = os.path.splitext(f.name)[0]
+        for path in _write_outputs(args.out, stem, item["report"], item["word"], formats, item["data"]): print(path)
+        if not item["word"]: failed += 1
+    for row in batch_summary_rows(items):
+        _progress(f"{row['序號']:>3}  {row['狀態']}  {row['檔名']}  ({row['耗時(秒)']} 秒)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,996 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass, field
+
+from pdf_extract import extract_pdf_pages, extract_pdf_text
+from exam_meta import extract_exam_meta_enhanced
+from ref_cache import RefCache, source_hash, drive_version_key
+from ref_loader import load_reference_texts
+from drive_index import DriveFolderIndex, list_folder_pdfs
+from retrieval import build_reference_context, estimate_tokens
+from prompts import (build_review_prompt, build_section_prompt, build_reduce_prompt, build_revision_prompt,
+                     PROMPT_VERSION, EXAM_CHAR_LIMIT)
+from exam_sections import split_exam_sections, find_sections, HEADER_CHARS
+from exam_parser import parse_exam, score_block, apply_spec_table
+from result_cache import ResultCache, review_cache_key
+from batch_review import run_generation_batch
+from metrics import MetricsLog, start_trace, span, record, current_trace
+from gemini_client import GeminiClient
+from resilience import GenerationPolicy, ResilientGenerator, GenerationTimeout
+from quota_governor import QuotaGovernor, current_admission
+from curriculum_store import CurriculumStore, format_entries, entries_fingerprint
+from review_schema import ReviewData, parse_review_json, normalize_questions, report_blocks, blocks_markdown
+from exam_revision import (RevisionStore, exam_questions, question_findings, carry_findings, merge_findings,
+                           resolved_issues, revision_summary, can_carry, render_revision_report, revision_questions_text,
+                           MAX_REVIEW_SHARE, MARK_CHANGED, MARK_ADDED)
+
+# --- 審題流程 (不依賴 Streamlit，可供 CLI / 批次 / 測試直接呼叫) ---
+# 試卷擷取 → 資訊偵測 → 比對基準 → Prompt → Gemini 生成 → Word 報告
+# streamlit / googleapiclient / python-docx / google.generativeai 都延後到實際需要時才匯入。
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "models/gemini-3-pro-preview"
+
+
+def _noop_progress(message, level="info"):
+    pass
+
+
+def _as_bool(value):
+    if isinstance(value, str): return value.strip().lower() not in ("0", "false", "no", "off", "")
+    return bool(value)
+
+
+@dataclass
+class ReviewConfig:
+    gemini_api_key: str = None
+    model_name: str = DEFAULT_MODEL
+    drive_folder_id: str = None
+    gcp_service_account: dict = None
+    ref_cache_dir: str = None
+    ref_cache_max_mb: int = 512
+    drive_index_dir: str = None
+    drive_index_ttl: int = 300
+    ref_token_budget: int = 15000
+    result_cache_dir: str = None
+    result_cache_max_mb: int = 256
+    result_cache_ttl_hours: float = 168
+    stream: bool = True
+    batch_concurrency: int = 4
+    metrics_db: str = None
+    context_cache: bool = True
+    context_cache_ttl: int = 3600
+    context_cache_min_tokens: int = 4096
+    context_ref_token_budget: int = 60000
+    exam_section_chars: int = 12000
+    curriculum_db: str = None
+    gemini_deadline: float = 600.0
+    gemini_attempt_timeout: float = 300.0
+    gemini_max_retries: int = 3
+    gemini_hedge: bool = False
+    gemini_hedge_after: float = 90.0
+    fallback_model: str = None
+    gemini_rpm: int = 60
+    gemini_tpm: int = 1_000_000
+    incremental_review: bool = True
+    revision_db: str = None
+    structured_output: bool = False
+
+    @classmethod
+    def from_mapping(cls, m):
+        # 對應 .streamlit/secrets.toml 的鍵名 (st.secrets 或一般 dict 皆可)
+        get = lambda key, default=None: m.get(key, default) if m is not None else default
+        account = get("gcp_service_account")
+        return cls(
+            gemini_api_key=get("GEMINI_API_KEY"),
+            model_name=get("GEMINI_MODEL", DEFAULT_MODEL),
+            drive_folder_id=get("google_drive_folder_id"),
+            gcp_service_account=dict(account) if account else None,
+            ref_cache_dir=get("REF_CACHE_DIR"),
+            ref_cache_max_mb=int(get("REF_CACHE_MAX_MB", 512)),
+            drive_index_dir=get("DRIVE_INDEX_DIR"),
+            drive_index_ttl=int(get("DRIVE_INDEX_TTL", 300)),
+            ref_token_budget=int(get("REF_TOKEN_BUDGET", 15000)),
+            result_cache_dir=get("RESULT_CACHE_DIR"),
+            result_cache_max_mb=int(get("RESULT_CACHE_MAX_MB", 256)),
+            result_cache_ttl_hours=float(get("RESULT_CACHE_TTL_HOURS", 168)),
+            stream=_as_bool(get("GEMINI_STREAM", True)),
+            batch_concurrency=int(get("BATCH_CONCURRENCY", 4)),
+            metrics_db=get("METRICS_DB"),
+            context_cache=_as_bool(get("CONTEXT_CACHE", True)),
+            context_cache_ttl=int(get("CONTEXT_CACHE_TTL", 3600)),
+            context_cache_min_tokens=int(get("CONTEXT_CACHE_MIN_TOKENS", 4096)),
+            context_ref_token_budget=int(get("CONTEXT_REF_TOKEN_BUDGET", 60000)),
+            exam_section_chars=int(get("EXAM_SECTION_CHARS", 12000)),
+            curriculum_db=get("CURRICULUM_DB"),
+            gemini_deadline=float(get("GEMINI_DEADLINE", 600)),
+            gemini_attempt_timeout=float(get("GEMINI_ATTEMPT_TIMEOUT", 300)),
+            gemini_max_retries=int(get("GEMINI_MAX_RETRIES", 3)),
+            gemini_hedge=_as_bool(get("GEMINI_HEDGE", False)),
+            gemini_hedge_after=float(get("GEMINI_HEDGE_AFTER", 90)),
+            fallback_model=get("GEMINI_FALLBACK_MODEL") or None,
+            gemini_rpm=int(get("GEMINI_RPM", 60)),
+            gemini_tpm=int(get("GEMINI_TPM", 1_000_000)),
+            incremental_review=_as_bool(get("INCREMENTAL_REVIEW", True)),
+            revision_db=get("REVISION_DB"),
+            structured_output=_as_bool(get("STRUCTURED_OUTPUT", False)),
+        )
+
+
+@dataclass
+class ReviewResult:
+    ai_report: str
+    word_bytes: bytes
+    exam_meta: dict
+    cached: bool = False
+    ref_sources: list = field(default_factory=list)
+    data: ReviewData = None      # 結構化審題結果 (STRUCTURED_OUTPUT)
+
+
+class LocalFile:
+    # 讓本機檔案與 Streamlit UploadedFile 有相同介面 (name / getvalue)
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def getvalue(self):
+        with open(self.path, "rb") as f: return f.read()
+
+
+class BytesFile:
+    # 已讀入記憶體的檔案 (例如交給背景工作的上傳檔)
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+# --- 串流生成 (邊生成邊回報) ---
+def stream_generate(model, prompt, on_text=None, min_interval=0.25, request_options=None, generation_config=None):
+    start = time.perf_counter()
+    ttft = None
+    chunks = []
+    last_render = 0.0
+    response = model.generate_content(prompt, stream=True, request_options=request_options,
+                                      **({"generation_config": generation_config} if generation_config else {}))
+    for chunk in response:
+        try: piece = chunk.text
+        except ValueError: piece = ""  # 無文字內容的區塊 (如安全性中繼資料)
+        if not piece: continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+            logger.info("Gemini time-to-first-output: %.2fs", ttft)
+        chunks.append(piece)
+        # 節流重繪，避免長報告每個片段都重新渲染整份 Markdown
+        now = time.perf_counter()
+        if on_text and now - last_render >= min_interval:
+            on_text("".join(chunks), ttft)
+            last_render = now
+    text = "".join(chunks)
+    total = time.perf_counter() - start
+    logger.info("Gemini generation finished: %.2fs, %d chars", total, len(text))
+    return text, ttft, total, getattr(response, "usage_metadata", None)
+
+
+def model_label(primary, used):
+    # 報告上顯示的模型名稱；用到備援模型時一併註明
+    short = lambda m: m.split("/", 1)[1] if m.startswith("models/") else m
+    fallback = [m for m in dict.fromkeys(used) if m != primary]
+    if not fallback: return short(primary)
+    if primary not in used: return f"{short(fallback[0])} (備援)"
+    return f"{short(primary)}，部分段落改用 {short(fallback[0])} (備援)"
+
+
+def _write_file(path, data):
+    if data is None: return False
+    with open(path, "wb") as f: f.write(data)
+    return True
+
+
+def _download_bytes(download, file_id):
+    # 教材快取無法使用時的退路：下載到暫存檔後讀回
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        if not download(file_id, path): return None
+        with open(path, "rb") as f: return f.read()
+    finally:
+        os.remove(path)
+
+
+class ReviewPipeline:
+    def __init__(self, config=None, gemini=None, drive_service=None):
+        # gemini：GeminiClient；drive_service：Drive service (測試 / 效能量測可傳入 gemini_fake、drive_fake)
+        self.config = config or ReviewConfig()
+        self._gemini = gemini
+        self._lock = threading.Lock()
+        self._ref_cache = None
+        self._result_cache = None
+        self._drive_creds = None
+        self._drive_service = drive_service
+        self._drive_indexes = {}
+        self._metrics = None
+        self._curriculum = None
+        self._generator = None
+        self._governor = None
+        self._revisions = None
+
+    # --- 共用資源 (延後建立) ---
+    def ref_cache(self):
+        with self._lock:
+            if self._ref_cache is None:
+                try:
+                    self._ref_cache = RefCache(root=self.config.ref_cache_dir,
+                                               max_bytes=self.config.ref_cache_max_mb * 1024 * 1024)
+                except Exception as e:
+                    logger.warning("reference cache unavailable: %s", e)
+                    self._ref_cache = False
+            return self._ref_cache or None
+
+    def result_cache(self):
+        with self._lock:
+            if self._result_cache is None:
+                try:
+                    self._result_cache = ResultCache(
+                        root=self.config.result_cache_dir,
+                        max_bytes=self.config.result_cache_max_mb * 1024 * 1024,
+                        ttl=self.config.result_cache_ttl_hours * 3600)
+                except Exception as e:
+                    logger.warning("result cache unavailable: %s", e)
+                    self._result_cache = False
+            return self._result_cache or None
+
+    def metrics(self):
+        with self._lock:
+            if self._metrics is None:
+                try: self._metrics = MetricsLog(self.config.metrics_db)
+                except Exception as e:
+                    logger.warning("metrics log unavailable: %s", e)
+                    self._metrics = False
+            return self._metrics or None
+
+    def curriculum_store(self):
+        # 本機課綱資料庫 (python -m curriculum_store 建立)；尚未建立則不使用
+        with self._lock:
+            if self._curriculum is None:
+                try: self._curriculum = CurriculumStore.open_existing(self.config.curriculum_db) or False
+                except Exception as e:
+                    logger.warning("curriculum store unavailable: %s", e)
+                    self._curriculum = False
+            return self._curriculum or None
+
+    def curriculum_entries(self, subject, grade):
+        store = self.curriculum_store()
+        if not store: return []
+        try:
+            with span("curriculum_lookup"): return store.lookup(subject, grade)
+        except Exception as e:
+            logger.warning("curriculum lookup failed: %s", e)
+            return []
+
+    def revision_store(self):
+        # 試卷版本紀錄 (修訂版只重審變動的題目)；INCREMENTAL_REVIEW=0 時不使用
+        if not self.config.incremental_review: return None
+        with self._lock:
+            if self._revisions is None:
+                try: self._revisions = RevisionStore(self.config.revision_db)
+                except Exception as e:
+                    logger.warning("revision store unavailable: %s", e)
+                    self._revisions = False
+            return self._revisions or None
+
+    def _write_trace(self, trace, status, cached=False):
+        log = self.metrics()
+        if not log: return
+        try: log.write(trace, status=status, model=self.config.model_name, cached=cached)
+        except Exception as e: logger.warning("metrics write failed: %s", e)
+
+    def drive_credentials(self):
+        if not self.config.gcp_service_account: return None
+        with self._lock:
+            if self._drive_creds is None:
+                import drive_client
+                self._drive_creds = drive_client.make_drive_credentials(self.config.gcp_service_account)
+            return self._drive_creds
+
+    def drive_service(self):
+        if self._drive_service is not None: return self._drive_service
+        creds = self.drive_credentials()
+        if not creds: return None
+        with self._lock:
+            if self._drive_service is None:
+                import drive_client
+                self._drive_service = drive_client.build_drive_service(creds)
+            return self._drive_service
+
+    def drive_index(self, folder_id):
+        with self._lock:
+            index = self._drive_indexes.get(folder_id)
+            if index is None:
+                index = DriveFolderIndex(folder_id, root=self.config.drive_index_dir,
+                                         ttl=self.config.drive_index_ttl)
+                self._drive_indexes[folder_id] = index
+        service = self.drive_service()
+        if service:
+            # 更新失敗時沿用上次的索引
+            try: index.refresh(service)
+            except Exception as e: logger.warning("drive index refresh failed: %s", e)
+        return index
+
+    def subject_drive_files(self, subject):
+        folder_id = self.config.drive_folder_id
+        if not folder_id: return []
+        try:
+            with span("drive_listing"): return self.drive_index(folder_id).files_for_subject(subject)
+        except Exception: return []
+
+    def gemini(self):
+        with self._lock:
+            if self._gemini is None:
+                c = self.config
+                self._gemini = GeminiClient(c.gemini_api_key, c.model_name, context_cache=c.context_cache,
+                                            cache_ttl=c.context_cache_ttl, min_cache_tokens=c.context_cache_min_tokens)
+            return self._gemini
+
+    def generator(self):
+        with self._lock:
+            if self._generator is None:
+                c = self.config
+                self._generator = ResilientGenerator(GenerationPolicy(
+                    deadline=c.gemini_deadline, attempt_timeout=c.gemini_attempt_timeout,
+                    max_retries=c.gemini_max_retries, hedge=c.gemini_hedge, hedge_after=c.gemini_hedge_after,
+                    fallback_model=c.fallback_model))
+            return self._generator
+
+    def governor(self):
+        # 全程序共用的 RPM / TPM 額度控管 (GEMINI_RPM / GEMINI_TPM 設為 0 即不限制)
+        with self._lock:
+            if self._governor is None:
+                self._governor = QuotaGovernor(rpm=self.config.gemini_rpm, tpm=self.config.gemini_tpm)
+            return self._governor
+
+    def shared_reference(self):
+        # 使用 context cache 時，比對基準不依試卷內容挑選，同科目/年級/範圍的試卷共用同一份
+        return self.gemini().caching_available()
+
+    # --- 生成：短試卷單次呼叫；長試卷依大題分段平行審查後彙整 (map-reduce) ---
+    def plan_generation(self, exam_meta, exam_scope, strictness, scenario_msg, ref_block, exam_text, exam=None):
+        # 題數與配分在本機計算，AI 只判斷單元與認知層次 (解析不到題目時維持由 AI 繪製細目表)
+        if exam is None:
+            with span("exam_parse"):
+                exam = parse_exam(exam_text)
+        if not exam.usable: exam = None
+        record("questions_detected", len(exam.questions) if exam else 0)
+        block = score_block(exam) if exam else ""
+        structured = self.config.structured_output
+        plan = {"meta": exam_meta, "scope": exam_scope, "strictness": strictness, "prompt": None, "sections": None,
+                "exam": exam, "score_block": block, "structured": structured, "data": None, "blocks": None}
+        if len(exam_text) <= EXAM_CHAR_LIMIT:
+            plan["prompt"] = build_review_prompt(exam_meta, exam_scope, strictness, scenario_msg, ref_block,
+                                                 exam_text, block, structured)
+            return plan
+        header, sections = split_exam_sections(exam_text, self.config.exam_section_chars)
+        plan["sections"] = [
+            (label, build_section_prompt(exam_meta, exam_scope, strictness, scenario_msg, ref_block,
+                                         header, label, body, i, len(sections), block))
+            for i, (label, body) in enumerate(sections, 1)]
+        return plan
+
+    def plan_chars(self, plan):
+        if plan["prompt"] is not None: return len(plan["prompt"])
+        return sum(len(p) for _, p in plan["sections"])
+
+    def _call(self, prompt, stream=False, on_text=None, progress=_noop_progress):
+        # 回傳 (文字, 首段秒數, 總秒數, usage, 實際使用的模型)；逾時 / 重試 / 對沖 / 備援由 ResilientGenerator 處理
+        gemini = self.gemini()
+        primary = self.config.model_name
+        trace = current_trace()
+        governor = self.governor()
+        owner, on_wait = current_admission()
+        sent = []
+        config = None
+        if prompt.schema is not None:
+            # 結構化輸出：JSON 片段無法直接顯示，不回報串流中的部分內容
+            config = {"response_mime_type": "application/json", "response_schema": prompt.schema}
+            on_text = None
+
+        def input_tokens(contents, status):
+            return estimate_tokens(contents) + (0 if status in ("hit", "created") else estimate_tokens(prompt.system))
+
+        def call(model_name, timeout, live):
+            if model_name == primary: model, contents, status = gemini.generation_target(prompt)
+            else: model, contents, status = gemini.model(prompt.system, model_name), prompt.contents(), "off"
+            # 第一個請求已排隊放行；重試 / 對沖 / 備援不再排隊，直接計入額度
+            if sent: governor.charge(input_tokens(contents, status))
+            sent.append(model_name)
+            options = {"timeout": timeout}
+            if stream:
+                def emit(text, ttft=None):
+                    # 被放棄的請求 (逾時後重試、對沖已勝出) 不再覆寫畫面上的部分內容
+                    if live.is_set(): on_text(text, ttft)
+                return stream_generate(model, contents, on_text=emit if on_text else None,
+                                       request_options=options, generation_config=config)
+            start = time.perf_counter()
+            response = model.generate_content(contents, request_options=options,
+                                              **({"generation_config": config} if config else {}))
+            seconds = time.perf_counter() - start
+            return response.text, seconds, seconds, getattr(response, "usage_metadata", None)
+
+        def on_event(kind, detail):
+            if trace: trace.add(f"gemini_{kind}", 1)
+            if kind == "retry" and not isinstance(detail["error"], GenerationTimeout):
+                governor.pause(detail["delay"])
+            if kind == "retry":
+                progress(f"　⏳ Gemini 暫時無法回應，{detail['delay']:.0f} 秒後重試 (第 {detail['attempt']} 次)")
+            elif kind == "fallback":
+                progress(f"　🔀 主模型無法完成，改用備援模型 {model_label(detail['model'], [])}", "warning")
+
+        _, contents, status = gemini.generation_target(prompt)
+        estimate = input_tokens(contents, status)
+        waited = governor.acquire(owner, estimate, on_wait)
+        if trace and waited: trace.add("quota_wait_ms", round(waited * 1000))
+        if waited and on_wait: on_wait(0, 0.0)    # 已放行：清除排隊提示
+        (text, ttft, total, usage), used = self.generator().run(call, primary, on_event=on_event)
+        if usage is not None:
+            # 以實際用量修正估計值
+            actual = (getattr(usage, "prompt_token_count", 0) or 0) - (getattr(usage, "cached_content_token_count", 0) or 0)
+            if actual: governor.charge(actual - estimate, requests=0)
+        return text, ttft, total, usage, used
+
+    def _record_models(self, plan, used):
+        plan["meta"]["model"] = model_label(self.config.model_name, used)
+        plan["meta"]["model_fallback"] = any(m != self.config.model_name for m in used)
+
+    def generate_report(self, plan, stream=False, on_text=None, progress=_noop_progress):
+        # 回傳 (報告, 首段回應秒數, 總秒數)；token 用量記入目前的 trace
+        if plan["sections"]:
+            text, ttft, total = self._map_reduce(plan, stream, on_text, progress)
+        else:
+            text, ttft, total, usage, used = self._call(plan["prompt"], stream, on_text, progress)
+            self._record_models(plan, [used])
+            trace = current_trace()
+            if trace: trace.add_usage(usage)
+        if plan["structured"] and text:
+            with span("structured_render"): text = self._render_structured(plan, text)
+        # Step 4 改為本機計算的雙向細目表
+        elif plan["exam"] and text: text = apply_spec_table(text, plan["exam"])
+        return text, ttft, total
+
+    def _render_structured(self, plan, text):
+        # JSON → ReviewData → 報告區塊；回傳由區塊產生的 Markdown (畫面 / 匯出 / 修訂版比對用)
+        data = parse_review_json(text)
+        if data is None: raise ValueError("Gemini 回傳的審查結果不是有效的 JSON，請重新審題")
+        plan["data"] = normalize_questions(data, plan["exam"])
+        plan["blocks"] = report_blocks(plan["data"], plan["exam"])
+        trace = current_trace()
+        if trace: trace.set("issues", data.issue_count())
+        return blocks_markdown(plan["blocks"])
+
+    def _map_reduce(self, plan, stream, on_text, progress):
+        start = time.perf_counter()
+        sections = plan["sections"]
+        trace = current_trace()
+        progress(f"✂️ 試卷超過 {EXAM_CHAR_LIMIT:,} 字，依大題分成 {len(sections)} 段平行審查...")
+
+        used = []
+
+        async def generate(prompt):
+            text, _, _, usage, model = await asyncio.to_thread(self._call, prompt)
+            if trace: trace.add_usage(usage)
+            used.append(model)
+            return text
+
+        def on_event(kind, i, result, delay):
+            label = sections[i][0]
+            if kind == "retry":
+                progress(f"　⏳ {label}：API 額度/暫時性錯誤，{delay:.0f} 秒後重試 (第 {result.attempts} 次)")
+            elif result.error is None:
+                progress(f"　✅ 已審查：{label} ({result.seconds:.0f} 秒)")
+            else:
+                progress(f"　❌ 審查失敗：{label}：{result.error}", "warning")
+
+        with span("generate_sections"):
+            # 重試已在每次呼叫內處理，這裡只再多給一次機會
+            results = run_generation_batch([p for _, p in sections], generate, max_retries=1,
+                                           concurrency=self.config.batch_concurrency, on_event=on_event)
+        findings = [(label, r.text) for (label, _), r in zip(sections, results) if r.error is None and r.text]
+        failed = [label for (label, _), r in zip(sections, results) if r.error is not None or not r.text]
+        if trace:
+            trace.set("exam_sections", len(sections))
+            trace.set("failed_sections", len(failed))
+        if not findings:
+            raise next((r.error for r in results if r.error is not None), None) or RuntimeError("分段審查皆無回應內容")
+
+        progress(f"🧩 彙整 {len(findings)} 段審查結果為完整報告...")
+        reduce_start = time.perf_counter()
+        reduce_prompt = build_reduce_prompt(plan["meta"], plan["scope"], plan["strictness"], findings, failed,
+                                            plan["score_block"], plan["structured"])
+        with span("generate_reduce"):
+            text, ttft, _, usage, model = self._call(reduce_prompt, stream, on_text, progress)
+        if trace: trace.add_usage(usage)
+        self._record_models(plan, used + [model])
+        if ttft is not None: ttft += reduce_start - start
+        return text, ttft, time.perf_counter() - start
+
+    # --- 試卷擷取 ---
+    def extract_exam_text(self, exam_file):
+        try: result = extract_pdf_pages(exam_file)
+        except Exception as e:
+            logger.warning("exam PDF extraction failed: %s", e)
+            return ""
+        if result.failures:
+            # 個別頁面失敗只略過該頁，並記錄頁碼供追查
+            logger.warning("exam PDF: pages %s failed", [p for p, _ in result.failures])
+            record("pdf_page_failures", [p for p, _ in result.failures])
+        record("exam_pages", result.total_pages)
+        # 去除頁首頁尾與填充字元，同樣的字數上限可放進更多試卷內容
+        with span("text_normalize"): normalized = result.normalized()
+        record("normalize_saved_bytes", normalized.bytes_saved)
+        record("normalize_saved_tokens", normalized.tokens_saved)
+        record("boilerplate_lines", normalized.boilerplate_lines)
+        return normalized.text
+
+    def peek_exam_meta(self, exam_file, pages=2):
+        # 只解析前幾頁做試卷資訊偵測 (偵測只看開頭 1000 字)
+        return extract_exam_meta_enhanced(extract_pdf_text(exam_file, max_pages=pages, normalize=True))
+
+    # --- 教材載入 (下載走執行緒、解析走程序池) ---
+    def load_drive_files(self, files, progress=None):
+        # 下載直接串流寫入教材快取的原檔，解析時以路徑 (mmap) 讀取，不在記憶體保留整份 PDF
+        cache = self.ref_cache()
+        creds = self.drive_credentials()
+        if creds:
+            import drive_client
+            download = lambda file_id, path: drive_client.download_drive_to_file(creds, file_id, path)
+        elif self._drive_service is not None:
+            service = self._drive_service
+            download = lambda file_id, path: _write_file(path, service.files().get_media(fileId=file_id).execute())
+        else:
+            download = lambda file_id, path: False
+        if cache:
+            fetch = lambda f: cache.fetch_drive_file(f, download)
+            store = cache.put_text
+        else:
+            fetch = lambda f: (None, None, _download_bytes(download, f['id']))
+            store = None
+        return load_reference_texts(files, fetch, store, progress=progress)
+
+    def load_local_files(self, files, progress=None):
+        # LocalFile / StoredFile 以路徑分段計算雜湊、解析時 mmap 讀取；其他上傳物件才讀成 bytes
+        cache = self.ref_cache()
+        if cache:
+            fetch = lambda f: cache.fetch_path(f.path) if getattr(f, "path", None) else cache.fetch_bytes(f.getvalue())
+            store = cache.put_text
+        else:
+            fetch = lambda f: (None, None, getattr(f, "path", None) or f.getvalue())
+            store = None
+        return load_reference_texts(files, fetch, store, progress=progress)
+
+    def list_drive_exams(self, folder_id):
+        service = self.drive_service()
+        files = list_folder_pdfs(service, folder_id) if service else []
+        return sorted(files, key=lambda f: f['name'])
+
+    # --- 比對基準決策 (使用者上傳 > 課綱資料庫 > 雲端資料庫 > 通用課綱) ---
+    def reference_set_ids(self, local_ref_files, exam_meta):
+        # 與 resolve_reference_plan 的選擇邏輯一致，但只取識別碼、不下載不解析
+        if local_ref_files:
+            return [f"upload:{source_hash(f)}" for f in local_ref_files]
+        grade, subject = exam_meta.get('grade', ''), exam_meta.get('subject', '')
+        if "未偵測" in grade or "未偵測" in subject: return ["generic"]
+        entries = self.curriculum_entries(subject, grade)
+        if entries: return [f"curriculum:{entries_fingerprint(entries)}"]
+        if not self.config.drive_folder_id: return ["none"]
+        return [drive_version_key(f) for f in self.subject_drive_files(subject)] or ["drive:none"]
+
+    def resolve_reference_plan(self, local_ref_files, exam_meta, progress=_noop_progress):
+        if local_ref_files:
+            # 情境 A：使用者有上傳課本/習作
+            progress(f"📘 使用者已上傳 {len(local_ref_files)} 份教材，以使用者檔案為準。")
+            with span("ref_load"):
+                texts = self.load_local_files(
+                    local_ref_files,
+                    progress=lambda done, total, f: progress(f"　📄 ({done}/{total}) 已讀取：{f.name}"))
+            docs = [(f.name, t) for f, t in zip(local_ref_files, texts) if t]
+            return {"kind": "upload", "docs": docs, "sources": [f"上傳：{f.name}" for f in local_ref_files]}
+
+        # 情境 B：無上傳，啟動自動撈取機制 (只搜科目)
+        detected_grade = exam_meta.get('grade', '')
+        detected_subject = exam_meta.get('subject', '')
+        if "未偵測" in detected_grade or "未偵測" in detected_subject:
+            progress("⚠️ 無法自動識別年級或科目，將改用通用課綱標準審查。", "warning")
+            return {"kind": "generic", "docs": [], "sources": []}
+
+        # 本機課綱資料庫有該科目/年級的條目：直接使用，不需下載教材
+        entries = self.curriculum_entries(detected_subject, detected_grade)
+        if entries:
+            progress(f"📚 課綱資料庫：【{detected_grade}】【{detected_subject}】共 {len(entries)} 條學習表現/學習內容")
+            names = self.curriculum_store().source_names(detected_subject)
+            return {"kind": "curriculum", "docs": [(f"{detected_subject} {detected_grade} 課綱", format_entries(entries))],
+                    "sources": [f"課綱資料庫：{name}" for name in names]}
+
+        progress(f"☁️ 啟動雲端比對：正在搜尋【{detected_subject}】領域課綱...")
+        if not self.config.drive_folder_id: return {"kind": "none", "docs": [], "sources": []}
+
+        # 邏輯修正 V12：只比對「科目」(索引已預先依科目分類)
+        matched_files = self.subject_drive_files(detected_subject)
+        if not matched_files:
+            progress(f"📭 資料庫中未找到 {detected_subject} 的檔案，改用通用標準。", "warning")
+            return {"kind": "missing", "docs": [], "sources": []}
+
+        progress(f"✅ 找到 {len(matched_files)} 份【{detected_subject}】領域檔案，正在提取【{detected_grade}】內容...")
+        with span("ref_load"):
+            texts = self.load_drive_files(
+                matched_files,
+                progress=lambda done, total, f: progress(f"　☁️ ({done}/{total}) 已載入：{f['name']}"))
+        docs = [(f['name'], t) for f, t in zip(matched_files, texts) if t is not None]
+        return {"kind": "drive", "docs": docs, "sources": [f"雲端：{name}" for name, _ in docs]}
+
+    def select_reference_text(self, docs, exam_text, exam_scope, grade, progress=_noop_progress):
+        cache = self.ref_cache()
+        if self.shared_reference():
+            query, budget = "", self.config.context_ref_token_budget
+        else:
+            query, budget = exam_text, self.config.ref_token_budget
+        with span("retrieval"):
+            context, stats = build_reference_context(
+                docs, query, exam_scope, grade, budget_tokens=budget, store=cache.store if cache else None)
+        trace = current_trace()
+        if trace:
+            trace.add("ref_chars_full", sum(len(t) for _, t in docs))
+            trace.add("ref_chars_sent", len(context))
+        if stats.get("retrieved"):
+            progress(f"🔎 教材共 {stats['chunks']} 段 (約 {stats['full_tokens']:,} tokens)，"
+                     f"已挑選最相關的 {stats['selected']} 段 (約 {stats['tokens']:,} tokens)")
+        return context
+
+    def build_reference_block(self, ref_plan, exam_text, exam_scope, exam_meta, progress=_noop_progress):
+        detected_grade = exam_meta.get('grade', '')
+        detected_subject = exam_meta.get('subject', '')
+        kind = ref_plan["kind"]
+        if kind == "upload":
+            ref_text = self.select_reference_text(ref_plan["docs"], exam_text, exam_scope, detected_grade, progress)
+            return (f"【比對基準 (使用者上傳)】：\n{ref_text}\n",
+                    "請以【比對基準】為絕對標準，檢查試卷是否超綱。")
+        if kind == "drive":
+            ref_text = self.select_reference_text(ref_plan["docs"], exam_text, exam_scope, detected_grade, progress)
+            # 關鍵 Prompt 修正：命令 AI 在檔案中找特定年級
+            return (f"【比對基準 (雲端資料庫)】：\n{ref_text}\n",
+                    f"請務必先閱讀【比對基準】檔案，並在其中搜尋對應【{detected_grade}】的「學習表現」與「學習內容」，以此為絕對標準檢查試卷。")
+        if kind == "curriculum":
+            ref_text = self.select_reference_text(ref_plan["docs"], exam_text, exam_scope, detected_grade, progress)
+            return (f"【比對基準 (課綱資料庫：{detected_grade}{detected_subject})】：\n{ref_text}\n",
+                    f"【比對基準】已列出【{detected_grade}】【{detected_subject}】的「學習表現」與「學習內容」條目，請以此為絕對標準檢查試卷是否超綱。")
+        if kind == "generic":
+            return ("【比對基準】：未找到特定教材，請依據台灣教育部 108 課綱標準審查。\n",
+                    "請依據台灣教育部 108 課綱之該年級/科目標準進行審查。")
+        if kind == "missing":
+            return ("【比對基準】：未提供 (資料庫無對應檔)\n",
+                    f"請依據台灣教育部 108 課綱之【{detected_grade}】【{detected_subject}】標準進行審查。")
+        return "", ""
+
+    def cache_key(self, exam_text, local_ref_files, exam_meta, exam_scope, strictness):
+        # 共用比對基準與逐份檢索送出的教材段落不同，結果分開快取
+        version = PROMPT_VERSION + ("+shared" if self.shared_reference() else "") + \
+            ("+json" if self.config.structured_output else "")
+        return review_cache_key(exam_text, self.reference_set_ids(local_ref_files, exam_meta),
+                                exam_scope, strictness, self.config.model_name, version)
+
+    def render_word(self, ai_report, exam_meta, blocks=None):
+        # blocks：結構化結果的報告區塊，直接產生 Word (不再解析 Markdown)
+        from word_report import generate_word_report_doc
+        with span("word_render"):
+            return generate_word_report_doc(ai_report, exam_meta, blocks).getvalue()
+
+    def _store_result(self, key, ai_report, word_bytes, exam_meta, data=None):
+        cache = self.result_cache()
+        # 備援模型的結果不快取，下次仍由主模型重新審查
+        if cache and ai_report and not exam_meta.get("model_fallback"):
+            try: cache.put(key, ai_report, word_bytes, exam_meta, data.to_dict() if data else None)
+            except Exception as e: logger.warning("result cache write failed: %s", e)
+
+    def _cached_result(self, key):
+        cache = self.result_cache()
+        hit = cache.get(key) if cache else None
+        if not hit: return None
+        ai_report, word_bytes, exam_meta, created, data = hit
+        exam_meta['cached_at'] = time.strftime("%Y/%m/%d %H:%M", time.localtime(created))
+        return ReviewResult(ai_report, word_bytes, exam_meta, cached=True,
+                            data=ReviewData.from_dict(data) if data else None)
+
+    def _record_findings(self, name, exam_meta, data):
+        # 結構化結果的逐題問題記入 metrics，供全校常見問題統計
+        log, trace = self.metrics(), current_trace()
+        if not log or not trace or not data: return
+        try: log.write_findings(trace.id, name, exam_meta, data)
+        except Exception as e: logger.warning("findings write failed: %s", e)
+
+    # --- 修訂版試卷 (與上一版比對，只重審修改 / 新增的題目) ---
+    def revision_context(self, local_ref_files, exam_meta, exam_scope, strictness):
+        # 相同科目 / 年級 / 比對基準 / 範圍 / 嚴格度 / 模型 / Prompt 版本的試卷才互相比對版本
+        identity = f"{exam_meta.get('subject', '')}|{exam_meta.get('grade', '')}"
+        return self.cache_key(identity, local_ref_files, exam_meta, exam_scope, strictness)
+
+    def find_revision(self, context, exam):
+        # 回傳 (上一版紀錄, 差異) 或 None
+        store = self.revision_store()
+        if not store or not exam: return None
+        try:
+            with span("revision_diff"): return store.find_previous(context, exam_questions(exam))
+        except Exception as e:
+            logger.warning("revision lookup failed: %s", e)
+            return None
+
+    def record_version(self, context, name, exam, report, previous=None, findings=None):
+        # findings 為 None：完整審查，逐題結果由報告解析，報告本身作為之後修訂版的文字分析來源
+        store = self.revision_store()
+        if not store or not exam or not report: return None
+        try:
+            if findings is None:
+                return store.add(context, name, exam_questions(exam), question_findings(report, exam), report,
+                                 previous, full=True)
+            return store.add(context, name, exam_questions(exam), findings, previous["base_report"],
+                             previous, full=False)
+        except Exception as e:
+            logger.warning("revision store write failed: %s", e)
+            return None
+
+    def _review_revision(self, exam_file, exam_text, exam_meta, exam_scope, strictness, scenario_msg, ref_plan,
+                         ref_block, exam, previous, context, key, progress, on_text, trace):
+        # 回傳 ReviewResult；需重審的題目太多或解析不到逐題結果時回傳 None (改為整份審查)
+        record, diff = previous
+        if not can_carry(record["findings"]): return None
+        carried, linked = carry_findings(record["findings"], diff)
+        targets = set(diff.changed) | set(diff.added) | linked
+        reviewed = [q.qid for q in exam.questions if q.qid in targets]
+        if len(reviewed) > len(exam.questions) * MAX_REVIEW_SHARE: return None
+        progress(f"🔁 修訂版：與第 {record['version']} 版相比修改 {len(diff.changed)} 題、新增 {len(diff.added)} 題、"
+                 f"刪除 {len(diff.removed)} 題，其餘 {len(exam.questions) - len(reviewed)} 題沿用上一版審查結果")
+        trace.set("questions_detected", len(exam.questions))
+        trace.set("revision_reviewed", len(reviewed))
+        trace.set("revision_reused", len(exam.questions) - len(reviewed))
+
+        fresh = {"headers": {}, "rows": {}, "class": {}}
+        used, ttft, gen_seconds = [], None, 0.0
+        if reviewed:
+            with span("prompt_build"):
+                header = find_sections(exam_text)[0][:HEADER_CHARS]
+                prompt = build_revision_prompt(exam_meta, exam_scope, strictness, scenario_msg, ref_block, header,
+                                               revision_questions_text(exam, reviewed), reviewed, score_block(exam))
+            trace.set("prompt_chars", len(prompt))
+            progress(f"🧠 {model_label(self.config.model_name, [])} 正在審查修訂的 {len(reviewed)} 題...")
+            with span("generate"):
+                text, ttft, gen_seconds, usage, model = self._call(prompt, self.config.stream, on_text, progress)
+            trace.add_usage(usage)
+            used.append(model)
+            fresh = question_findings(text, exam, only=reviewed)
+            if not fresh["class"] or fresh["unmapped"]:
+                logger.warning("revision review findings could not be mapped to questions; running a full review")
+                progress("⚠️ 無法解析修訂題目的審查結果，改為整份重新審查", "warning")
+                return None
+
+        info = {"version": record["version"] + 1, "previous": record["version"], "base": record["base_version"],
+                "previous_at": time.strftime("%Y/%m/%d %H:%M", time.localtime(record["created"]))}
+        order = [q.qid for q in exam.questions]
+        summary = revision_summary(info, diff, resolved_issues(record["findings"], diff, fresh),
+                                   [q for q in order if q in linked])
+        marks = {**{q: MARK_CHANGED for q in diff.changed}, **{q: MARK_ADDED for q in diff.added}}
+        findings = merge_findings(carried, fresh)
+        with span("revision_merge"):
+            ai_report = render_revision_report(record["base_report"], findings, exam, diff, marks, summary)
+            ai_report = apply_spec_table(ai_report, exam)
+        trace.set("ttft_ms", round(ttft * 1000) if ttft is not None else None)
+        trace.set("report_chars", len(ai_report))
+        exam_meta["model"] = model_label(self.config.model_name, used)
+        exam_meta["model_fallback"] = any(m != self.config.model_name for m in used)
+        exam_meta["revision"] = {"version": info["version"], "previous": info["previous"], "reviewed": len(reviewed),
+                                 "reused": len(exam.questions) - len(reviewed), "changed": list(diff.changed),
+                                 "added": diff.added, "removed": diff.removed}
+        exam_meta['ttft'] = ttft
+        exam_meta['gen_seconds'] = gen_seconds
+
+        progress("📝 正在製作 Word 報告...")
+        word_bytes = self.render_word(ai_report, exam_meta)
+        self._store_result(key, ai_report, word_bytes, exam_meta)
+        if not exam_meta["model_fallback"]:
+            self.record_version(context, getattr(exam_file, "name", ""), exam, ai_report, record, findings)
+        return ReviewResult(ai_report, word_bytes, exam_meta, ref_sources=ref_plan["sources"])
+
+    # --- 單份審題 ---
+    def review(self, exam_file, local_ref_files=None, strictness="嚴格", exam_scope="",
+               force_refresh=False, progress=_noop_progress, on_text=None):
+        with start_trace("single") as trace:
+            try:
+                result = self._review(exam_file, local_ref_files, strictness, exam_scope,
+                                      force_refresh, progress, on_text, trace)
+            except Exception:
+                self._write_trace(trace, "error")
+                raise
+            self._write_trace(trace, "ok", cached=result.cached)
+            return result
+
+    def _review(self, exam_file, local_ref_files, strictness, exam_scope, force_refresh, progress, on_text, trace):
+        progress("📄 讀取並分析試卷內容...")
+        with span("pdf_extract"):
+            exam_text = self.extract_exam_text(exam_file)
+
+        # 自動偵測試卷資訊
+        with span("meta_detect"):
+            exam_meta = extract_exam_meta_enhanced(exam_text)
+        progress(f"✅ 試卷識別：{exam_meta['info_str']}")
+        trace.set("subject", exam_meta.get('subject'))
+        trace.set("grade", exam_meta.get('grade'))
+        trace.set("exam_chars", len(exam_text))
+        trace.set("exam_chars_sent", len(exam_text))
+
+        # 審題結果快取：同試卷 + 同教材 + 同設定，直接回傳上次結果 (不呼叫 Gemini)
+        with span("result_cache"):
+            key = self.cache_key(exam_text, local_ref_files, exam_meta, exam_scope, strictness)
+            hit = None if force_refresh else self._cached_result(key)
+        if hit: return hit
+
+        ref_plan = self.resolve_reference_plan(local_ref_files, exam_meta, progress)
+        ref_block, scenario_msg = self.build_reference_block(ref_plan, exam_text, exam_scope, exam_meta, progress)
+
+        # 修訂版：找得到上一版就只重審變動的題目 (強制重新審題時整份重審，但仍接續版本編號)
+        with span("exam_parse"):
+            exam = parse_exam(exam_text)
+        context = self.revision_context(local_ref_files, exam_meta, exam_scope, strictness)
+        previous = self.find_revision(context, exam if exam.usable else None)
+        if previous and not force_refresh:
+            result = self._review_revision(exam_file, exam_text, exam_meta, exam_scope, strictness, scenario_msg,
+                                           ref_plan, ref_block, exam, previous, context, key, progress, on_text, trace)
+            if result: return result
+
+        # --- V12.3 嚴格格式化 Prompt (系統指令 + 比對基準可走 context cache) ---
+        with span("prompt_build"):
+            plan = self.plan_generation(exam_meta, exam_scope, strictness, scenario_msg, ref_block, exam_text, exam)
+        trace.set("prompt_chars", self.plan_chars(plan))
+        first_prompt = plan["prompt"] or plan["sections"][0][1]
+        with span("context_cache"):
+            _, _, cache_status = self.gemini().generation_target(first_prompt)
+        trace.set("context_cache", cache_status)
+        if cache_status == "hit": progress("♻️ 沿用已上傳的比對基準 (context cache)，只送出試卷內容")
+        elif cache_status == "created": progress("📤 比對基準已上傳為 context cache，同科目後續審題可直接沿用")
+        progress(f"🧠 {model_label(self.config.model_name, [])} 正在進行深度比對...")
+
+        with span("generate"):
+            ai_report, ttft, gen_seconds = self.generate_report(plan, stream=self.config.stream,
+                                                                on_text=on_text, progress=progress)
+        trace.set("ttft_ms", round(ttft * 1000) if ttft is not None else None)
+        trace.set("report_chars", len(ai_report))
+        exam_meta['ttft'] = ttft
+        exam_meta['gen_seconds'] = gen_seconds
+
+        progress("📝 正在製作 Word 報告...")
+        word_bytes = self.render_word(ai_report, exam_meta, plan["blocks"])
+        self._store_result(key, ai_report, word_bytes, exam_meta, plan["data"])
+        self._record_findings(getattr(exam_file, "name", ""), exam_meta, plan["data"])
+        if not exam_meta.get("model_fallback"):
+            self.record_version(context, getattr(exam_file, "name", ""), plan["exam"], ai_report,
+                                previous[0] if previous else None)
+        return ReviewResult(ai_report, word_bytes, exam_meta, ref_sources=ref_plan["sources"], data=plan["data"])
+
+    # --- 批次審題 (多份試卷並行，受 API 額度限制而非人工操作) ---
+    def review_batch(self, exams, local_ref_files=None, strictness="嚴格", exam_scope="",
+                     force_refresh=False, progress=_noop_progress):
+        # exams: [(名稱, 試卷文字)]；回傳每份試卷的結果 dict (順序與輸入相同)
+        with start_trace("batch") as trace:
+            try:
+                items = self._review_batch(exams, local_ref_files, strictness, exam_scope,
+                                           force_refresh, progress, trace)
+            except Exception:
+                self._write_trace(trace, "error")
+                raise
+            trace.set("exams", len(items))
+            trace.set("cached_exams", sum(1 for item in items if item["status"] == "♻️ 快取"))
+            self._write_trace(trace, "ok")
+            return items
+
+    def _review_batch(self, exams, local_ref_files, strictness, exam_scope, force_refresh, progress, trace):
+        items = []
+        plans = {}
+        for name, exam_text in exams:
+            with span("meta_detect"):
+                exam_meta = extract_exam_meta_enhanced(exam_text)
+            trace.add("exam_chars", len(exam_text))
+            trace.add("exam_chars_sent", len(exam_text))
+            item = {"name": name, "text": exam_text, "meta": exam_meta,
+                    "key": self.cache_key(exam_text, local_ref_files, exam_meta, exam_scope, strictness),
+                    "report": None, "word": None, "data": None, "status": "", "attempts": 0, "seconds": 0.0}
+            items.append(item)
+            if not exam_text.strip():
+                item["status"] = "❌ 無法讀取試卷文字"
+                continue
+            hit = None if force_refresh else self._cached_result(item["key"])
+            if hit:
+                item["report"], item["word"], item["meta"], item["data"] = (hit.ai_report, hit.word_bytes,
+                                                                            hit.exam_meta, hit.data)
+                item["status"] = "♻️ 快取"
+                continue
+            # 同科目同年級 (或同一組上傳教材) 的試卷共用一次比對基準 (課綱資料庫依年級取條目)
+            plan_key = "upload" if local_ref_files else (exam_meta.get('subject', ''), exam_meta.get('grade', ''))
+            if plan_key not in plans:
+                progress(f"📚 準備比對基準：{name}")
+                plans[plan_key] = self.resolve_reference_plan(local_ref_files, exam_meta, progress)
+            ref_block, scenario_msg = self.build_reference_block(plans[plan_key], exam_text, exam_scope, exam_meta)
+            with span("prompt_build"):
+                item["plan"] = self.plan_generation(exam_meta, exam_scope, strictness, scenario_msg, ref_block, exam_text)
+            trace.add("prompt_chars", self.plan_chars(item["plan"]))
+
+        pending = [item for item in items if item.get("plan")]
+        if pending:
+            concurrency = self.config.batch_concurrency
+            progress(f"🧠 Gemini 批次審題：{len(pending)} 份 (同時 {concurrency} 份)...")
+
+            # 同步 client 放到執行緒執行；grpc aio client 綁定事件迴圈，跨批次重複使用會出錯
+            # 長試卷在同一個工作內再依大題分段並行 (分段數受 batch_concurrency 限制)
+            async def generate(plan):
+                text, _, _ = await asyncio.to_thread(self.generate_report, plan)
+                return text
+
+            def on_event(kind, i, result, delay):
+                name = pending[i]["name"]
+                if kind == "retry":
+                    progress(f"　⏳ {name}：API 額度/暫時性錯誤，{delay:.0f} 秒後重試 (第 {result.attempts} 次)")
+                elif result.error is None:
+                    progress(f"　✅ 完成：{name} ({result.seconds:.0f} 秒)")
+                else:
+                    progress(f"　❌ 失敗：{name}：{result.error}", "warning")
+
+            # 每次呼叫內已處理逾時 / 重試 / 備援，這裡只在整份失敗時再試一次
+            with span("generate"):
+                results = run_generation_batch([item["plan"] for item in pending], generate, max_retries=1,
+                                               concurrency=concurrency, on_event=on_event)
+            for item, result in zip(pending, results):
+                item["attempts"], item["seconds"] = result.attempts, result.seconds
+                if result.error is not None or not result.text:
+                    item["status"] = f"❌ {result.error or '無回應內容'}"
+                    continue
+                item["report"], item["data"] = result.text, item["plan"]["data"]
+                item["word"] = self.render_word(result.text, item["meta"], item["plan"]["blocks"])
+                item["status"] = "✅ 完成"
+                self._store_result(item["key"], item["report"], item["word"], item["meta"], item["data"])
+                self._record_findings(item["name"], item["meta"], item["data"])
+                self._record_batch_version(item, local_ref_files, exam_scope, strictness)
+        return items
+
+
+    def _record_batch_version(self, item, local_ref_files, exam_scope, strictness):
+        # 批次審題一律整份審查；記錄版本供之後上傳修訂版時比對
+        exam = item["plan"]["exam"]
+        if not exam or item["meta"].get("model_fallback") or not self.revision_store(): return
+        context = self.revision_context(local_ref_files, item["meta"], exam_scope, strictness)
+        previous = self.find_revision(context, exam)
+        self.record_version(context, item["name"], exam, item["report"], previous[0] if previous else None)
+
+
+def batch_summary_rows(items):
+    rows = []
+    structured = any(item.get("data") for item in items)
+    for idx, item in enumerate(items, 1):
+        rows.append({
+            "序號": idx, "檔名": item["name"], "試卷資訊": item["meta"]['info_str'],
+            "狀態": item["status"], "嘗試次數": item["attempts"],
+            "耗時(秒)": round(item["seconds"], 1), "報告字數": len(item["report"] or ""),
+        })
+        # 結構化結果可直接統計問題數 (❌ 必須修改 / 全部)
+        if structured:
+            data = item.get("data")
+            rows[-1]["問題數"] = f"{data.issue_count('error')}/{data.issue_count()}" if data else "-"
+    return rows
+
+
+def batch_report_files(items):
+    files = []
+    for idx, item in enumerate(items, 1):
+        stem = item["name"].rsplit(".", 1)[0]
+        if item["word"]: files.append((f"{idx:02d}_{stem}_審題報告.docx", item["word"]))
+    return files
@@ -0,0 +1,292 @@
+import re
+import json
+from dataclasses import dataclass, field, asdict, fields
+
+from exam_parser import (LEVELS, ExamStructure, Section, Question, expand_question_ids, spec_table_rows,
+                         score_summary_rows)
+
+# --- 結構化審題結果 (JSON) ---
+# 啟用 STRUCTURED_OUTPUT 時，Gemini 依 REVIEW_SCHEMA 回傳逐題審查結果 (JSON)，不再輸出 Markdown 報告。
+# 結果解析成 ReviewData 後直接組成報告區塊 (word_report 的區塊格式)：Word 由區塊直接產生，
+# 畫面與 .md 匯出則由同一份區塊轉成 Markdown，不必再從 AI 的 Markdown 反向解析表格。
+
+STEP_TITLES = {"1": "【命題範圍與合規性檢核】", "2": "【題幹與邏輯品質審查】", "3": "【素養導向深度審查】",
+               "4": "【雙向細目表核算】", "5": "【難易度與負擔分析】", "6": "【總結與建議】"}
+ISSUE_STEP = {"scope": "1", "quality": "2"}
+SEVERITY_LABELS = {"error": "❌ 必須修改", "warning": "⚠️ 疑義"}
+VERDICT_LABELS = {"authentic": "✅ 真素養", "superficial": "⚠️ 假素養"}
+DIFFICULTY = ["L1", "L2", "L3"]
+PASS_LINE = "✅ 本大項全數通過，無異常試題。"
+
+_QUESTION = {"type": "string", "description": "題目代號 (有【系統計算配分】時沿用其題目代號，否則用試卷原題號並註明大題)"}
+
+
+def _enum(values, description):
+    return {"type": "string", "format": "enum", "enum": list(values), "description": description}
+
+
+def _array(properties, required):
+    return {"type": "array", "items": {"type": "object", "properties": properties, "required": required}}
+
+
+# Gemini response_schema (OpenAPI 子集)
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "issues": _array({
+            "question": _QUESTION,
+            "step": _enum(ISSUE_STEP, "scope：Step 1 超綱 / 課綱不符；quality：Step 2 題幹與邏輯瑕疵"),
+            "type": {"type": "string", "description": "問題類型 (簡短名詞，例如：超綱、語意不清、選項不互斥、誘答力不足)"},
+            "severity": _enum(SEVERITY_LABELS, "error：❌ 必須修改；warning：⚠️ 疑義"),
+            "description": {"type": "string", "description": "問題說明"},
+            "suggestion": {"type": "string", "description": "具體修改建議"},
+        }, ["question", "step", "type", "severity", "description"]),
+        "literacy": _array({
+            "question": _QUESTION,
+            "verdict": _enum(VERDICT_LABELS, "authentic：✅ 真素養；superficial：⚠️ 假素養"),
+            "comment": {"type": "string", "description": "簡評"},
+        }, ["question", "verdict", "comment"]),
+        "classification": _array({
+            "question": _QUESTION,
+            "unit": {"type": "string", "description": "單元名稱"},
+            "level": _enum(LEVELS, "Bloom 認知層次"),
+        }, ["question", "unit", "level"]),
+        "difficulty": _array({
+            "question": _QUESTION,
+            "level": _enum(DIFFICULTY, "L1 易 / L2 中 / L3 難"),
+            "note": {"type": "string", "description": "說明 (計算過度繁瑣但觀念簡單請註明)"},
+        }, ["question", "level"]),
+        "distribution": {"type": "string", "description": "成績分佈預測 (高 / 中 / 低分群的表現)"},
+        "suggestions": {"type": "array", "items": {"type": "string"}, "description": "3-5 點總體優化建議"},
+    },
+    "required": ["issues", "literacy", "classification", "difficulty", "distribution", "suggestions"],
+}
+
+
+@dataclass
+class Issue:
+    question: str
+    step: str
+    type: str
+    severity: str
+    description: str = ""
+    suggestion: str = ""
+
+
+@dataclass
+class LiteracyNote:
+    question: str
+    verdict: str
+    comment: str = ""
+
+
+@dataclass
+class Classification:
+    question: str
+    unit: str
+    level: str
+
+
+@dataclass
+class DifficultyNote:
+    question: str
+    level: str
+    note: str = ""
+
+
+@dataclass
+class ReviewData:
+    issues: list = field(default_factory=list)
+    literacy: list = field(default_factory=list)
+    classification: list = field(default_factory=list)
+    difficulty: list = field(default_factory=list)
+    distribution: str = ""
+    suggestions: list = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d):
+        def items(key, kind):
+            names = [f.name for f in fields(kind)]
+            out = []
+            for raw in d.get(key) or []:
+                if not isinstance(raw, dict): continue
+                values = {n: str(raw[n]).strip() for n in names if raw.get(n) is not None}
+                if all(n in values for n in names if n in ("question", "step", "verdict", "level", "severity")):
+                    out.append(kind(**{n: values.get(n, "") for n in names}))
+            return out
+        return cls(issues=[i for i in items("issues", Issue) if i.step in ISSUE_STEP],
+                   literacy=items("literacy", LiteracyNote),
+                   classification=[c for c in items("classification", Classification) if c.level in LEVELS],
+                   difficulty=items("difficulty", DifficultyNote),
+                   distribution=str(d.get("distribution") or "").strip(),
+                   suggestions=[str(s).strip() for s in d.get("suggestions") or [] if str(s).strip()])
+
+    def issue_count(self, severity=None):
+        return sum(1 for i in self.issues if severity is None or i.severity == severity)
+
+
+_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+
+def parse_review_json(text):
+    # 回傳 ReviewData；不是合法 JSON 物件時回傳 None
+    try: raw = json.loads(_FENCE.sub("", text or ""))
+    except ValueError: return None
+    if not isinstance(raw, dict): return None
+    return ReviewData.from_dict(raw)
+
+
+def normalize_questions(data, exam):
+    # AI 的題號 (「第3題」「一、3」等) 換成試卷的題目代號；對不到的保留原文
+    if not exam: return data
+    known = {q.qid for q in exam.questions}
+    for item in data.issues + data.literacy + data.classification + data.difficulty:
+        ids = expand_question_ids(item.question, known)
+        if ids: item.question = "、".join(ids)
+    return data
+
+
+def _classification_exam(data):
+    # 試卷解析不到題目時，以 AI 列出的題目組成單一大題 (以題數計算比重)
+    qids = list(dict.fromkeys(c.question for c in data.classification))
+    return ExamStructure(sections=[Section("全卷", questions=[Question(q, i) for i, q in enumerate(qids, 1)])])
+
+
+# --- 報告區塊 (與 word_report.parse_markdown_blocks 相同格式) ---
+_CONTROL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _runs(value, bold=False, italic=False):
+    # 儲存格內換行改為換行 run；「**文字**」整格視為粗體 (合計列)
+    text = _CONTROL.sub("", str(value))
+    if len(text) > 4 and text.startswith("**") and text.endswith("**"): text, bold = text[2:-2], True
+    runs = []
+    for i, line in enumerate(text.split("\n")):
+        if i: runs.append(("\n", False, False))
+        if line: runs.append((line, bold, italic))
+    return runs
+
+
+def _heading(step):
+    return ("heading", 2, _runs(f"Step {step}: {STEP_TITLES[step]}"))
+
+
+def _table(header, rows):
+    return ("table", [_runs(h) for h in header], [[_runs(c) for c in row] for row in rows])
+
+
+def _order(exam):
+    return {q.qid: i for i, q in enumerate(exam.questions)} if exam else {}
+
+
+def _sorted(items, order):
+    return sorted(items, key=lambda item: order.get(item.question.split("、")[0], len(order)))
+
+
+def report_blocks(data, exam=None):
+    order = _order(exam)
+    blocks = []
+    for step, name in (("1", "scope"), ("2", "quality")):
+        blocks.append(_heading(step))
+        issues = _sorted([i for i in data.issues if i.step == name], order)
+        if issues:
+            blocks.append(_table(["題號", "嚴重度", "問題類型", "說明", "修改建議"],
+                                 [[i.question, SEVERITY_LABELS.get(i.severity, i.severity), i.type, i.description,
+                                   i.suggestion or "-"] for i in issues]))
+        else:
+            blocks.append(("para", _runs(PASS_LINE)))
+
+    blocks.append(_heading("3"))
+    if data.literacy:
+        blocks.append(_table(["題號", "判定", "簡評"],
+                             [[n.question, VERDICT_LABELS.get(n.verdict, n.verdict), n.comment]
+                              for n in _sorted(data.literacy, order)]))
+    else:
+        blocks.append(("para", _runs("(本卷無具代表性的素養題)")))
+
+    blocks += _spec_blocks(data, exam)
+
+    blocks.append(_heading("5"))
+    if data.difficulty:
+        blocks.append(_table(["題號", "難度", "說明"],
+                             [[n.question, n.level, n.note or "-"] for n in _sorted(data.difficulty, order)]))
+    if data.distribution:
+        blocks.append(("bold", _runs("成績分佈預測")))
+        blocks.append(("para", _runs(data.distribution)))
+
+    blocks.append(_heading("6"))
+    fixes = [i for i in _sorted(data.issues, order) if i.severity == "error" and i.suggestion]
+    for i in fixes:
+        blocks.append(("bullet", 0, _runs(i.question, bold=True) + _runs(f"：{i.suggestion}")))
+    if fixes and data.suggestions: blocks.append(("bold", _runs("總體優化建議")))
+    for s in data.suggestions:
+        blocks.append(("bullet", 0, _runs(s)))
+    return blocks
+
+
+def _spec_blocks(data, exam):
+    # Step 4：題數、配分、比重由本機計算；單元與認知層次取自 AI 的逐題分類
+    blocks = [_heading("4")]
+    parsed = bool(exam and exam.usable)
+    if not parsed:
+        if not data.classification: return blocks + [("para", _runs("(AI 未提供題目分類)"))]
+        exam = _classification_exam(data)
+    classification = {}
+    known = {q.qid for q in exam.questions}
+    for c in data.classification:
+        for qid in expand_question_ids(c.question, known) or [c.question]:
+            classification[qid] = (c.unit or "(未標示單元)", c.level)
+    missing = [q.qid for q in exam.questions if q.qid not in classification]
+    blocks.append(("para", _runs("(題數、配分與比重由系統依試卷計算；單元與認知層次由 AI 判斷)", italic=True)))
+    blocks.append(_table(*spec_table_rows(exam, classification)))
+    if parsed:
+        blocks.append(("bold", _runs("各大題配分")))
+        blocks.append(_table(*score_summary_rows(exam)))
+        if not exam.points_known: blocks.append(("para", _runs("(比重以題數計算)")))
+    notes = list(exam.warnings)
+    if missing: notes.append(f"AI 未分類的題目：{'、'.join(missing)}")
+    blocks += [("bullet", 0, _runs(f"⚠️ {n}")) for n in notes]
+    order = _order(exam)
+    rows = sorted(classification.items(), key=lambda kv: order.get(kv[0], len(order)))
+    if rows:
+        blocks.append(("bold", _runs("題目分類明細")))
+        blocks.append(_table(["題號", "單元名稱", "認知層次"], [[qid, unit, level] for qid, (unit, level) in rows]))
+    return blocks
+
+
+# --- 區塊 → Markdown (畫面顯示、.md 匯出與修訂版比對共用) ---
+def _runs_markdown(runs, cell=False):
+    out = []
+    for text, bold, italic in runs:
+        if text == "\n":
+            out.append(" " if cell else "  \n")
+            continue
+        if cell: text = text.replace("|", "\\|")
+        if bold and italic: text = f"***{text}***"
+        elif bold: text = f"**{text}**"
+        elif italic: text = f"*{text}*"
+        out.append(text)
+    return "".join(out)
+
+
+def blocks_markdown(blocks):
+    lines = []
+    for block in blocks:
+        kind = block[0]
+        if kind == "heading":
+            lines += ["", "#" * (block[1] + 1) + " " + _runs_markdown(block[2]), ""]
+        elif kind == "bold":
+            lines += ["", "#### " + _runs_markdown(block[1]), ""]
+        elif kind in ("bullet", "numbered"):
+            lines.append("  " * block[1] + "- " + _runs_markdown(block[2]))
+        elif kind == "table":
+            header, rows = block[1], block[2]
+            lines += ["", "| " + " | ".join(_runs_markdown(c, True) for c in header) + " |", "|" + "---|" * len(header)]
+            lines += ["| " + " | ".join(_runs_markdown(c, True) for c in row) + " |" for row in rows]
+            lines.append("")
+        else:
+            lines += [_runs_markdown(block[1]), ""]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip() + "\n"
@@ -0,0 +1,54 @@
+from benchmarks.synthetic import make_cjk_pdf
+from curriculum_store import CurriculumStore, ingest_drive_folder
+from drive_fake import FakeDriveService
+from review_pipeline import ReviewConfig, ReviewPipeline
+
+FOLDER_ID = "curriculum"
+MATH = "數學領域課綱\n學習表現\nn-Ⅲ-1 理解數的十進位位值結構。\n學習內容\nN-5-1 十進位的位值系統：多位小數與整數。\n"
+
+
+class FlakyDrive(FakeDriveService):
+    def __init__(self):
+        super().__init__()
+        self.broken = set()
+
+    def _download(self, file_id):
+        if file_id in self.broken: raise ConnectionError("connection reset")
+        return super()._download(file_id)
+
+
+def make_pipeline(tmp_path, drive):
+    config = ReviewConfig(gemini_api_key="x", drive_folder_id=FOLDER_ID, ref_cache_dir=str(tmp_path / "ref"),
+                          result_cache_dir=str(tmp_path / "res"), drive_index_dir=str(tmp_path / "idx"),
+                          metrics_db=str(tmp_path / "m.db"), revision_db=str(tmp_path / "rev.db"))
+    return ReviewPipeline(config, drive_service=drive)
+
+
+def codes(store):
+    return {e["code"] for e in store.lookup("數學", "五年級")}
+
+
+def test_failed_download_keeps_entries_and_retries(tmp_path):
+    drive = FlakyDrive()
+    file_id = drive.add_file(FOLDER_ID, "數學領域課綱.pdf", make_cjk_pdf(MATH), modified="2026-01-01T00:00:00.000Z")
+    store = CurriculumStore(str(tmp_path / "curriculum.sqlite3"))
+    stats = ingest_drive_folder(store, make_pipeline(tmp_path, drive), FOLDER_ID, progress=lambda m: None)
+    assert stats["parsed"] == 1 and stats["failed"] == 0
+    before = codes(store)
+    assert before
+
+    # 檔案更新但下載失敗：舊條目與舊版本保留
+    drive.add_file(FOLDER_ID, "數學領域課綱.pdf", make_cjk_pdf(MATH + "n-Ⅲ-2 熟練多位數的加減運算。\n"),
+                   modified="2026-02-01T00:00:00.000Z")
+    drive.broken.add(file_id)
+    messages = []
+    stats = ingest_drive_folder(store, make_pipeline(tmp_path / "2", drive), FOLDER_ID, progress=messages.append)
+    assert stats["parsed"] == 0 and stats["failed"] == 1
+    assert any("數學領域課綱.pdf" in m and "失敗" in m for m in messages)
+    assert codes(store) == before
+
+    # 下次增量更新重試成功
+    drive.broken.clear()
+    stats = ingest_drive_folder(store, make_pipeline(tmp_path / "3", drive), FOLDER_ID, progress=lambda m: None)
+    assert stats["parsed"] == 1 and stats["failed"] == 0
+    assert codes(store) == before | {"n-Ⅲ-2"}
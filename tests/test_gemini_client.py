@@ -0,0 +1,153 @@
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import gemini_client
+from gemini_client import GeminiClient
+from gemini_fake import FakeGeminiBackend
+from prompts import ReviewPrompt
+from retrieval import estimate_tokens
+
+SYSTEM = "你是一位資深的國小命題審查委員。" * 40
+REFERENCE = "第一單元 分數的加減：異分母分數相加時先通分。" * 80
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # GeminiClient 與假後端共用同一個時鐘，才能模擬 cache 到期
+    clock = Clock()
+    monkeypatch.setattr(gemini_client, "time", SimpleNamespace(time=clock))
+    return clock
+
+
+def make_client(clock, **kwargs):
+    backend = FakeGeminiBackend(clock=clock)
+    return GeminiClient("x", "models/gemini-test", backend=backend, min_cache_tokens=100, **kwargs), backend
+
+
+def prompt(message="請審查這份試卷。", reference=REFERENCE):
+    return ReviewPrompt(SYSTEM, reference, message)
+
+
+def generate(client, p):
+    model, contents, status = client.generation_target(p)
+    model.generate_content(contents)
+    return status, client.backend().calls[-1]
+
+
+def test_cache_created_once_per_reference_and_reused(clock):
+    client, backend = make_client(clock)
+    statuses = [generate(client, prompt(f"試卷 {i}"))[0] for i in range(3)]
+    assert statuses == ["created", "hit", "hit"]
+    assert backend.created == 1
+    assert {c["context"] for c in backend.calls} == {"cachedContents/fake-1"}
+
+    status, _ = generate(client, prompt(reference=REFERENCE + "第二單元 小數。"))
+    assert status == "created"
+    assert backend.created == 2
+
+
+def test_restarted_client_adopts_live_cache(clock):
+    client, backend = make_client(clock)
+    generate(client, prompt())
+    restarted = GeminiClient("x", "models/gemini-test", backend=backend, min_cache_tokens=100)
+    assert generate(restarted, prompt())[0] == "hit"
+    assert backend.created == 1
+
+
+def test_expired_cache_is_recreated(clock):
+    client, backend = make_client(clock, cache_ttl=600)
+    generate(client, prompt())
+    clock.now += 601
+    status, call = generate(client, prompt())
+    assert status == "created"
+    assert backend.created == 2
+    assert call["context"] == "cachedContents/fake-2"
+
+
+def test_cache_extended_before_expiry(clock):
+    client, backend = make_client(clock, cache_ttl=600)
+    generate(client, prompt())
+    clock.now += 400
+    assert generate(client, prompt())[0] == "hit"
+    assert backend.extended == 1
+    clock.now += 400
+    assert generate(client, prompt())[0] == "hit"
+    assert backend.created == 1
+
+
+def test_cached_prefix_not_sent_as_fresh_input(clock):
+    client, _ = make_client(clock)
+    p = prompt()
+    _, created = generate(client, p)
+    _, hit = generate(client, p)
+    for call in (created, hit):
+        assert call["input_tokens"] == estimate_tokens(p.message)
+        assert call["cached_tokens"] >= estimate_tokens(SYSTEM + REFERENCE)
+
+    uncached, _ = make_client(clock, context_cache=False)
+    status, call = generate(uncached, p)
+    assert status == "off"
+    assert call["cached_tokens"] == 0
+    assert call["input_tokens"] == estimate_tokens(p.contents()) + estimate_tokens(SYSTEM)
+
+
+def test_small_prompt_skips_cache(clock):
+    client, backend = make_client(clock)
+    p = ReviewPrompt("審題。", "分數。", "請審查這份試卷。")
+    status, call = generate(client, p)
+    assert status == "off"
+    assert backend.created == 0
+    assert call["input_tokens"] == estimate_tokens(p.contents()) + estimate_tokens(p.system)
+
+
+class SlowBackend(FakeGeminiBackend):
+    # create_cache 卡住直到 release 被設定，模擬上傳大份比對基準
+    def __init__(self, clock):
+        super().__init__(clock=clock)
+        self.uploading = threading.Event()
+        self.release = threading.Event()
+
+    def create_cache(self, model_name, display_name, system_instruction, contents, ttl):
+        if contents[0].startswith("數學"):
+            self.uploading.set()
+            assert self.release.wait(5)
+        return super().create_cache(model_name, display_name, system_instruction, contents, ttl)
+
+
+def test_cache_upload_does_not_block_other_subjects(clock):
+    backend = SlowBackend(clock)
+    client = GeminiClient("x", "models/gemini-test", backend=backend, min_cache_tokens=100)
+    science = prompt(reference="自然" + REFERENCE)
+    assert generate(client, science)[0] == "created"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        math = [pool.submit(generate, client, prompt(reference="數學" + REFERENCE)) for _ in range(3)]
+        assert backend.uploading.wait(5)
+        # 數學的 cache 還在上傳：自然科的審題直接命中，不必等待
+        assert pool.submit(generate, client, science).result(timeout=2)[0] == "hit"
+        backend.release.set()
+        statuses = sorted(f.result(timeout=5)[0] for f in math)
+    assert statuses == ["created", "hit", "hit"]
+    assert backend.created == 2
+
+
+def test_failed_upload_falls_back_for_waiting_requests(clock):
+    backend = SlowBackend(clock)
+    client = GeminiClient("x", "models/gemini-test", backend=backend, min_cache_tokens=100)
+    backend.create_cache = lambda *args: (backend.uploading.set(), backend.release.wait(5), 1 / 0)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        requests = [pool.submit(client.context_model, SYSTEM, REFERENCE) for _ in range(3)]
+        assert backend.uploading.wait(5)
+        backend.release.set()
+        assert [f.result(timeout=5) for f in requests] == [(None, "off")] * 3
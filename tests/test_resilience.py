@@ -0,0 +1,104 @@
+import time
+import threading
+
+import pytest
+
+from benchmarks.synthetic import synthetic_exam_text, synthetic_report, make_cjk_pdf
+from gemini_client import GeminiClient
+from gemini_fake import FakeGeminiBackend
+from resilience import GenerationPolicy, ResilientGenerator, GenerationFailed
+from review_pipeline import ReviewConfig, ReviewPipeline, BytesFile
+
+
+def policy(**kwargs):
+    return GenerationPolicy(**{"deadline": 10, "base_delay": 0.01, "max_delay": 0.02, **kwargs})
+
+
+class Requests:
+    # 假的 call：依序給每個請求一組 (耗時, 結果)，記錄仍在採用中 (live) 時送出的片段
+    def __init__(self, *plans):
+        self.plans = list(plans)
+        self.chunks = []
+        self.models = []
+        self.lock = threading.Lock()
+
+    def __call__(self, model, timeout, live):
+        with self.lock:
+            n = len(self.models)
+            self.models.append(model)
+            seconds, result = self.plans[n]
+        for i in range(int(seconds / 0.05)):
+            time.sleep(0.05)
+            if live.is_set():
+                with self.lock: self.chunks.append(n)
+        if isinstance(result, Exception): raise result
+        return result
+
+
+def test_primary_result_streams():
+    requests = Requests((0.2, "ok"))
+    assert ResilientGenerator(policy()).run(requests, "pro") == ("ok", "pro")
+    assert set(requests.chunks) == {0}
+
+
+def test_attempt_timeout_retries_and_mutes_abandoned_request():
+    requests = Requests((1.5, "late"), (0.2, "ok"))
+    events = []
+    result = ResilientGenerator(policy(attempt_timeout=0.5)).run(requests, "pro", on_event=lambda k, d: events.append(k))
+    assert result == ("ok", "pro")
+    assert events == ["retry"]
+    time.sleep(1.2)
+    # 逾時的請求被放棄後不再回報片段，只剩重試的請求
+    first_stream_end = requests.chunks.index(1)
+    assert 0 not in requests.chunks[first_stream_end:]
+
+
+def test_hedge_wins_and_primary_stops_streaming():
+    requests = Requests((1.5, "slow"), (0.1, "hedged"))
+    events = []
+    generator = ResilientGenerator(policy(hedge=True, hedge_after=0.2))
+    assert generator.run(requests, "pro", on_event=lambda k, d: events.append(k)) == ("hedged", "pro")
+    assert events == ["hedge"]
+    time.sleep(1.5)
+    # 對沖請求不回報片段；主請求在對沖勝出後停止回報
+    assert 1 not in requests.chunks
+    assert len(requests.chunks) <= 6
+
+
+def test_fallback_model_after_retries():
+    busy = RuntimeError("429 Resource has been exhausted")
+    requests = Requests((0, busy), (0, busy), (0.1, "fast"))
+    events = []
+    generator = ResilientGenerator(policy(max_retries=1, fallback_model="flash"))
+    assert generator.run(requests, "pro", on_event=lambda k, d: events.append(k)) == ("fast", "flash")
+    assert requests.models == ["pro", "pro", "flash"]
+    assert events == ["retry", "fallback"]
+
+
+def test_non_retryable_error_is_raised():
+    requests = Requests((0, ValueError("bad prompt")))
+    with pytest.raises(ValueError):
+        ResilientGenerator(policy()).run(requests, "pro")
+    assert requests.models == ["pro"]
+
+
+def test_deadline_exhausted():
+    requests = Requests(*[(3, "late")] * 5)
+    with pytest.raises(GenerationFailed):
+        ResilientGenerator(policy(deadline=2.5, attempt_timeout=0.5, max_retries=1)).run(requests, "pro")
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_review_reports_partial_text(tmp_path, stream):
+    backend = FakeGeminiBackend(reply=synthetic_report)
+    config = ReviewConfig(gemini_api_key="x", stream=stream, ref_cache_dir=str(tmp_path / "ref"),
+                          result_cache_dir=str(tmp_path / "res"), drive_index_dir=str(tmp_path / "idx"),
+                          metrics_db=str(tmp_path / "m.db"), revision_db=str(tmp_path / "rev.db"))
+    pipeline = ReviewPipeline(config, gemini=GeminiClient("x", config.model_name, backend=backend))
+    partials = []
+    result = pipeline.review(BytesFile("exam.pdf", make_cjk_pdf(synthetic_exam_text(2, 5))), [],
+                             on_text=lambda text, ttft: partials.append((text, ttft)))
+    assert result.ai_report
+    if stream:
+        assert partials and all(ttft is not None for _, ttft in partials)
+        assert result.ai_report.startswith(partials[0][0][:50])
@@ -0,0 +1,115 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+from retrieval import estimate_tokens
+
+# --- PDF 擷取文字正規化 (送進 Prompt 前) ---
+# pypdf 擷取的文字含每頁重複的頁首頁尾 (校名、班級/姓名/座號、頁碼)、作答底線、連續空白與全形半形混雜，
+# 這些都會佔用試卷 / 教材的字數與 token 預算。依頁處理：
+# 1. NFKC 統一全形英數與標點 (圈號、上標、單位符號等 NFKC 會改變意思的字元保留原字)；
+# 2. 作答底線、點線等填充字元縮短為 3 個，連續空白合併，空行最多保留一行；
+# 3. 在多數頁面的頁首 / 頁尾重複出現的文字行 (數字不計) 只保留第一頁 (試卷資訊偵測看第一頁)，頁碼行移除。
+# regex 都預先編譯、逐行處理，整本教材也是線性時間。
+
+EDGE_LINES = 3            # 頁首 / 頁尾各檢查幾行
+REPEAT_SHARE = 0.5        # 在超過此比例的頁面重複出現才視為頁首頁尾
+MAX_BOILERPLATE_CHARS = 80
+
+# NFKC 會改變意思或變長的字元：上下標、圈號 / 括號數字、CJK 單位與圈字、刪節號
+_KEEP = re.compile(r'([\u00b2\u00b3\u00b9\u2025\u2026\u2070-\u209f\u2460-\u24ff\u3200-\u33ff]+)')
+_ZERO_WIDTH = re.compile(r'[\u200b-\u200d\u2060\ufeff]')
+_SPACES = re.compile(r'[ \t\f\v\u00a0\u3000]+')
+_FILLER = re.compile(r'_(?: ?_){3,}|\.(?: ?\.){3,}|…(?: ?…)+|-{4,}|={4,}|~{4,}|\*{4,}|·{4,}|—{3,}|─{3,}')
+_DIGITS = re.compile(r'\d+')
+_PAGE_LABEL = re.compile(r'^(?:第\s*\d{1,4}\s*頁(?:\s*[,/]?\s*共\s*\d{1,4}\s*頁)?|共\s*\d{1,4}\s*頁\s*[,/]?\s*第\s*\d{1,4}\s*頁|'
+                         r'\d{1,4}\s*/\s*\d{1,4}|page\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?)$', re.I)
+_BARE_NUMBER = re.compile(r'^[-(\[]?\s*(\d{1,4})\s*[-)\]]?$')
+# 題號與大題標題即使重複出現也不當作頁首頁尾
+_PROTECTED = re.compile(r'^(?:\(\s*[A-Da-d○×Oo✓]?\s*\)\s*)?\(?\d{1,3}\s*[).、]|^第?[一二三四五六七八九十]{1,3}\s*(?:[、.]|大題)')
+
+
+@dataclass
+class NormalizedText:
+    text: str
+    chars_before: int
+    bytes_before: int
+    tokens_before: int
+    boilerplate_lines: int = 0
+
+    @property
+    def chars_saved(self):
+        return self.chars_before - len(self.text)
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - len(self.text.encode("utf-8"))
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - estimate_tokens(self.text)
+
+
+def _nfkc(text):
+    parts = _KEEP.split(text)
+    parts[::2] = [unicodedata.normalize("NFKC", p) for p in parts[::2]]
+    return "".join(parts)
+
+
+def _squeeze(m):
+    return m.group().replace(" ", "")[:3]
+
+
+def _clean_lines(page):
+    lines = []
+    for line in _nfkc(_ZERO_WIDTH.sub("", page)).split("\n"):
+        line = _SPACES.sub(" ", _FILLER.sub(_squeeze, line)).strip()
+        if line or (lines and lines[-1]): lines.append(line)
+    while lines and not lines[-1]: lines.pop()
+    return lines
+
+
+def _edges(lines):
+    # 頁首 / 頁尾各 EDGE_LINES 個非空行的索引
+    filled = [i for i, l in enumerate(lines) if l]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def _boilerplate_key(line):
+    if len(line) > MAX_BOILERPLATE_CHARS or _PROTECTED.match(line): return None
+    return _DIGITS.sub("#", line)
+
+
+def _is_page_number(line, page_no):
+    if _PAGE_LABEL.match(line): return True
+    m = _BARE_NUMBER.match(line)
+    # 單獨的數字只在等於頁碼時移除 (避免刪掉表格或算式中的數字)
+    return bool(m) and int(m.group(1)) == page_no
+
+
+def normalize_pages(pages):
+    # pages：每頁擷取文字；回傳 NormalizedText (正規化後全文與節省量)
+    raw = "".join(p + "\n" for p in pages)
+    pages = [_clean_lines(p) for p in pages]
+    edges = [_edges(lines) for lines in pages]
+
+    repeated = set()
+    if len(pages) >= 2:
+        counts = Counter()
+        for lines, idx in zip(pages, edges):
+            counts.update({k for i in idx if (k := _boilerplate_key(lines[i]))})
+        threshold = max(2, math.ceil(len(pages) * REPEAT_SHARE))
+        repeated = {k for k, n in counts.items() if n >= threshold}
+
+    out, removed = [], 0
+    for page_no, (lines, idx) in enumerate(zip(pages, edges), 1):
+        drop = {i for i in idx if _is_page_number(lines[i], page_no) or
+                (page_no > 1 and _boilerplate_key(lines[i]) in repeated)}
+        removed += len(drop)
+        kept = [l for i, l in enumerate(lines) if i not in drop]
+        out.append("\n".join(l for k, l in enumerate(kept) if l or (k and kept[k - 1])).strip("\n"))
+    text = "".join(p + "\n" for p in out if p)
+    return NormalizedText(text, len(raw), len(raw.encode("utf-8")), estimate_tokens(raw), removed)
+
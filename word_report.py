@@ -0,0 +1,309 @@
+from io import BytesIO
+import re
+import logging
+import functools
+from xml.sax.saxutils import escape
+from docx import Document
+from docx.shared import Pt, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# --- Word 生成引擎 (逐段呼叫 python-docx；保留作為備援與效能比較基準) ---
+def parse_markdown_to_word(doc, text):
+    lines = text.split('\n')
+    table_buffer = []
+    
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+        
+        if line.startswith('|'):
+            table_buffer.append(line)
+            continue
+        else:
+            if table_buffer:
+                create_word_table(doc, table_buffer)
+                table_buffer = [] 
+
+        if line.startswith('### '):
+            doc.add_heading(line.replace('### ', ''), level=2)
+        elif line.startswith('## '):
+            doc.add_heading(line.replace('## ', ''), level=1)
+        elif line.startswith('#### '):
+            p = doc.add_paragraph()
+            run = p.add_run(line.replace('#### ', ''))
+            run.bold = True
+            run.font.size = Pt(12)
+        else:
+            p = doc.add_paragraph()
+            clean_line = line
+            
+            if line.startswith('* ') or line.startswith('- '):
+                clean_line = line[2:].strip()
+                if re.match(r'^(\*\*)?(問題|建議|現狀|分析|依據|結論|優點)', clean_line):
+                    pass 
+                else:
+                    p.style = 'List Bullet'
+            
+            parts = re.split(r'(\*\*.*?\*\*)', clean_line)
+            for part in parts:
+                if part.startswith('**') and part.endswith('**'):
+                    run = p.add_run(part[2:-2])
+                    run.bold = True
+                else:
+                    p.add_run(part)
+
+    if table_buffer:
+        create_word_table(doc, table_buffer)
+
+def create_word_table(doc, markdown_lines):
+    try:
+        rows = [line for line in markdown_lines if '---' not in line]
+        if not rows: return
+
+        header_line = rows[0].strip().strip('|')
+        headers = [h.strip() for h in header_line.split('|')]
+        col_count = len(headers)
+        
+        table = doc.add_table(rows=1, cols=col_count)
+        table.style = 'Table Grid'
+        
+        hdr_cells = table.rows[0].cells
+        for i, header_text in enumerate(headers):
+            if i < len(hdr_cells):
+                hdr_cells[i].text = header_text
+                for paragraph in hdr_cells[i].paragraphs:
+                    for run in paragraph.runs:
+                        run.bold = True
+
+        for line in rows[1:]:
+            clean_line = line.strip().strip('|')
+            cells_data = clean_line.split('|')
+            
+            row_cells = table.add_row().cells
+            for i, cell_text in enumerate(cells_data):
+                if i < col_count and i < len(row_cells):
+                    final_text = cell_text.strip().replace('**', '')
+                    row_cells[i].text = final_text
+                    
+    except Exception as e:
+        doc.add_paragraph(f"[表格轉換異常]")
+
+# --- 快速 Word 生成：Markdown 先解析成區塊，再一次產生整份文件的 XML ---
+# 表格整張以 XML 建立 (不逐格呼叫 cell.text)；表格內粗體、<br> 換行與巢狀清單都會保留。
+
+_TABLE_SEP = re.compile(r'^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$')
+_INLINE = re.compile(r'\*\*\*(.+?)\*\*\*|\*\*(.+?)\*\*|(?<![\*\w])\*(?!\s)(.+?)(?<!\s)\*(?![\*\w])|`([^`]+)`|(<br\s*/?>)')
+_BULLET = re.compile(r'^(\s*)[\*\-+]\s+(.*)$')
+_ORDERED = re.compile(r'^(\s*)(\d{1,3}[.)])\s+(.*)$')
+_PLAIN_BULLET = re.compile(r'^(\*\*)?(問題|建議|現狀|分析|依據|結論|優點)')
+_INVALID_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def parse_inline(text):
+    # 回傳 [(文字, 粗體, 斜體)]；文字 "\n" 代表換行
+    runs, pos = [], 0
+    for m in _INLINE.finditer(text):
+        if m.start() > pos: runs.append((text[pos:m.start()], False, False))
+        bold_italic, bold, italic, code, br = m.groups()
+        if bold_italic: runs.append((bold_italic, True, True))
+        elif bold: runs.append((bold, True, False))
+        elif italic: runs.append((italic, False, True))
+        elif code: runs.append((code, False, False))
+        else: runs.append(("\n", False, False))
+        pos = m.end()
+    if pos < len(text): runs.append((text[pos:], False, False))
+    return runs
+
+
+def _split_row(line):
+    line = line.strip()
+    if line.startswith('|'): line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'): line = line[:-1]
+    return [c.strip().replace('\\|', '|') for c in re.split(r'(?<!\\)\|', line)]
+
+
+def _list_depth(indent):
+    return min(len(indent.replace('\t', '    ')) // 2, 2)
+
+
+def parse_markdown_blocks(text):
+    # 區塊：("heading", 層級, runs) / ("bold", runs) / ("para", runs) /
+    #       ("bullet", 深度, runs) / ("numbered", 深度, runs) / ("table", 表頭, [列])
+    blocks, table = [], []
+
+    def flush_table():
+        rows = [_split_row(l) for l in table if not _TABLE_SEP.match(l.strip())]
+        table.clear()
+        if not rows: return
+        header = rows[0]
+        body = [(r + [''] * len(header))[:len(header)] for r in rows[1:]]
+        blocks.append(("table", [parse_inline(c) for c in header], [[parse_inline(c) for c in r] for r in body]))
+
+    for raw in text.split('\n'):
+        line = raw.strip()
+        if not line: continue
+        if line.startswith('|'):
+            table.append(line)
+            continue
+        if table: flush_table()
+
+        if line.startswith('#### '):
+            blocks.append(("bold", parse_inline(line[5:])))
+        elif line.startswith('### '):
+            blocks.append(("heading", 2, parse_inline(line[4:])))
+        elif line.startswith('## '):
+            blocks.append(("heading", 1, parse_inline(line[3:])))
+        elif line.startswith('# '):
+            blocks.append(("heading", 1, parse_inline(line[2:])))
+        elif m := _BULLET.match(raw):
+            content = m.group(2).strip()
+            # 「問題：」「建議：」等說明列維持一般段落 (與舊版相同)
+            if _PLAIN_BULLET.match(content): blocks.append(("para", parse_inline(content)))
+            else: blocks.append(("bullet", _list_depth(m.group(1)), parse_inline(content)))
+        elif m := _ORDERED.match(raw):
+            blocks.append(("numbered", _list_depth(m.group(1)), parse_inline(f"{m.group(2)} {m.group(3).strip()}")))
+        else:
+            blocks.append(("para", parse_inline(line)))
+    if table: flush_table()
+    return blocks
+
+
+def _runs_xml(runs, size=None):
+    out = []
+    for text, bold, italic in runs:
+        if text == "\n":
+            out.append('<w:r><w:br/></w:r>')
+            continue
+        props = ('<w:b/>' if bold else '') + ('<w:i/>' if italic else '') + (f'<w:sz w:val="{size}"/>' if size else '')
+        rpr = f'<w:rPr>{props}</w:rPr>' if props else ''
+        out.append(f'<w:r>{rpr}<w:t xml:space="preserve">{escape(text)}</w:t></w:r>')
+    return ''.join(out)
+
+
+def _para_xml(runs, style=None, indent=None, size=None):
+    ppr = ''
+    if style or indent:
+        ppr = '<w:pPr>' + (f'<w:pStyle w:val="{style}"/>' if style else '') + \
+              (f'<w:ind w:left="{indent}"/>' if indent else '') + '</w:pPr>'
+    return f'<w:p>{ppr}{_runs_xml(runs, size)}</w:p>'
+
+
+def _table_xml(header, rows, style_id, width):
+    cols = len(header)
+    col_w = width // max(cols, 1)
+    cell = lambda runs, bold: (f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{col_w}"/></w:tcPr><w:p>'
+                               f'{_runs_xml([(t, b or bold, i) for t, b, i in runs])}</w:p></w:tc>')
+    out = [f'<w:tbl><w:tblPr><w:tblStyle w:val="{style_id}"/><w:tblW w:type="auto" w:w="0"/>'
+           '<w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" w:firstColumn="1" w:lastColumn="0" '
+           'w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>', f'<w:gridCol w:w="{col_w}"/>' * cols,
+           '</w:tblGrid><w:tr><w:trPr><w:tblHeader/></w:trPr>', ''.join(cell(c, True) for c in header), '</w:tr>']
+    for row in rows:
+        out.append('<w:tr>' + ''.join(cell(c, False) for c in row) + '</w:tr>')
+    out.append('</w:tbl>')
+    return ''.join(out)
+
+
+def blocks_to_xml(blocks, styles, width):
+    parts = []
+    for block in blocks:
+        kind = block[0]
+        if kind == "heading":
+            parts.append(_para_xml(block[2], style=styles[f"Heading {block[1]}"]))
+        elif kind == "bold":
+            parts.append(_para_xml([(t, True, i) for t, _, i in block[1]], size=24))
+        elif kind == "bullet":
+            name = "List Bullet" if block[1] == 0 else f"List Bullet {block[1] + 1}"
+            parts.append(_para_xml(block[2], style=styles[name]))
+        elif kind == "numbered":
+            parts.append(_para_xml(block[2], indent=360 * block[1] or None))
+        elif kind == "table":
+            parts.append(_table_xml(block[1], block[2], styles["Table Grid"], width))
+        else:
+            parts.append(_para_xml(block[1]))
+    return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=1)
+def _report_template():
+    # 已設定字型的空白文件 (只建立一次)；回傳 (docx bytes, 樣式名稱→樣式 ID, 版面寬度 twips)
+    doc = Document()
+    try:
+        doc.styles['Normal'].font.name = 'Microsoft JhengHei'
+        doc.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), 'Microsoft JhengHei')
+    except Exception: pass
+    names = ["Heading 1", "Heading 2", "List Bullet", "List Bullet 2", "List Bullet 3", "Table Grid"]
+    styles = {name: doc.styles[name].style_id for name in names}
+    section = doc.sections[0]
+    width = int((section.page_width - section.left_margin - section.right_margin) / 635)
+    bio = BytesIO()
+    doc.save(bio)
+    return bio.getvalue(), styles, width
+
+
+def render_markdown_fast(doc, text, styles, width, blocks=None):
+    # 報告 XML 以字串接到文件本文最後 (sectPr 之前)，整份重新解析一次；
+    # 比把節點逐一移入既有文件快得多 (跨文件移動節點需逐一處理命名空間)。回傳新的 Document。
+    # blocks：已組好的報告區塊 (結構化審題結果)，不必再解析 Markdown
+    if blocks is None: blocks = parse_markdown_blocks(_INVALID_XML.sub('', text))
+    xml = blocks_to_xml(blocks, styles, width)
+    src = etree.tostring(doc.element, encoding="unicode")
+    cut = src.rfind("<w:sectPr")
+    if cut < 0: cut = src.rindex("</w:body>")
+    doc.part._element = parse_xml(src[:cut] + xml + src[cut:])
+    return doc.part.document
+
+
+def _report_header(doc, exam_meta):
+    heading = doc.add_heading('北屯區建功國小 智慧審題報告', 0)
+    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    p_info = doc.add_paragraph()
+    p_info.add_run(f"試卷資訊：{exam_meta['info_str']}\n").bold = True
+    p_info.add_run(f"審查日期：{exam_meta['date_str']}\n")
+    p_info.add_run(f"AI 模型：{exam_meta.get('model') or 'Gemini 3.0 Pro'}\n")
+    if revision := exam_meta.get('revision'):
+        p_info.add_run(f"試卷版本：第 {revision['version']} 版 (修訂版，重審 {revision['reviewed']} 題、"
+                       f"沿用第 {revision['previous']} 版 {revision['reused']} 題)\n")
+    p_info.add_run("-" * 30)
+
+    table = doc.add_table(rows=1, cols=2)
+    table.autofit = True
+    c1 = table.cell(0, 0)
+    c1.text = "命題教師："
+    c2 = table.cell(0, 1)
+    c2.text = "審題教師："
+
+    doc.add_paragraph("\n")
+
+
+def generate_word_report_doc_legacy(text, exam_meta):
+    doc = Document()
+    try:
+        doc.styles['Normal'].font.name = 'Microsoft JhengHei'
+        doc.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), 'Microsoft JhengHei')
+    except: pass
+    _report_header(doc, exam_meta)
+    parse_markdown_to_word(doc, text)
+    bio = BytesIO()
+    doc.save(bio)
+    return bio
+
+
+def generate_word_report_doc(text, exam_meta, blocks=None):
+    template, styles, width = _report_template()
+    doc = Document(BytesIO(template))
+    _report_header(doc, exam_meta)
+    try:
+        doc = render_markdown_fast(doc, text, styles, width, blocks)
+    except Exception as e:
+        # 快速路徑失敗時改用逐段生成，確保一定產出報告
+        logger.warning("fast Word render failed, falling back: %s", e)
+        return generate_word_report_doc_legacy(text, exam_meta)
+    bio = BytesIO()
+    doc.save(bio)
+    return bio